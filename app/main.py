@@ -1,16 +1,25 @@
+import time
+_T0 = time.perf_counter()  # for --profile-startup
+import sys
 import hashlib
+import threading
 from tkinter import filedialog, messagebox
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 from app.ui.theme import setup_style
-from app.utils.storage import (
-    init_storage, add_user, get_user, add_attendance, query_attendance
-)
-from app.utils.camera import (
-    capture_photo_from_webcam, save_uploaded_photo, scan_qr_with_webcam,
-    ensure_sample_qr_images, show_sample_qr_window
-)
-from app.utils.geo import get_current_location, reverse_geocode, to_plus_code
+
+# pandas, OpenCV, PIL, requests/geocoder and friends are imported on first
+# use (or by the background startup thread), so the start screen draws
+# without waiting for them.
+DEFERRED_MODULES = [
+    "app.utils.storage", "app.utils.geo", "app.utils.camera",
+    "app.utils.punch", "app.utils.export",
+]
+
+
+PAGE_SIZE = 200  # admin table rows materialized at a time
+LIVE_POLL_MS = 3000  # live-tail interval for the admin table
+LIVE_MAX_BACKOFF_MS = 60000  # longest wait between retries after a failed live poll
 
 
 def sha256(s: str) -> str:
@@ -26,10 +35,65 @@ class GuardApp(tb.Window):
         self.geometry("1100x800")
         self.resizable(True, True)
 
-        init_storage()
-        ensure_sample_qr_images()
+        self.punch_status = tb.StringVar(value="")
+        self._punches = None
+        self.camera = None
+        self._init_error = None
+        self._init_thread = threading.Thread(target=self._background_init, daemon=True)
 
         self.show_start()
+        # Storage, sample QR images and the first IP fix are prepared once the
+        # start screen is up; handlers that need them call ensure_ready().
+        self.after(100, self._start_init)
+
+    def _background_init(self):
+        try:
+            from app.utils.storage import init_storage
+            init_storage()
+            from app.utils.geo import current_location
+            current_location.start()  # first IP fix is ready before the first punch
+            from app.utils.camera import ensure_sample_qr_images
+            ensure_sample_qr_images()
+            import app.utils.punch, app.utils.export  # warm the remaining imports
+        except Exception as e:
+            self._init_error = e
+
+    def _start_init(self):
+        if self._init_thread.ident is None:
+            self._init_thread.start()
+
+    def ensure_ready(self):
+        """Wait for background startup (normally long finished by the first click)."""
+        self._start_init()
+        self._init_thread.join()
+        if self._init_error:
+            raise self._init_error
+
+    @property
+    def punches(self):
+        # Location, geocoding and the storage write run off the Tk thread
+        if self._punches is None:
+            self.ensure_ready()
+            from app.utils.punch import PunchPipeline
+            self._punches = PunchPipeline()
+            self._punches.on_done = self.on_punch_saved
+            self._punches.on_error = self.on_punch_failed
+            self._punches.on_change = self.on_punch_pending
+            self._punches.ask_location = self.ask_manual_location
+            self._punches.attach(self)
+        return self._punches
+
+    def shutdown(self):
+        """Release the camera, flush queued punches and compact the journal."""
+        if self.camera is not None:
+            self.camera.close()
+        if self._punches is not None:
+            self._punches.shutdown()
+        if self._init_thread.ident is not None:
+            self._init_thread.join()
+            # Fold the punch journal into the attendance shards on the way out
+            from app.utils.storage import compact_attendance
+            compact_attendance()
 
     def clear(self):
         for w in self.winfo_children():
@@ -141,6 +205,9 @@ class GuardApp(tb.Window):
                 return
 
             try:
+                self.ensure_ready()
+                from app.utils.storage import add_user
+                from app.utils.camera import save_uploaded_photo
                 saved_photo = ""
                 if self.photo_path.get():
                     saved_photo = save_uploaded_photo(user_id, self.photo_path.get())
@@ -185,11 +252,19 @@ class GuardApp(tb.Window):
         def do_login():
             user_id = self.log_user.get().strip()
             password = self.log_pass.get().strip()
+            try:
+                self.ensure_ready()
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+                return
+            from app.utils.storage import get_user
             user = get_user(user_id)  # now robust to Excel numeric formatting
             if not user or str(user.get("password_hash")) != sha256(password):
                 messagebox.showerror("Error", "Invalid credentials")
                 return
             self.current_user = user
+            from app.utils.camera_service import camera_service
+            self.camera = camera_service.start()  # warm up while the dashboard is drawn
             self.show_guard_dashboard()
 
         tb.Button(
@@ -235,12 +310,21 @@ class GuardApp(tb.Window):
             width=30, style="Big.TButton", command=lambda: self.scan_qr("QR_END")
         ).grid(row=0, column=2, padx=12, pady=12)
 
+        tb.Label(frame, textvariable=self.punch_status, style="FieldLabel.TLabel").pack(pady=8)
+
         tb.Button(self, text="View Sample QR Codes", bootstyle=SECONDARY,
                   style="Big.TButton", command=self.open_sample_qr).pack(pady=8)
         tb.Button(self, text="Logout", bootstyle=SECONDARY,
-                  command=self.show_start).pack(pady=4)
+                  command=self.logout).pack(pady=4)
+
+    def logout(self):
+        if self.camera is not None:
+            self.camera.close()
+        self.current_user = None
+        self.show_start()
 
     def open_sample_qr(self):
+        from app.utils.camera import show_sample_qr_window
         show_sample_qr_window(self)
 
     def capture_login_photo(self):
@@ -248,6 +332,7 @@ class GuardApp(tb.Window):
         choice = messagebox.askyesno("Photo", "Use webcam? (Yes = Webcam, No = Upload file)")
         saved_photo = None
         try:
+            from app.utils.camera import capture_photo_from_webcam
             if choice:
                 saved_photo = capture_photo_from_webcam(user_id)
             else:
@@ -256,33 +341,18 @@ class GuardApp(tb.Window):
                 )
                 if not path:
                     return
-                saved_photo = save_uploaded_photo(user_id, path)
+                saved_photo = path  # ingested (re-encoded, deduped) by the punch pipeline
         except Exception as e:
             messagebox.showerror("Error", f"Photo capture failed: {e}")
             return
 
-        lat, lon, source = get_current_location()
-        if source == "manual":
-            from tkinter import simpledialog
-            lat = simpledialog.askstring("Location", "Enter Latitude:") or ""
-            lon = simpledialog.askstring("Location", "Enter Longitude:") or ""
-
-        address, pincode = reverse_geocode(lat, lon)
-        plus_code = to_plus_code(lat, lon)
-
-        add_attendance(
-            user_id=str(user_id),
-            latitude=str(lat), longitude=str(lon),
-            address=str(address), pincode=str(pincode), plus_code=str(plus_code),
-            photo_path=str(saved_photo),
-            action="LOGIN_PHOTO",
-            location_source=str(source)
-        )
-        messagebox.showinfo("Saved", "Login photo + location saved to Excel.")
+        from app.utils.punch import new_punch
+        self.punches.submit(new_punch(user_id, "LOGIN_PHOTO", photo_path=saved_photo))
 
     def scan_qr(self, action):
         user_id = self.current_user["user_id"]
         try:
+            from app.utils.camera import scan_qr_with_webcam
             payload = scan_qr_with_webcam()
         except Exception as e:
             messagebox.showerror("Error", f"QR scan failed: {e}")
@@ -291,36 +361,59 @@ class GuardApp(tb.Window):
             messagebox.showwarning("Cancelled", "QR scan cancelled or not detected.")
             return
 
-        lat, lon, source = get_current_location()
-        if source == "manual":
-            from tkinter import simpledialog
-            lat = simpledialog.askstring("Location", "Enter Latitude:") or ""
-            lon = simpledialog.askstring("Location", "Enter Longitude:") or ""
-
-        address, pincode = reverse_geocode(lat, lon)
-        plus_code = to_plus_code(lat, lon)
-
-        add_attendance(
-            user_id=str(user_id),
-            latitude=str(lat), longitude=str(lon),
-            address=str(address), pincode=str(pincode), plus_code=str(plus_code),
-            photo_path="",
-            action=str(action),
-            location_source=str(source),
-            qr_payload=str(payload)
-        )
-        messagebox.showinfo("Recorded", f"{action.replace('_',' ')} recorded.\nQR: {payload}\n{address or ''}")
+        from app.utils.punch import new_punch
+        self.punches.submit(new_punch(user_id, action, qr_payload=payload))
+
+    # ---------------- Punch pipeline callbacks (Tk thread) ----------------
+    def on_punch_pending(self, n):
+        if n:
+            self.punch_status.set(f"Saving {n} punch(es) in the background...")
+
+    def on_punch_saved(self, punch, record_id):
+        label = punch["action"].replace("_", " ")
+        msg = f"{label} recorded (#{record_id}) at {punch['captured_at']}"
+        if punch.get("address"):
+            msg += f"\n{punch['address']}"
+        if self.punches.pending:
+            msg += f"\n{self.punches.pending} more still saving..."
+        self.punch_status.set(msg)
+
+    def on_punch_failed(self, punch, exc):
+        label = punch["action"].replace("_", " ")
+        self.punch_status.set(f"{label} NOT saved: {exc}")
+        if messagebox.askretrycancel("Error", f"Could not save {label} from {punch['captured_at']}:\n{exc}"):
+            self.punches.submit(punch)
+
+    def ask_manual_location(self, punch):
+        from tkinter import simpledialog
+        lat = simpledialog.askstring("Location", "Enter Latitude:") or ""
+        lon = simpledialog.askstring("Location", "Enter Longitude:") or ""
+        return lat, lon
 
     # ---------------- Admin Dashboard ----------------
     def show_admin(self):
+        try:
+            self.ensure_ready()
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+            return
         self.clear()
         frame = tb.Frame(self, padding=15)
         frame.pack(expand=True, fill=BOTH)
 
         tb.Label(frame, text="Admin Dashboard", style="SectionTitle.TLabel").pack(pady=4)
+        tb.Button(frame, text="Back", bootstyle=SECONDARY, command=self.show_start).pack(side=BOTTOM, pady=8)
+
+        tabs = tb.Notebook(frame)
+        tabs.pack(expand=True, fill=BOTH)
+        attendance = tb.Frame(tabs)
+        shifts = tb.Frame(tabs)
+        tabs.add(attendance, text="Attendance")
+        tabs.add(shifts, text="Shifts")
+        self.build_shifts_tab(shifts)
 
         # Filters
-        filters = tb.Labelframe(frame, text="Filters", padding=10)
+        filters = tb.Labelframe(attendance, text="Filters", padding=10)
         filters.pack(fill=X, padx=5, pady=5)
 
         self.f_user = tb.Entry(filters, width=25)
@@ -339,65 +432,375 @@ class GuardApp(tb.Window):
         tb.Label(filters, text="Action:", style="FieldLabel.TLabel").grid(row=0, column=6, padx=5, pady=5, sticky=E)
         tb.Combobox(filters, textvariable=self.action_var, values=["", "LOGIN_PHOTO", "QR_START", "QR_END"], width=16).grid(row=0, column=7, padx=5, pady=5)
 
+        from app.utils.geofence import STATUSES
+        self.geofence_var = tb.StringVar(value="")
+        tb.Label(filters, text="Geofence:", style="FieldLabel.TLabel").grid(row=0, column=8, padx=5, pady=5, sticky=E)
+        tb.Combobox(filters, textvariable=self.geofence_var, values=[""] + STATUSES, width=12).grid(row=0, column=9, padx=5, pady=5)
+
+        from app.utils.anomalies import KINDS
+        self.anomaly_var = tb.StringVar(value="")
+        tb.Label(filters, text="Anomaly:", style="FieldLabel.TLabel").grid(row=0, column=10, padx=5, pady=5, sticky=E)
+        tb.Combobox(filters, textvariable=self.anomaly_var, values=["", "any"] + KINDS, width=16).grid(row=0, column=11, padx=5, pady=5)
+
         btn_row = tb.Frame(filters)
-        btn_row.grid(row=0, column=8, padx=5, pady=5)
+        btn_row.grid(row=0, column=12, padx=5, pady=5)
         tb.Button(btn_row, text="Apply", bootstyle=PRIMARY, command=self.refresh_table).pack(side=LEFT, padx=3)
         tb.Button(btn_row, text="Reset", bootstyle=SECONDARY, command=self.reset_filters).pack(side=LEFT, padx=3)
         tb.Button(btn_row, text="Export Filtered", bootstyle=SUCCESS, command=self.export_filtered).pack(side=LEFT, padx=3)
+        tb.Button(btn_row, text="Timings", bootstyle=INFO, command=self.show_timings).pack(side=LEFT, padx=3)
+        self.live_var = tb.BooleanVar(value=False)
+        tb.Checkbutton(btn_row, text="Live", variable=self.live_var, bootstyle="round-toggle",
+                       command=self.toggle_live).pack(side=LEFT, padx=8)
 
         # Table
-        table_frame = tb.Frame(frame)
+        table_frame = tb.Frame(attendance)
         table_frame.pack(expand=True, fill=BOTH, padx=5, pady=5)
 
         cols = [
             "record_id","user_id","timestamp",
             "latitude","longitude","address","pincode","plus_code",
-            "photo_path","action","location_source","qr_payload"
+            "photo_path","action","location_source","qr_payload","geofence","face_score","anomaly"
         ]
         self.tree = tb.Treeview(table_frame, columns=cols, show="headings")
         for c in cols:
-            self.tree.heading(c, text=c)
-            self.tree.column(c, width=140 if c in ("address",) else 120, anchor="w")
+            self.tree.heading(c, text=c, command=lambda c=c: self.sort_table(c))
+            self.tree.column(c, width=140 if c in ("address", "anomaly") else 120, anchor="w")
+        scroll = tb.Scrollbar(table_frame, orient=VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side=RIGHT, fill=Y)
         self.tree.pack(expand=True, fill=BOTH)
 
+        # Pager: only PAGE_SIZE rows are ever in the Treeview
+        pager = tb.Frame(attendance)
+        pager.pack(fill=X, padx=5)
+        self.page_info = tb.StringVar(value="")
+        tb.Button(pager, text="< Prev", bootstyle=SECONDARY, command=lambda: self.goto_page(self.page - 1)).pack(side=LEFT, padx=3)
+        tb.Button(pager, text="Next >", bootstyle=SECONDARY, command=lambda: self.goto_page(self.page + 1)).pack(side=LEFT, padx=3)
+        tb.Label(pager, textvariable=self.page_info).pack(side=LEFT, padx=10)
+
+        self.sort_by, self.sort_desc = "timestamp", True  # newest first
         self.refresh_table()
-        tb.Button(frame, text="Back", bootstyle=SECONDARY, command=self.show_start).pack(pady=8)
 
     def reset_filters(self):
         self.f_user.delete(0, "end")
         self.f_from.delete(0, "end")
         self.f_to.delete(0, "end")
         self.action_var.set("")
+        self.geofence_var.set("")
+        self.anomaly_var.set("")
         self.refresh_table()
 
+    def current_filters(self):
+        return dict(
+            user_id=self.f_user.get().strip() or None,
+            date_from=self.f_from.get().strip() or None,
+            date_to=self.f_to.get().strip() or None,
+            action=self.action_var.get() or None,
+            geofence=self.geofence_var.get() or None,
+        )
+
     def refresh_table(self):
-        for r in self.tree.get_children():
-            self.tree.delete(r)
-        user = self.f_user.get().strip() if hasattr(self, 'f_user') else ""
-        date_from = self.f_from.get().strip() if hasattr(self, 'f_from') and self.f_from.get().strip() else None
-        date_to = self.f_to.get().strip() if hasattr(self, 'f_to') and self.f_to.get().strip() else None
-        action = self.action_var.get() if hasattr(self, 'action_var') else None
-        df = query_attendance(user_id=user or None, date_from=date_from, date_to=date_to, action=action or None)
-        for _, row in df.iterrows():
-            self.tree.insert("", "end", values=[row[c] for c in self.tree.cget("columns")])
+        from app.utils.storage import count_attendance, last_record_id
+        self.filters = self.current_filters()
+        self.anomaly = self.anomaly_var.get() or None
+        self.last_seen_id = last_record_id()
+        if self.anomaly:
+            from app.utils.anomalies import anomaly_scan
+            try:
+                anomaly_scan.update()
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not scan for anomalies: {e}")
+                return
+            self.total = anomaly_scan.count(self.anomaly_kind(), **self.filters)
+        else:
+            self.total = count_attendance(**self.filters)
+        self.goto_page(0)
+
+    def anomaly_kind(self):
+        return None if self.anomaly == "any" else self.anomaly
+
+    def query_rows(self, **kwargs):
+        """query_attendance with the current filters, or only flagged punches when Anomaly is set."""
+        if self.anomaly:
+            from app.utils.anomalies import anomaly_scan
+            return anomaly_scan.query(self.anomaly_kind(), **self.filters, **kwargs)
+        from app.utils.storage import query_attendance
+        return query_attendance(**self.filters, **kwargs)
+
+    def table_values(self, df):
+        from app.utils.storage import format_attendance
+        out = format_attendance(df)
+        out["anomaly"] = df["anomaly"].to_numpy() if "anomaly" in df else ""
+        return out[list(self.tree.cget("columns"))].values.tolist()
+
+    def toggle_live(self):
+        job = getattr(self, "_live_job", None)
+        if job:
+            self.after_cancel(job)
+            self._live_job = None
+        self._live_delay = LIVE_POLL_MS
+        if self.live_var.get():
+            self._live_job = self.after(LIVE_POLL_MS, self.poll_live)
+
+    def poll_live(self):
+        """Fetch only rows newer than the last one seen and splice them into the page."""
+        self._live_job = None
+        try:
+            if not (self.tree.winfo_exists() and self.live_var.get()):
+                return
+        except Exception:
+            return  # admin screen was closed
+        try:
+            if self.anomaly:
+                from app.utils.anomalies import anomaly_scan
+                anomaly_scan.update()
+            df = self.query_rows(after_id=self.last_seen_id, sort_by="record_id")
+        except Exception as e:
+            # stay live: say so in the pager line and retry less often until it recovers
+            self._live_delay = min(2 * getattr(self, "_live_delay", LIVE_POLL_MS), LIVE_MAX_BACKOFF_MS)
+            self.page_info.set(f"Live update failed, retrying in {self._live_delay // 1000} s: {e}")
+            self._live_job = self.after(self._live_delay, self.poll_live)
+            return
+        recovered = getattr(self, "_live_delay", LIVE_POLL_MS) > LIVE_POLL_MS
+        self._live_delay = LIVE_POLL_MS
+        self._live_job = self.after(LIVE_POLL_MS, self.poll_live)
+        if len(df):
+            self.last_seen_id = max(self.last_seen_id, int(df["record_id"].max()))
+            self.total += len(df)
+        if len(df) or recovered:
+            self.show_new_rows(df)  # also puts the pager line back after a failure
+
+    def show_new_rows(self, df):
+        pages = max(1, -(-self.total // PAGE_SIZE))
+        order = "desc" if self.sort_desc else "asc"
+        self.page_info.set(f"Page {self.page + 1} of {pages}  ({self.total} rows, sorted by {self.sort_by} {order})")
+        # New punches belong at the top of newest-first page 1 or the end of
+        # the oldest-first last page; any other view just gets the new count.
+        if self.sort_by not in ("timestamp", "record_id"):
+            return
+        values = self.table_values(df)
+        if self.sort_desc and self.page == 0:
+            for v in values:
+                self.tree.insert("", 0, values=v)
+            extra = self.tree.get_children()[PAGE_SIZE:]
+            if extra:
+                self.tree.delete(*extra)
+        elif not self.sort_desc and self.page == pages - 1:
+            room = PAGE_SIZE - len(self.tree.get_children())
+            for v in values[:max(room, 0)]:
+                self.tree.insert("", "end", values=v)
+
+    def sort_table(self, col):
+        if col == "anomaly" and not self.anomaly:
+            return  # only flagged punches have one
+        if self.sort_by == col:
+            self.sort_desc = not self.sort_desc
+        else:
+            self.sort_by, self.sort_desc = col, False
+        self.goto_page(0)
+
+    def goto_page(self, page):
+        pages = max(1, -(-self.total // PAGE_SIZE))
+        self.page = min(max(page, 0), pages - 1)
+        df = self.query_rows(
+            offset=self.page * PAGE_SIZE, limit=PAGE_SIZE,
+            sort_by=self.sort_by, descending=self.sort_desc,
+        )
+        self.tree.delete(*self.tree.get_children())
+        for values in self.table_values(df):
+            self.tree.insert("", "end", values=values)
+        order = "desc" if self.sort_desc else "asc"
+        self.page_info.set(f"Page {self.page + 1} of {pages}  ({self.total} rows, sorted by {self.sort_by} {order})")
 
     def export_filtered(self):
         from tkinter import filedialog
-        user = self.f_user.get().strip() or None
-        date_from = self.f_from.get().strip() or None
-        date_to = self.f_to.get().strip() or None
-        action = self.action_var.get() or None
-        df = query_attendance(user_id=user, date_from=date_from, date_to=date_to, action=action)
-        path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel", "*.xlsx")], title="Export to Excel")
+        path = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel", "*.xlsx"), ("CSV", "*.csv"), ("Parquet", "*.parquet")],
+            title="Export filtered attendance",
+        )
         if not path:
             return
+        from app.utils.export import ExportJob
+        job = ExportJob(path, self.current_filters()).start()
+
+        # Progress window; the export itself streams on a worker thread
+        win = tb.Toplevel(self)
+        win.title("Exporting...")
+        win.geometry("420x150")
+        status = tb.StringVar(value="Starting export...")
+        tb.Label(win, textvariable=status).pack(pady=(16, 8))
+        bar = tb.Progressbar(win, length=360, mode="determinate", bootstyle=SUCCESS)
+        bar.pack(pady=4)
+        tb.Button(win, text="Cancel", bootstyle=SECONDARY, command=job.cancel).pack(pady=8)
+        win.protocol("WM_DELETE_WINDOW", job.cancel)
+
+        def poll():
+            if job.total:
+                bar["value"] = 100 * job.done / job.total
+                status.set(f"{job.done} / {job.total} rows")
+            if not job.finished:
+                self.after(200, poll)
+                return
+            win.destroy()
+            if job.error:
+                messagebox.showerror("Error", str(job.error))
+            elif job.cancelled:
+                messagebox.showwarning("Cancelled", "Export cancelled.")
+            else:
+                messagebox.showinfo("Exported", f"Saved {job.done} rows to\n{path}")
+        poll()
+
+    def build_shifts_tab(self, parent):
+        filters = tb.Labelframe(parent, text="Filters", padding=10)
+        filters.pack(fill=X, padx=5, pady=5)
+
+        self.s_user = tb.Entry(filters, width=25)
+        self.s_from = tb.Entry(filters, width=14)
+        self.s_to = tb.Entry(filters, width=14)
+        tb.Label(filters, text="User ID contains:", style="FieldLabel.TLabel").grid(row=0, column=0, padx=5, pady=5, sticky=E)
+        self.s_user.grid(row=0, column=1, padx=5, pady=5)
+        tb.Label(filters, text="Date from (YYYY-MM-DD):", style="FieldLabel.TLabel").grid(row=0, column=2, padx=5, pady=5, sticky=E)
+        self.s_from.grid(row=0, column=3, padx=5, pady=5)
+        tb.Label(filters, text="Date to (YYYY-MM-DD):", style="FieldLabel.TLabel").grid(row=0, column=4, padx=5, pady=5, sticky=E)
+        self.s_to.grid(row=0, column=5, padx=5, pady=5)
+
+        self.s_view = tb.StringVar(value="Daily hours")
+        tb.Label(filters, text="View:", style="FieldLabel.TLabel").grid(row=0, column=6, padx=5, pady=5, sticky=E)
+        tb.Combobox(filters, textvariable=self.s_view, values=["Daily hours", "Shifts"], width=12,
+                    state="readonly").grid(row=0, column=7, padx=5, pady=5)
+        self.s_flagged = tb.BooleanVar(value=False)
+
+        btn_row = tb.Frame(filters)
+        btn_row.grid(row=0, column=8, padx=5, pady=5)
+        tb.Checkbutton(btn_row, text="Flagged only", variable=self.s_flagged, bootstyle="round-toggle").pack(side=LEFT, padx=8)
+        tb.Button(btn_row, text="Apply", bootstyle=PRIMARY, command=self.refresh_shifts).pack(side=LEFT, padx=3)
+
+        table_frame = tb.Frame(parent)
+        table_frame.pack(expand=True, fill=BOTH, padx=5, pady=5)
+        self.shift_tree = tb.Treeview(table_frame, show="headings")
+        scroll = tb.Scrollbar(table_frame, orient=VERTICAL, command=self.shift_tree.yview)
+        self.shift_tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side=RIGHT, fill=Y)
+        self.shift_tree.pack(expand=True, fill=BOTH)
+        self.shift_info = tb.StringVar(value="")
+        tb.Label(parent, textvariable=self.shift_info).pack(anchor=W, padx=10)
+
+        # Built on first view, then only new punches are folded in
+        parent.bind("<Map>", lambda e: self.refresh_shifts())
+
+    def refresh_shifts(self):
+        """Bring the shift summary up to date with new punches and show it."""
+        from app.utils.shifts import shift_summary
+        from app.utils.storage import TS_FORMAT
         try:
-            df.to_excel(path, index=False)
-            messagebox.showinfo("Exported", f"Saved {len(df)} rows to\n{path}")
+            shift_summary.update()
+            user_id = self.s_user.get().strip() or None
+            date_from = self.s_from.get().strip() or None
+            date_to = self.s_to.get().strip() or None
+            if self.s_view.get() == "Shifts":
+                df = shift_summary.shift_rows(user_id, date_from, date_to, flagged_only=self.s_flagged.get())
+                cols = ["user_id", "start", "end", "hours", "status", "start_id", "end_id"]
+                info = f"{len(df)} shifts, {int((df['status'] != 'closed').sum())} flagged"
+            else:
+                df = shift_summary.daily_hours(user_id, date_from, date_to)
+                if self.s_flagged.get():
+                    df = df[df["flags"] > 0]
+                cols = ["date", "user_id", "hours", "shifts", "flags"]
+                info = f"{len(df)} guard-days, {df['hours'].sum():.1f} hours, {int(df['flags'].sum())} flags"
         except Exception as e:
-            messagebox.showerror("Error", str(e))
+            messagebox.showerror("Error", f"Could not build shift summary: {e}")
+            return
+        out = df[cols].copy()
+        for c in ("start", "end"):
+            if c in out:
+                out[c] = out[c].dt.strftime(TS_FORMAT).fillna("")
+        if "date" in out:
+            out["date"] = out["date"].dt.strftime("%Y-%m-%d")
+        out["hours"] = out["hours"].round(2)
+        out = out.astype(object).where(out.notna(), "")
+
+        tree = self.shift_tree
+        tree.delete(*tree.get_children())
+        tree.configure(columns=cols)
+        for c in cols:
+            tree.heading(c, text=c)
+            tree.column(c, width=160 if c in ("start", "end") else 110, anchor="w")
+        # Same cap as the attendance table; the totals below cover every row
+        for values in out.head(PAGE_SIZE * 5).values.tolist():
+            tree.insert("", "end", values=values)
+        self.shift_info.set(info)
+
+    def show_timings(self):
+        """Per-stage latencies of this session (storage, geo, camera, photo, punch)."""
+        from app.utils import metrics
+        win = tb.Toplevel(self)
+        win.title("Timings")
+        win.geometry("860x420")
+        if not metrics.ENABLED:
+            tb.Label(win, text="Timing is disabled (GUARD_METRICS=0).").pack(pady=20)
+            return
+        cols = ["stage", "count", "errors", "p50_ms", "p95_ms", "max_ms", "cache_hit"]
+        tree = tb.Treeview(win, columns=cols, show="headings")
+        for c in cols:
+            tree.heading(c, text=c)
+            tree.column(c, width=220 if c == "stage" else 90, anchor="w")
+        tree.pack(expand=True, fill=BOTH, padx=10, pady=10)
+
+        def refresh():
+            tree.delete(*tree.get_children())
+            for name, s in metrics.summary().items():
+                hit = "" if s["cache_hit_rate"] is None else f"{s['cache_hit_rate']:.0%}"
+                tree.insert("", "end", values=[name, s["count"], s["errors"], s["p50_ms"],
+                                               s["p95_ms"], s["max_ms"], hit])
+
+        row = tb.Frame(win)
+        row.pack(pady=(0, 10))
+        tb.Button(row, text="Refresh", bootstyle=PRIMARY, command=refresh).pack(side=LEFT, padx=4)
+        tb.Button(row, text="Write to log", bootstyle=SECONDARY, command=metrics.dump).pack(side=LEFT, padx=4)
+        refresh()
+
+
+def profile_startup():
+    """
+    Report time to the first drawn start screen and to the end of the
+    background startup, then the cumulative cost of each heavy import
+    (measured cold, in a fresh interpreter, with -X importtime).
+    """
+    app = GuardApp()
+    app.update()
+    drawn = time.perf_counter() - _T0
+    app.ensure_ready()
+    ready = time.perf_counter() - _T0
+    app.destroy()
+    print(f"start screen drawn   {drawn:7.3f} s")
+    print(f"background init done {ready:7.3f} s")
+
+    import subprocess
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main, " + ", ".join(DEFERRED_MODULES)],
+        capture_output=True, text=True,
+    ).stderr
+    # Lines are "import time: self | cumulative | name", with nested imports
+    # indented two spaces per level and printed before their importer.
+    print("\ncumulative import cost, cold (top two levels, >= 5 ms):")
+    rows = []
+    for line in out.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        us = int(parts[1])
+        if depth <= 1 and us >= 5000:
+            rows.append((depth, us, parts[2].strip()))
+    for depth, us, name in reversed(rows):
+        print(f"  {us / 1e6:7.3f} s  {'  ' * depth}{name}")
 
 
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv[1:]:
+        profile_startup()
+        sys.exit()
     app = GuardApp()
     app.mainloop()
+    app.shutdown()
@@ -0,0 +1,281 @@
+"""
+Headless punch ingestion over HTTP, so thin kiosks and handhelds can post to
+one process that owns the storage.
+
+    python -m app.server [--host 127.0.0.1] [--port 8765] [--verbose]
+
+Endpoints (JSON in and out):
+  GET  /health
+  GET  /users/<user_id>        the user, without password_hash
+  GET  /attendance?user_id=&date_from=&date_to=&action=&geofence=&offset=&limit=&sort_by=&descending=&after_id=
+  POST /punch                  {"user_id", "action", "latitude", "longitude", ...} -> {"record_id"}
+  POST /punches                {"punches": [...]} committed in one write -> {"record_ids"}
+
+Punches posted one at a time by concurrent clients are group-committed:
+whatever arrived while the previous write was running goes out in the next
+single insert. Punches are stored as sent (plus_code is derived from the
+coordinates, and the geofence check runs as for any insert); missing
+addresses are filled in later by app.utils.backfill so geocoder rate limits
+never hold up ingestion. Set GUARD_SERVER_TOKEN to require
+"Authorization: Bearer <token>".
+"""
+import os
+import sys
+import json
+import queue
+import threading
+from datetime import datetime
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+import pandas as pd
+from app.utils.storage import (
+    ATTEND_COLS, TS_FORMAT, init_storage, get_user, attendance_row, insert_attendance,
+    query_attendance, count_attendance, format_attendance
+)
+from app.utils.geo import to_plus_code
+
+DEFAULT_PORT = 8765
+MAX_BATCH = 5000       # punches per POST /punches, and per group commit
+MAX_LIMIT = 5000       # rows per GET /attendance page
+MAX_BODY = 16 * 1024 * 1024
+PUNCH_FIELDS = ["user_id", "action", "latitude", "longitude", "address", "pincode", "plus_code",
+                "photo_path", "location_source", "qr_payload", "timestamp"]
+
+
+class GroupCommit:
+    """Single writer thread; each write takes every punch queued since the last one."""
+
+    def __init__(self, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        threading.Thread(target=self._run, daemon=True, name="group-commit").start()
+
+    def submit(self, row):
+        fut = Future()
+        self._queue.put((row, fut))
+        return fut.result()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                ids = insert_attendance([row for row, _ in items])
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += len(items)
+            for (_, fut), record_id in zip(items, ids):
+                fut.set_result(record_id)
+
+
+class BadRequest(ValueError):
+    status = 400
+
+class NotFound(ValueError):
+    status = 404
+
+class LengthRequired(BadRequest):
+    status = 411
+
+
+def punch_row(data):
+    """Validate a posted punch and turn it into a storage row."""
+    if not isinstance(data, dict):
+        raise BadRequest("A punch must be a JSON object.")
+    fields = {k: data.get(k) for k in PUNCH_FIELDS if data.get(k) not in (None, "")}
+    if not fields.get("user_id") or not fields.get("action"):
+        raise BadRequest("user_id and action are required.")
+    if get_user(fields["user_id"]) is None:
+        raise NotFound(f"Unknown user: {fields['user_id']}")
+    if "timestamp" in fields:
+        try:
+            datetime.strptime(str(fields["timestamp"]), TS_FORMAT)
+        except ValueError:
+            raise BadRequest(f"timestamp must look like {datetime.now().strftime(TS_FORMAT)}")
+    lat, lon = fields.get("latitude"), fields.get("longitude")
+    if lat is not None and lon is not None:
+        try:
+            float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise BadRequest("latitude/longitude must be numbers.")
+        fields.setdefault("plus_code", to_plus_code(lat, lon))
+    fields.setdefault("location_source", "server")
+    return attendance_row(**fields)
+
+
+def _int(params, name, default=None):
+    value = params.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer.")
+
+def _date(params, name):
+    value = params.get(name) or None
+    if value is not None:
+        try:
+            pd.to_datetime(value)
+        except (ValueError, OverflowError):
+            raise BadRequest(f"{name} must be a date like {datetime.now().strftime(TS_FORMAT)}")
+    return value
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for kiosks posting continuously
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    committer = None
+    token = None
+    verbose = False
+
+    def log_message(self, fmt, *args):
+        if self.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status >= 400:
+            # the request body may not have been read; don't reuse the stream
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        raw = self.headers.get("Content-Length")
+        if raw is None:
+            raise LengthRequired("Content-Length is required.")
+        try:
+            length = int(raw)
+        except ValueError:
+            raise BadRequest("Content-Length must be an integer.")
+        if length < 0:
+            raise BadRequest("Content-Length must not be negative.")
+        if length > MAX_BODY:
+            raise BadRequest("Request body too large.")
+        try:
+            return json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            raise BadRequest("Body must be JSON.")
+
+    def _dispatch(self, routes):
+        if self.token and self.headers.get("Authorization") != f"Bearer {self.token}":
+            self._send(401, {"error": "Unauthorized"})
+            return
+        url = urlsplit(self.path)
+        try:
+            for prefix, fn in routes:
+                if url.path == prefix or (prefix.endswith("/") and url.path.startswith(prefix)):
+                    self._send(200, fn(url))
+                    return
+            raise NotFound(f"No such endpoint: {url.path}")
+        except (BadRequest, NotFound) as e:
+            self._send(e.status, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+
+    def do_GET(self):
+        self._dispatch([("/health", self.health), ("/users/", self.user), ("/attendance", self.attendance)])
+
+    def do_POST(self):
+        self._dispatch([("/punch", self.punch), ("/punches", self.punches)])
+
+    # ---- endpoints ----
+    def health(self, url):
+        return {"ok": True, "batches": self.committer.batches, "punches": self.committer.rows}
+
+    def user(self, url):
+        user_id = unquote(url.path[len("/users/"):])
+        user = get_user(user_id)
+        if user is None:
+            raise NotFound(f"Unknown user: {user_id}")
+        user.pop("password_hash", None)
+        return user
+
+    def attendance(self, url):
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        filters = dict(
+            user_id=params.get("user_id") or None,
+            date_from=_date(params, "date_from"),
+            date_to=_date(params, "date_to"),
+            action=params.get("action") or None,
+            geofence=params.get("geofence") or None,
+        )
+        limit = _int(params, "limit", 200)
+        if limit < 1:
+            raise BadRequest("limit must be at least 1.")
+        limit = min(limit, MAX_LIMIT)
+        offset = _int(params, "offset", 0)
+        if offset < 0:
+            raise BadRequest("offset must not be negative.")
+        sort_by = params.get("sort_by") or None
+        if sort_by is not None and sort_by not in ATTEND_COLS:
+            raise BadRequest(f"sort_by must be one of: {', '.join(ATTEND_COLS)}")
+        after_id = _int(params, "after_id")
+        df = query_attendance(
+            **filters, offset=offset, limit=limit,
+            sort_by=sort_by,
+            descending=params.get("descending", "").lower() in ("1", "true", "yes"),
+            after_id=after_id,
+        )
+        total = None if after_id is not None else count_attendance(**filters)
+        return {"total": total, "rows": format_attendance(df).to_dict("records")}
+
+    def punch(self, url):
+        return {"record_id": self.committer.submit(punch_row(self._body()))}
+
+    def punches(self, url):
+        data = self._body()
+        items = data.get("punches") if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            raise BadRequest('Send {"punches": [...]} with at least one punch.')
+        if len(items) > MAX_BATCH:
+            raise BadRequest(f"At most {MAX_BATCH} punches per request.")
+        rows = []
+        for i, item in enumerate(items):
+            try:
+                rows.append(punch_row(item))
+            except (BadRequest, NotFound) as e:
+                raise type(e)(f"punches[{i}]: {e}")
+        return {"record_ids": insert_attendance(rows)}
+
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, token=None, verbose=False):
+    init_storage()
+    Handler.committer = GroupCommit()
+    Handler.token = token
+    Handler.verbose = verbose
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv):
+    host = argv[argv.index("--host") + 1] if "--host" in argv else "127.0.0.1"
+    port = int(argv[argv.index("--port") + 1]) if "--port" in argv else DEFAULT_PORT
+    server = make_server(host, port, os.environ.get("GUARD_SERVER_TOKEN") or None, "--verbose" in argv)
+    print(f"Guard punch service on http://{host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
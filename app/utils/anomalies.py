@@ -0,0 +1,275 @@
+"""
+Anomaly scan over each guard's punch history. Punches are sorted by
+(user_id, timestamp, record_id) and every check compares a punch with the
+guard's previous one in plain NumPy, so a million-row history takes seconds:
+  too_fast          moved faster than MAX_SPEED_KMH since the previous punch
+                    with coordinates (after allowing TRAVEL_SLACK_M of fix error)
+  no_start          QR_END whose previous QR punch is not a QR_START
+  payload_mismatch  QR punch without a payload, or whose payload names the
+                    other action (e.g. "GATE-1 END" scanned for QR_START);
+                    any other punch carrying a START/END payload
+
+IP fixes are only good to a few kilometres, hence the generous slack; tune
+with GUARD_MAX_SPEED_KMH and GUARD_TRAVEL_SLACK_M.
+
+update() only reads punches newer than the last record_id it has seen. The
+state carried between updates is each guard's latest punch with coordinates
+and latest QR punch. A guard whose new punches are older than those (e.g. a
+kiosk syncing late) has just their own history rescanned, as in shifts.py.
+
+The flagged punches are kept as a typed attendance frame with an `anomaly`
+column ("kind: detail; ..."), so the admin table pages through them with
+the same filters as query_attendance.
+They are copies taken when the punch was scanned.
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+from app.utils.storage import (
+    ATTEND_COLS, CATEGORY_COLS, typed_attendance, load_attendance, query_attendance,
+    filter_attendance, sort_attendance,
+)
+from app.utils.geofence import haversine_m
+from app.utils.shifts import START, END
+
+MAX_SPEED_KMH = float(os.environ.get("GUARD_MAX_SPEED_KMH", "120"))
+TRAVEL_SLACK_M = float(os.environ.get("GUARD_TRAVEL_SLACK_M", "2000"))
+
+TOO_FAST, NO_START, PAYLOAD_MISMATCH = "too_fast", "no_start", "payload_mismatch"
+KINDS = [TOO_FAST, NO_START, PAYLOAD_MISMATCH]
+FLAG_COLS = ["record_id", "user_id", "timestamp", "kind", "detail", "prev_id"]
+SCAN_COLS = ["record_id", "user_id", "timestamp", "latitude", "longitude", "action", "qr_payload"]
+
+_WORD = r"(?<![A-Z]){}(?![A-Z])"  # START/END as a word of the payload ("QR_START", "GATE-1 END")
+
+
+def _empty_flags():
+    return pd.DataFrame({
+        "record_id": pd.Series(dtype="int64"), "user_id": pd.Series(dtype=object),
+        "timestamp": pd.Series(dtype="datetime64[ns]"), "kind": pd.Series(dtype=object),
+        "detail": pd.Series(dtype=object), "prev_id": pd.Series(dtype="Int64"),
+    })
+
+def _scan_frame(df):
+    """SCAN_COLS of a typed attendance frame, missing text as ""; user_id stays categorical."""
+    df = df[df["timestamp"].notna() & df["record_id"].notna() & df["user_id"].notna()]
+    text = lambda c: df[c].astype(object).where(df[c].notna(), "").to_numpy()
+    return pd.DataFrame({
+        "record_id": df["record_id"].to_numpy(dtype="int64"),
+        "user_id": df["user_id"].astype("category").to_numpy(),
+        "timestamp": df["timestamp"].to_numpy(dtype="datetime64[ns]"),
+        "latitude": df["latitude"].to_numpy(dtype="float64", na_value=np.nan),
+        "longitude": df["longitude"].to_numpy(dtype="float64", na_value=np.nan),
+        "action": text("action"),
+        "qr_payload": text("qr_payload"),
+    })
+
+def payload_direction(payloads):
+    """
+    (codes, uniques, direction): the payloads factorised, and per distinct
+    payload 0 (names neither), 1 (START), 2 (END) or 3 (both).
+    """
+    codes, uniques = pd.factorize(pd.Series(payloads, dtype=object).fillna("").astype(str), sort=False)
+    upper = pd.Series(uniques, dtype=object).str.upper()
+    has = lambda word: upper.str.contains(_WORD.format(word), regex=True).to_numpy(dtype=bool)
+    return codes, np.asarray(uniques, dtype=object), has("START") * 1 + has("END") * 2
+
+
+def detect(rows, carried=None):
+    """
+    Flags (FLAG_COLS) for a _scan_frame(), plus the guards' new tail rows.
+    `carried` rows (a previous tail) give each guard's history before `rows`;
+    they are compared against but never flagged themselves.
+    """
+    n_new = len(rows)
+    ev = pd.concat([rows, carried], ignore_index=True) if carried is not None and len(carried) else rows
+    if ev.empty:
+        return _empty_flags(), _tail_rows(ev, np.zeros(0, dtype="int64"))
+    codes, users = pd.factorize(ev["user_id"], sort=False)
+    rid = ev["record_id"].to_numpy(dtype="int64")
+    ts = ev["timestamp"].to_numpy(dtype="datetime64[ns]")
+    order = np.lexsort((rid, ts.view("int64"), codes))
+    codes, rid, ts = codes[order], rid[order], ts[order]
+    lat = ev["latitude"].to_numpy(dtype="float64")[order]
+    lon = ev["longitude"].to_numpy(dtype="float64")[order]
+    act_codes, act_names = pd.factorize(ev["action"], sort=False)
+    act_codes = act_codes[order]
+    act_names = np.asarray(act_names, dtype=object)
+    # 1 for QR_START, 2 for QR_END, 0 otherwise (same coding as payload_direction)
+    want = ((act_names == START) * 1 + (act_names == END) * 2)[act_codes]
+    pay_codes, payloads, pay_dir = payload_direction(ev["qr_payload"])
+    pay_codes = pay_codes[order]
+    fresh = order < n_new
+    has_fix = np.isfinite(lat) & np.isfinite(lon)
+    is_qr = want > 0
+    found = []
+
+    # too_fast: consecutive punches with a fix, same guard
+    f = np.flatnonzero(has_fix)
+    a, b = f[:-1], f[1:]
+    same = codes[a] == codes[b]
+    a, b = a[same], b[same]
+    dist = haversine_m(lat[a], lon[a], lat[b], lon[b])
+    hours = (ts[b] - ts[a]) / np.timedelta64(1, "h")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kmh = np.maximum(dist - TRAVEL_SLACK_M, 0) / 1000 / hours
+    hit = fresh[b] & (dist > TRAVEL_SLACK_M) & (kmh > MAX_SPEED_KMH)
+    a, b = a[hit], b[hit]
+    found.append(pd.DataFrame({
+        "pos": b, "kind": TOO_FAST, "prev": rid[a],
+        "detail": [f"{d / 1000:.1f} km in {m:.0f} min from #{p}"
+                   for d, m, p in zip(dist[hit], hours[hit] * 60, rid[a])],
+    }))
+
+    # no_start: QR_END not preceded by QR_START among the guard's QR punches
+    q = np.flatnonzero(is_qr)
+    is_start = want[q] == 1
+    has_prev = np.zeros(len(q), dtype=bool)
+    has_prev[1:] = codes[q][1:] == codes[q][:-1]
+    prev_start = np.zeros(len(q), dtype=bool)
+    prev_start[1:] = is_start[:-1] & has_prev[1:]
+    prev_rid = np.full(len(q), -1, dtype="int64")
+    prev_rid[1:] = rid[q][:-1]
+    hit = ~is_start & ~prev_start & fresh[q]
+    found.append(pd.DataFrame({
+        "pos": q[hit], "kind": NO_START, "prev": np.where(has_prev[hit], prev_rid[hit], -1),
+        "detail": np.where(has_prev[hit], "previous QR punch is also QR_END", "no earlier QR_START"),
+    }))
+
+    # payload_mismatch: the direction named by the payload vs the action
+    got = pay_dir[pay_codes]
+    empty = (payloads == "")[pay_codes]
+    bad = np.where(is_qr, empty | ((got > 0) & (got != want)), got > 0)
+    p = np.flatnonzero(bad & fresh)
+    found.append(pd.DataFrame({
+        "pos": p, "kind": PAYLOAD_MISMATCH, "prev": -1,
+        "detail": ["no QR payload" if not payloads[c] else f"payload {payloads[c]!r} on {act_names[a] or 'punch'}"
+                   for c, a in zip(pay_codes[p], act_codes[p])],
+    }))
+
+    hits = pd.concat(found, ignore_index=True)
+    pos = hits["pos"].to_numpy(dtype="int64")
+    flags = pd.DataFrame({
+        "record_id": rid[pos],
+        "user_id": np.asarray(users, dtype=object)[codes[pos]],
+        "timestamp": ts[pos],
+        "kind": hits["kind"].to_numpy(dtype=object),
+        "detail": hits["detail"].to_numpy(dtype=object),
+        "prev_id": pd.array(hits["prev"].to_numpy(dtype="int64"), dtype="Int64"),
+    })
+    flags["prev_id"] = flags["prev_id"].mask(flags["prev_id"] < 0)
+    flags = flags.sort_values(["timestamp", "record_id"], kind="mergesort", ignore_index=True)
+
+    # tail: each guard's last punch with a fix and last QR punch
+    keep = np.zeros(len(ev), dtype=bool)
+    for sel in (np.flatnonzero(has_fix), q):
+        last = np.ones(len(sel), dtype=bool)
+        last[:-1] = codes[sel][1:] != codes[sel][:-1]
+        keep[sel[last]] = True
+    return flags, _tail_rows(ev, order[keep])
+
+def _tail_rows(ev, positions):
+    tail = ev.iloc[np.sort(positions)].reset_index(drop=True)
+    return tail.assign(user_id=tail["user_id"].astype(str).to_numpy(dtype=object))
+
+
+def _concat(first, second):
+    # concat that keeps the dtypes of `second` when `first` is empty
+    return pd.concat([first, second]) if len(first) and len(second) else second if len(second) else first
+
+
+class AnomalyScan:
+    """Materialised anomaly flags, brought up to date by update()."""
+
+    def __init__(self):
+        self.flags = _empty_flags()
+        self.tail = _tail_rows(_scan_frame(typed_attendance(pd.DataFrame(columns=ATTEND_COLS))), [])
+        self.rows = typed_attendance(pd.DataFrame(columns=ATTEND_COLS)).assign(anomaly="")
+        self.last_id = 0
+        self.built = False
+        self._lock = threading.Lock()
+
+    def _replace(self, df, rescan=None, carried=None):
+        """
+        Fold in a scan of the typed frame `df`. Guards in `rescan` (everyone
+        when None) lose their earlier flags first; otherwise `carried` holds
+        the tail rows of the guards in `df`.
+        """
+        flags, tail = detect(_scan_frame(df), carried)
+        old_flags, old_tail, old_rows = self.flags, self.tail, self.rows.drop(columns="anomaly")
+        if rescan is None:
+            old_flags, old_tail, old_rows = old_flags[:0], old_tail[:0], old_rows[:0]
+        else:
+            old_flags = old_flags[~old_flags["user_id"].isin(rescan)]
+            old_rows = old_rows[~old_rows["user_id"].astype(str).isin(rescan)]
+        old_tail = old_tail[~old_tail["user_id"].isin(set(rescan or ()) | set(tail["user_id"]))]
+        self.flags = _concat(old_flags, flags).reset_index(drop=True)
+        self.tail = _concat(old_tail, tail).reset_index(drop=True)
+
+        ids = df["record_id"].to_numpy(dtype="int64", na_value=-1)
+        rows = _concat(old_rows, df[np.isin(ids, flags["record_id"].to_numpy())])
+        rows = rows.astype({c: object for c in CATEGORY_COLS}).astype({c: "category" for c in CATEGORY_COLS})
+        rows = rows.sort_values(["timestamp", "record_id"], kind="mergesort", na_position="last")
+        label = (self.flags["kind"] + ": " + self.flags["detail"]).groupby(self.flags["record_id"]).agg("; ".join)
+        self.rows = rows.assign(anomaly=rows["record_id"].astype("int64").map(label).fillna("").to_numpy())
+
+    def rebuild(self):
+        with self._lock:
+            df = load_attendance()
+            top = df["record_id"].max()
+            self.last_id = 0 if pd.isna(top) else int(top)
+            self._replace(df)
+            self.built = True
+
+    def update(self):
+        """Scan punches newer than the last one seen; returns how many were read."""
+        if not self.built:
+            self.rebuild()
+            return len(self.flags)
+        with self._lock:
+            new = query_attendance(after_id=self.last_id, sort_by="record_id")
+            if new.empty:
+                return 0
+            self.last_id = max(self.last_id, int(new["record_id"].max()))
+
+            scan = _scan_frame(new)
+            first = scan["timestamp"].groupby(scan["user_id"].astype(str).to_numpy()).min()
+            known = self.tail.groupby("user_id")["timestamp"].max().reindex(first.index)
+            late = first.index[(first < known).to_numpy()]
+            if len(late):
+                # punches arrived out of order for these guards: rescan just them
+                full = load_attendance()
+                self._replace(full[full["user_id"].astype(str).isin(late)], rescan=list(late))
+                new = new[~new["user_id"].astype(str).isin(late)]
+
+            if len(new):
+                users = new["user_id"].astype(str).unique()
+                self._replace(new, rescan=[], carried=self.tail[self.tail["user_id"].isin(users)])
+            return len(scan)
+
+    # ---- views ----
+    def _view(self, kind, user_id, date_from, date_to, action, geofence, after_id=None):
+        df = filter_attendance(self.rows, user_id, date_from, date_to, action, geofence)
+        if kind in KINDS:
+            df = df[df["anomaly"].str.contains(kind, regex=False)]
+        if after_id is not None:
+            df = df[df["record_id"] > int(after_id)]
+        return df
+
+    def query(self, kind=None, user_id=None, date_from=None, date_to=None, action=None,
+              offset=0, limit=None, sort_by=None, descending=False, after_id=None, geofence=None):
+        """query_attendance over the flagged punches only; `kind` narrows to one of KINDS."""
+        df = self._view(kind, user_id, date_from, date_to, action, geofence, after_id)
+        if sort_by == "anomaly":
+            df = (df.iloc[::-1] if descending else df).sort_values("anomaly", ascending=not descending, kind="mergesort")
+        else:
+            df = sort_attendance(df, sort_by, descending)
+        end = None if limit is None else offset + limit
+        return df.iloc[offset:end]
+
+    def count(self, kind=None, user_id=None, date_from=None, date_to=None, action=None, geofence=None):
+        return len(self._view(kind, user_id, date_from, date_to, action, geofence))
+
+
+anomaly_scan = AnomalyScan()
@@ -0,0 +1,74 @@
+"""
+Fill in address/pincode for punches that were saved with coordinates but no
+address (geocoder down, rate limited, offline kiosk). Rows are grouped by
+location cell so each post is looked up once; lookups share a keep-alive
+session and the provider rate limits, and all rows are updated in one write.
+
+    python -m app.utils.backfill [--limit N]
+"""
+import sys
+from app.utils.storage import init_storage, load_attendance, update_attendance
+from app.utils.geo import reverse_geocode, to_plus_code, geocode_cache
+
+
+def missing_addresses(df):
+    """Rows with coordinates but no address."""
+    has_coords = df["latitude"].notna() & df["longitude"].notna()
+    return df[has_coords & df["address"].isna()]
+
+
+def backfill_addresses(limit=None, progress=None):
+    """
+    Resolve up to `limit` distinct locations and update their rows.
+    Returns (locations_resolved, locations_tried, rows_updated).
+    """
+    todo = missing_addresses(load_attendance())
+    if todo.empty:
+        return 0, 0, 0
+
+    # Deduplicate: identical coordinates first, then by geocode cache cell
+    coords = todo[["latitude", "longitude"]].drop_duplicates()
+    cells = {}
+    for lat, lon in coords.itertuples(index=False):
+        cell = geocode_cache.key(float(lat), float(lon))
+        if cell:
+            cells.setdefault(cell, (float(lat), float(lon)))
+    cell_items = list(cells.items())
+    if limit:
+        cell_items = cell_items[:limit]
+
+    resolved = {}
+    for i, (cell, (lat, lon)) in enumerate(cell_items, 1):
+        address, pincode = reverse_geocode(lat, lon)
+        if address:
+            resolved[cell] = (address, pincode or "")
+        if progress:
+            progress(i, len(cell_items))
+
+    updates = {}
+    for rec in todo.itertuples(index=False):
+        lat, lon = float(rec.latitude), float(rec.longitude)
+        hit = resolved.get(geocode_cache.key(lat, lon))
+        if not hit:
+            continue
+        fields = {"address": hit[0], "pincode": hit[1]}
+        if not isinstance(rec.plus_code, str) or not rec.plus_code:
+            fields["plus_code"] = to_plus_code(lat, lon)
+        updates[int(rec.record_id)] = fields
+    update_attendance(updates)
+    return len(resolved), len(cell_items), len(updates)
+
+
+def main(argv):
+    limit = None
+    if "--limit" in argv:
+        limit = int(argv[argv.index("--limit") + 1])
+    init_storage()
+    done, tried, rows = backfill_addresses(
+        limit=limit, progress=lambda i, n: print(f"\r{i}/{n} locations", end="", flush=True)
+    )
+    print(f"\nResolved {done}/{tried} locations, updated {rows} rows.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,70 +1,82 @@
 import os
 import time
-import shutil
 import cv2
 from PIL import Image, ImageTk
 import qrcode
 from tkinter import Toplevel, Label
-from app.utils.storage import PHOTO_DIR, QR_DIR
+from app.utils.storage import QR_DIR
+from app.utils.photos import INCOMING_DIR, ingest_photo
+from app.utils.qrscan import ScanWorker
+from app.utils.camera_service import camera_service
+from app.utils.metrics import timed, note
 
 def _timestamp():
     return time.strftime("%Y%m%d_%H%M%S")
 
+@timed("camera.photo")
 def capture_photo_from_webcam(user_id):
-    cam = cv2.VideoCapture(0)
-    if not cam.isOpened():
-        raise RuntimeError("Webcam not available.")
+    # The camera stays warm between punches; this loop only previews the newest frame
+    cam = camera_service.ensure()
     cv2.namedWindow("Press SPACE to capture, ESC to cancel")
     img_path = None
-    while True:
-        ret, frame = cam.read()
-        if not ret:
-            continue
-        cv2.imshow("Press SPACE to capture, ESC to cancel", frame)
-        k = cv2.waitKey(1) & 0xFF
-        if k == 27:  # ESC
-            break
-        if k == 32:  # SPACE
-            filename = f"{user_id}_{_timestamp()}.jpg"
-            img_path = os.path.join(PHOTO_DIR, filename)
-            cv2.imwrite(img_path, frame)
-            break
-    cam.release()
-    cv2.destroyAllWindows()
+    shown = None
+    seq = 0
+    try:
+        while True:
+            seq, frame = cam.wait(seq, timeout=0.5)
+            if frame is not None:
+                shown = frame
+                cv2.imshow("Press SPACE to capture, ESC to cancel", frame)
+            k = cv2.waitKey(15) & 0xFF
+            if k == 27:  # ESC
+                break
+            if k == 32 and shown is not None:  # SPACE
+                # staged at full quality; the punch pipeline ingests it
+                os.makedirs(INCOMING_DIR, exist_ok=True)
+                filename = f"{user_id}_{_timestamp()}.jpg"
+                img_path = os.path.join(INCOMING_DIR, filename)
+                cv2.imwrite(img_path, shown)
+                break
+    finally:
+        cv2.destroyAllWindows()
     if not img_path:
+        note(outcome="cancelled")
         raise RuntimeError("Capture cancelled.")
     return img_path
 
 def save_uploaded_photo(user_id, src_path):
-    filename = f"{user_id}_{_timestamp()}_{os.path.basename(src_path)}"
-    dst = os.path.join(PHOTO_DIR, filename)
-    shutil.copy2(src_path, dst)
-    return dst
+    return ingest_photo(src_path)
 
+@timed("camera.qr_scan")
 def scan_qr_with_webcam():
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        raise RuntimeError("Webcam not available.")
-    detector = cv2.QRCodeDetector()
+    cam = camera_service.ensure()
+    # Grabbing and scanning run on their own threads; this loop only previews
+    worker = ScanWorker(cam).start()
     cv2.namedWindow("Scan QR (Press ESC to cancel)")
     payload = None
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            continue
-        data, points, _ = detector.detectAndDecode(frame)
-        if points is not None and data:
-            payload = data
-            cv2.polylines(frame, [points.astype(int)], True, (0, 255, 0), 2)
-            cv2.putText(frame, "QR detected!", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            cv2.imshow("Scan QR (Press ESC to cancel)", frame)
-            cv2.waitKey(800)
-            break
-        cv2.imshow("Scan QR (Press ESC to cancel)", frame)
-        if cv2.waitKey(1) & 0xFF == 27:
-            break
-    cap.release()
-    cv2.destroyAllWindows()
+    seq = 0
+    try:
+        while True:
+            seq, frame = cam.wait(seq, timeout=0.5)
+            if frame is not None:
+                frame = frame.copy()
+                pts = worker.points
+                if pts is not None:
+                    cv2.polylines(frame, [pts.astype(int).reshape(-1, 1, 2)], True, (0, 255, 0), 2)
+                if worker.payload:
+                    payload = worker.payload
+                    cv2.putText(frame, "QR detected!", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                    cv2.imshow("Scan QR (Press ESC to cancel)", frame)
+                    cv2.waitKey(800)
+                    break
+                cv2.imshow("Scan QR (Press ESC to cancel)", frame)
+            if cv2.waitKey(15) & 0xFF == 27:
+                break
+    finally:
+        worker.stop()
+        cv2.destroyAllWindows()
+    if not payload:
+        note(outcome="cancelled")
     return payload
 
 def ensure_sample_qr_images():
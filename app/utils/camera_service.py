@@ -0,0 +1,152 @@
+"""
+A long-lived, warm webcam shared by the selfie and QR flows.
+
+Opening the device and waiting for auto-exposure costs seconds, so the
+camera is opened once when a guard logs in and read continuously on a
+background thread into a small ring buffer. Consumers take the newest frame
+from the buffer. The device is closed on logout or after IDLE_TIMEOUT
+seconds without a consumer, and reopened with backoff if reads keep failing.
+"""
+import time
+import threading
+from collections import deque
+import cv2
+from app.utils.metrics import timed, note
+
+RING_SIZE = 8
+IDLE_TIMEOUT = 120      # s without a consumer before the device is released
+OPEN_TIMEOUT = 8        # s a consumer waits for the device to come up
+REOPEN_AFTER = 10       # consecutive failed reads before reconnecting
+
+
+class CameraService:
+    """Owns the webcam; frames are read on a thread into a ring buffer."""
+
+    def __init__(self, index=0, ring_size=RING_SIZE, idle_timeout=IDLE_TIMEOUT):
+        self.index = index
+        self.idle_timeout = idle_timeout
+        self.ring = deque(maxlen=ring_size)  # (seq, captured_at, frame)
+        self.seq = 0
+        self.error = None
+        self.opened = threading.Event()
+        self.fps = 0.0
+        self.read_ms = 0.0
+        self.reconnects = 0
+        self.failed_reads = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._last_used = time.monotonic()
+
+    # ---- lifecycle ----
+    def start(self):
+        """Open the device in the background (e.g. at login) and keep it streaming."""
+        self.touch()
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._running = True
+            self.error = None
+            self.opened.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="camera")
+            self._thread.start()
+        return self
+
+    @timed("camera.ensure")
+    def ensure(self, timeout=OPEN_TIMEOUT):
+        """Start if needed and wait for the first frame; raises if the webcam can't be opened."""
+        note(cache=self.opened.is_set())  # already warm
+        self.start()
+        if not self.opened.wait(timeout):
+            raise RuntimeError(self.error or "Webcam not available.")
+        return self
+
+    def close(self):
+        """Stop streaming and release the device (e.g. at logout)."""
+        self._running = False
+        t = self._thread
+        if t is not None and t is not threading.current_thread():
+            t.join(timeout=2)
+
+    def touch(self):
+        self._last_used = time.monotonic()
+
+    # ---- frames ----
+    def wait(self, after_seq, timeout=1.0):
+        """Newest (seq, frame) with seq > after_seq, or (current seq, None) on timeout."""
+        self.touch()
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > after_seq, timeout)
+            if self.seq > after_seq and self.ring:
+                return self.seq, self.ring[-1][2]
+            return self.seq, None
+
+    def latest(self):
+        with self._cond:
+            return self.ring[-1] if self.ring else None
+
+    def stats(self):
+        return {
+            "open": self.opened.is_set(), "frames": self.seq, "fps": round(self.fps, 1),
+            "read_ms": round(self.read_ms, 1), "reconnects": self.reconnects,
+            "failed_reads": self.failed_reads,
+        }
+
+    # ---- capture thread ----
+    def _open(self):
+        cap = cv2.VideoCapture(self.index)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        return cap
+
+    def _run(self):
+        cap = None
+        failures = 0
+        last_frame_at = None
+        try:
+            while self._running:
+                if time.monotonic() - self._last_used > self.idle_timeout:
+                    break
+                if cap is None:
+                    cap = self._open()
+                    if cap is None:
+                        self.error = "Webcam not available."
+                        failures += 1
+                        time.sleep(min(2.0, 0.1 * 2 ** min(failures, 5)))
+                        continue
+                t0 = time.perf_counter()
+                ok, frame = cap.read()
+                dt = time.perf_counter() - t0
+                if not ok:
+                    # back off instead of spinning, reconnect if it persists
+                    failures += 1
+                    self.failed_reads += 1
+                    if failures >= REOPEN_AFTER:
+                        cap.release()
+                        cap = None
+                        self.reconnects += 1
+                    time.sleep(min(0.5, 0.01 * 2 ** min(failures, 6)))
+                    continue
+                failures = 0
+                now = time.monotonic()
+                self.read_ms = 0.9 * self.read_ms + 0.1 * dt * 1000 if self.seq else dt * 1000
+                if last_frame_at is not None and now > last_frame_at:
+                    inst = 1.0 / (now - last_frame_at)
+                    self.fps = 0.9 * self.fps + 0.1 * inst if self.fps else inst
+                last_frame_at = now
+                with self._cond:
+                    self.seq += 1
+                    self.ring.append((self.seq, now, frame))
+                    self._cond.notify_all()
+                self.opened.set()
+        finally:
+            if cap is not None:
+                cap.release()
+            self.opened.clear()
+            with self._cond:
+                self.ring.clear()
+                self._running = False
+
+
+camera_service = CameraService(0)
@@ -0,0 +1,540 @@
+import os
+import json
+import threading
+import pandas as pd
+from app.utils.storage import (
+    StorageBackend, USERS_XLSX, ATTEND_XLSX, ATTEND_JOURNAL, ATTEND_COMPACTING,
+    ATTEND_DIR, ATTEND_MANIFEST, COMPACT_JOURNAL_BYTES, RECORD_SEQ, USER_COLS,
+    ATTEND_COLS, CATEGORY_COLS, _as_str, _clean, filter_attendance, sort_attendance,
+    typed_attendance, text_attendance
+)
+from app.utils.metrics import note
+from app.utils.filelock import FileLock, replace
+from app.utils.partitions import (
+    ARCHIVE_KEEP, read_manifest, write_manifest, read_shard, write_shard, shard_path,
+    describe, split, prune, disjoint, shard_for_ids, archive_candidates, archive_file
+)
+
+
+class UserDirectory:
+    """
+    users.xlsx held in memory as a casefold-keyed dict. The workbook is parsed
+    again only when its mtime/size changes (e.g. edited by hand), and add()
+    updates the dict in place after writing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._rows = []
+        self._index = {}
+        self._stat = None
+        self._lock = threading.Lock()
+        self._write_lock = FileLock(path + ".lock")  # other kiosks add users too
+
+    def _file_stat(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        stat = self._file_stat()
+        note(cache=stat == self._stat)
+        if stat == self._stat:
+            return
+        df = pd.read_excel(self.path, dtype=str)
+        rows = []
+        index = {}
+        for rec in df.to_dict("records"):
+            row = {c: _clean(rec.get(c)) for c in USER_COLS}
+            rows.append(row)
+            # first match wins, as the old row scan did
+            index.setdefault(row["user_id"].casefold(), row)
+        self._rows, self._index, self._stat = rows, index, stat
+
+    def get(self, user_id):
+        key = _as_str(user_id).strip().casefold()
+        with self._lock:
+            self._refresh()
+            row = self._index.get(key)
+        return None if row is None else dict(row)
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return [dict(r) for r in self._rows]
+
+    def add(self, row):
+        key = row["user_id"].casefold()
+        with self._write_lock, self._lock:
+            self._refresh()
+            # Case-insensitive match to avoid duplicates like "USER" vs "user"
+            if key in self._index:
+                raise ValueError("User already exists.")
+            df = pd.DataFrame(self._rows + [row], columns=USER_COLS)
+            tmp = self.path + ".tmp.xlsx"
+            df.to_excel(tmp, index=False)
+            replace(tmp, self.path)
+            self._rows.append(row)
+            self._index[key] = row
+            self._stat = self._file_stat()
+
+
+def _append_journal(rows):
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+    with _journal_lock:
+        with open(ATTEND_JOURNAL, "a", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+def _read_journal(path):
+    """Journal rows as a list of dicts. A torn last line (crash mid-append) is skipped."""
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+    return rows
+
+# Cross-process: appends and the rotation in compaction exclude each other
+# (an append into an already rotated journal would be lost), and only one
+# process compacts or archives at a time. Lock order: compact, then journal.
+_journal_lock = FileLock(ATTEND_JOURNAL + ".lock")
+_compact_lock = FileLock(ATTEND_MANIFEST + ".lock")
+_cache_lock = threading.Lock()
+_shard_cache = {}  # shard path -> (file key, typed frame)
+_tail_cache = {"key": None, "df": None}
+_typed_cache = {}  # (shard file keys, journal keys) -> combined frame, for recent queries
+TYPED_CACHE_SIZE = 4
+_text_cache = {}  # shard path -> (file key, string frame), the last few read by an export
+TEXT_CACHE_SIZE = 2
+VIEW_CACHE_SIZE = 4  # admin refresh = count (filter only) + page (filter + sort), so at least 2
+
+def _file_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _string_frame(rows):
+    # fillna: rows journaled before a column existed lack its key
+    tail = pd.DataFrame(rows, columns=ATTEND_COLS).fillna("").astype(str)
+    # Empty cells come back as NaN from read_excel; keep journal rows identical
+    return tail.mask(tail == "")
+
+def _merge(snapshot, tail):
+    """String-level merge used by compaction, so the shards keep the exact text punched."""
+    if tail is None or tail.empty:
+        return snapshot.copy()
+    df = pd.concat([snapshot, tail], ignore_index=True)
+    # A crash between writing a shard and dropping the rotated journal
+    # leaves rows in both places; the journal copy wins.
+    return df.drop_duplicates(subset="record_id", keep="last").reset_index(drop=True)
+
+_EMPTY = typed_attendance(pd.DataFrame(columns=ATTEND_COLS))
+
+def _shard_frame(entry):
+    """One shard as a typed frame, re-read only when its file changes."""
+    path = shard_path(entry)
+    key = _file_key(path)
+    hit = _shard_cache.get(path)
+    if hit is None or hit[0] != key:
+        hit = (key, typed_attendance(read_shard(path)) if key else _EMPTY)
+        _shard_cache[path] = hit
+    return hit[1]
+
+def _tail():
+    """
+    Journal rows not yet compacted, typed (None when there are none).
+    The journal is read before the rotated file, and both before any shard:
+    a compaction running concurrently can then only make rows appear twice
+    (deduped), never vanish.
+    """
+    key = (_file_key(ATTEND_JOURNAL), _file_key(ATTEND_COMPACTING))
+    if _tail_cache["key"] != key:
+        tail = _read_journal(ATTEND_JOURNAL)
+        rows = _read_journal(ATTEND_COMPACTING) + tail
+        df = typed_attendance(pd.DataFrame(rows, columns=ATTEND_COLS)) if rows else None
+        if df is not None:
+            # rotated between the two reads: the same rows come from both files
+            df = df[~df["record_id"].duplicated(keep="last")]
+        _tail_cache["df"] = df
+        _tail_cache["key"] = key
+    return _tail_cache["df"]
+
+def _combine(frames, ordered):
+    """Concatenate typed frames (later ones win on record_id); sort unless already `ordered`."""
+    frames = [f for f in frames if f is not None and len(f)]
+    if not frames:
+        return _EMPTY
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames)
+    for c in CATEGORY_COLS:
+        # concat of categoricals with different categories falls back to object
+        df[c] = df[c].astype("category")
+    df = df[~df["record_id"].duplicated(keep="last")]
+    if not ordered:
+        df = df.sort_values(["timestamp", "record_id"], kind="mergesort", na_position="last")
+    return df
+
+def _pruned(date_from=None, date_to=None, user_id=None, after_id=None):
+    tail = _tail()
+    manifest = read_manifest()
+    names = prune(manifest, date_from, date_to, user_id, after_id)
+    live = {shard_path(e) for e in manifest["shards"].values()}
+    for path in [p for p in _shard_cache if p not in live]:
+        del _shard_cache[path]  # archived away
+    return tail, manifest, names
+
+def _load(date_from=None, date_to=None, user_id=None):
+    """
+    Attendance from the shards that can match the filters (all of them by
+    default) plus the journal tail, cached until any of those files changes.
+    Callers still apply the filters; this only skips shards that can't match.
+    """
+    with _cache_lock:
+        for attempt in range(3):
+            tail, manifest, names = _pruned(date_from, date_to, user_id)
+            entries = [manifest["shards"][n] for n in names]
+            key = (tuple((shard_path(e), _file_key(shard_path(e))) for e in entries), _tail_cache["key"])
+            df = _typed_cache.get(key)
+            note(cache=df is not None)
+            if df is not None:
+                return df
+            try:
+                frames = [_shard_frame(e) for e in entries]
+            except FileNotFoundError:
+                continue  # a shard was archived between reading the manifest and the file
+            df = _combine(frames + [tail], ordered=tail is None and disjoint(manifest, names))
+            _typed_cache[key] = df
+            while len(_typed_cache) > TYPED_CACHE_SIZE:
+                del _typed_cache[next(iter(_typed_cache))]
+            return df
+        raise RuntimeError("Attendance shards kept changing while loading.")
+
+def _load_after(after_id, user_id=None):
+    """Rows with record_id > after_id, reading only shards that have any."""
+    after = int(after_id)
+    with _cache_lock:
+        tail, manifest, names = _pruned(user_id=user_id, after_id=after)
+        parts = []
+        for name in names:
+            f = _shard_frame(manifest["shards"][name])
+            parts.append(f[(f["record_id"] > after).fillna(False)])
+        if tail is not None:
+            tail = tail[(tail["record_id"] > after).fillna(False)]
+        return _combine(parts + [tail], ordered=(tail is None or tail.empty) and disjoint(manifest, names))
+
+
+def _text_shard(entry):
+    """One shard's rows as read from disk (strings/NaN); kept for the next chunk of an export."""
+    path = shard_path(entry)
+    key = _file_key(path)
+    hit = _text_cache.pop(path, None)
+    if hit is None or hit[0] != key:
+        hit = (key, read_shard(path))
+    _text_cache[path] = hit
+    while len(_text_cache) > TEXT_CACHE_SIZE:
+        del _text_cache[next(iter(_text_cache))]
+    return hit[1]
+
+def _text(record_ids=None):
+    """
+    Stored text of the rows with `record_ids` (all rows when None), from the
+    shards that hold them and the journal, read in the same order as _tail().
+    """
+    with _cache_lock:
+        return _text_locked(record_ids)
+
+def _text_locked(record_ids):
+    for attempt in range(3):
+        tail = _read_journal(ATTEND_JOURNAL)
+        rows = _read_journal(ATTEND_COMPACTING) + tail
+        manifest = read_manifest()
+        names = sorted(manifest["shards"]) if record_ids is None else shard_for_ids(manifest, record_ids)
+        try:
+            frames = [_text_shard(manifest["shards"][n]) for n in names]
+        except FileNotFoundError:
+            continue  # a shard was archived between reading the manifest and the file
+        if rows:
+            frames.append(_string_frame(rows))  # last, so journal copies win
+        frames = [f.reindex(columns=ATTEND_COLS) for f in frames if len(f)]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ATTEND_COLS)
+        return text_attendance(df, record_ids)
+    raise RuntimeError("Attendance shards kept changing while loading.")
+
+def _max_record_id(values):
+    # previous values may be strings; coerce safely
+    nums = pd.to_numeric(pd.Series(list(values), dtype=object), errors="coerce")
+    top = nums.max()
+    return 0 if pd.isna(top) else int(top)
+
+class RecordSequence:
+    """
+    Monotonic record_id allocator persisted as a one-line sidecar file, so
+    handing out an id is a tiny read + atomic rewrite instead of a scan of the
+    attendance table. Ids are written before the punch that uses them, so a
+    crash can leave a gap but never reuse an id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = FileLock(path + ".lock")  # shared by every kiosk process
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, value):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        replace(tmp, self.path)
+
+    def rebuild(self):
+        """Reset the sequence to the highest record_id in stored attendance."""
+        with self._lock:
+            last = _max_record_id(_load()["record_id"])
+            self._store(last)
+            return last
+
+    def recover(self):
+        """
+        Startup check: rebuild if the sidecar is missing or unreadable, and
+        never let it trail ids already present in the journal.
+        """
+        with self._lock:
+            last = self._load()
+            if last is None:
+                last = _max_record_id(_load()["record_id"])
+            rows = _read_journal(ATTEND_COMPACTING) + _read_journal(ATTEND_JOURNAL)
+            last = max(last, _max_record_id(r.get("record_id") for r in rows))
+            self._store(last)
+            return last
+
+    def next(self, count=1):
+        """Reserve `count` consecutive ids and return the first one."""
+        with self._lock:
+            last = self._load()
+            if last is None:
+                last = _max_record_id(_load()["record_id"])
+            self._store(last + count)
+            return last + 1
+
+
+def _apply_updates(df, updates):
+    upd = pd.DataFrame.from_dict(
+        {str(k): {c: _as_str(v) for c, v in fields.items()} for k, fields in updates.items()},
+        orient="index",
+    )
+    df = df.set_index("record_id")
+    df.update(upd)
+    return df.reset_index()[ATTEND_COLS]
+
+def compact_attendance(updates=None):
+    """
+    Fold the journal into the attendance shards. The journal is first renamed
+    aside so punches can keep appending while workbooks are written; only the
+    shards that receive rows (or `updates`) are rewritten, each atomically,
+    then the manifest, before the rotated journal is removed.
+    `updates` ({record_id: {column: value}}) are applied in the same rewrite.
+    """
+    with _compact_lock:
+        _compact(updates)
+
+def _compact(updates=None):
+    with _journal_lock:
+        if os.path.exists(ATTEND_JOURNAL) and not os.path.exists(ATTEND_COMPACTING):
+            os.replace(ATTEND_JOURNAL, ATTEND_COMPACTING)
+    if not os.path.exists(ATTEND_COMPACTING) and not updates:
+        return
+    rows = _read_journal(ATTEND_COMPACTING)
+    incoming = split(_string_frame(rows)) if rows else {}
+    manifest = read_manifest()
+    shards = dict(manifest["shards"])
+    touched = set(incoming) | set(shard_for_ids(manifest, updates or {}))
+    for name in sorted(touched):
+        entry = shards.get(name) or {"file": name + ".xlsx"}
+        path = shard_path(entry)
+        # reindex: shards written before a column was added lack it
+        old = read_shard(path).reindex(columns=ATTEND_COLS) if os.path.exists(path) \
+            else pd.DataFrame(columns=ATTEND_COLS)
+        df = _merge(old, incoming.get(name))
+        if updates:
+            df = _apply_updates(df, updates)
+        write_shard(df, path)
+        shards[name] = describe(df, entry["file"])
+    write_manifest({"shards": shards})
+    if os.path.exists(ATTEND_COMPACTING):
+        os.remove(ATTEND_COMPACTING)
+
+def import_snapshot(path=ATTEND_XLSX):
+    """One-time split of a pre-shard attendance.xlsx into shards; kept as *.pre-shards.xlsx."""
+    shards = {}
+    if os.path.exists(path):
+        df = pd.read_excel(path, dtype=str).reindex(columns=ATTEND_COLS)
+        for name, part in split(df).items():
+            write_shard(part, os.path.join(ATTEND_DIR, name + ".xlsx"))
+            shards[name] = describe(part, name + ".xlsx")
+    write_manifest({"shards": shards})
+    if os.path.exists(path):
+        os.replace(path, os.path.splitext(path)[0] + ".pre-shards.xlsx")
+
+def archive_partitions(keep=ARCHIVE_KEEP):
+    """
+    Rewrite dated shards older than the `keep` newest (never the current
+    one) as gzip'd CSV under the archive folder. Returns the shard names.
+    """
+    with _compact_lock:
+        manifest = read_manifest()
+        names = archive_candidates(manifest, keep)
+        shards = dict(manifest["shards"])
+        done = []
+        for name in names:
+            src = shard_path(shards[name])
+            df = read_shard(src)
+            file = archive_file(name)
+            write_shard(df, os.path.join(ATTEND_DIR, file))
+            shards[name] = describe(df, file)
+            done.append(src)
+        if names:
+            write_manifest({"shards": shards})
+        for src in done:
+            os.remove(src)
+        return names
+
+def _compact_if_idle():
+    # another thread or kiosk already compacting will pick up this journal too
+    if not _compact_lock.acquire(blocking=False):
+        return
+    try:
+        _compact()
+    finally:
+        _compact_lock.release()
+
+def compact_attendance_async():
+    if _compact_lock.locked():
+        return
+    threading.Thread(target=_compact_if_idle, daemon=True).start()
+
+
+class ExcelBackend(StorageBackend):
+    """users.xlsx + an attendance journal compacted into per-period shards."""
+
+    def __init__(self):
+        self.users = UserDirectory(USERS_XLSX)
+        self.sequence = RecordSequence(RECORD_SEQ)
+        self._views = {}  # (filters, sort_by, descending) -> (base frame, view), least recent first
+        self._views_lock = threading.Lock()
+
+    def init(self):
+        if not os.path.exists(USERS_XLSX):
+            pd.DataFrame(columns=USER_COLS).to_excel(USERS_XLSX, index=False)
+        if not os.path.exists(ATTEND_MANIFEST):
+            with _compact_lock:
+                if not os.path.exists(ATTEND_MANIFEST):
+                    import_snapshot(ATTEND_XLSX)
+        self.sequence.recover()
+
+    def add_user(self, row):
+        self.users.add(row)
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def insert_attendance(self, rows):
+        if not rows:
+            return []
+        first = self.sequence.next(len(rows))
+        ids = list(range(first, first + len(rows)))
+        _append_journal([{**r, "record_id": str(i)} for r, i in zip(rows, ids)])
+        if os.path.getsize(ATTEND_JOURNAL) >= COMPACT_JOURNAL_BYTES:
+            compact_attendance_async()
+        return ids
+
+    def update_attendance(self, updates):
+        # Every row the caller saw is in a shard or the journal that
+        # compaction rotates first, so one rewrite applies them all.
+        if updates:
+            compact_attendance(updates)
+
+    def load_attendance(self):
+        return _load()
+
+    def attendance_text(self, record_ids=None):
+        if record_ids is not None:
+            record_ids = [int(i) for i in record_ids]
+        return _text(record_ids)
+
+    def _sorted_view(self, user_id, date_from, date_to, action, geofence=None, sort_by=None,
+                     descending=False):
+        # Paging through one result re-uses the filtered, sorted frame until
+        # data changes; a new sort of the same filters starts from the
+        # filtered frame the count already built.
+        base = _load(date_from, date_to, user_id)
+        filters = (user_id, date_from, date_to, action, geofence)
+        key = (filters, sort_by, descending)
+        with self._views_lock:
+            hit = self._views.pop(key, None)
+            if hit is not None and hit[0] is base:
+                self._views[key] = hit
+                return hit[1]
+            plain = self._views.get((filters, None, False))
+        if plain is not None and plain[0] is base:
+            df = plain[1]
+        else:
+            df = filter_attendance(base, user_id, date_from, date_to, action, geofence)
+        df = sort_attendance(df, sort_by, descending)
+        with self._views_lock:
+            self._views[key] = (base, df)
+            while len(self._views) > VIEW_CACHE_SIZE:
+                del self._views[next(iter(self._views))]
+        return df
+
+    def query_attendance(self, user_id=None, date_from=None, date_to=None, action=None,
+                         offset=0, limit=None, sort_by=None, descending=False, after_id=None,
+                         geofence=None):
+        if after_id is not None:
+            # live tail: a handful of new rows, not worth caching a view for
+            df = filter_attendance(_load_after(after_id, user_id), user_id, date_from, date_to,
+                                   action, geofence)
+            df = sort_attendance(df, sort_by, descending)
+        else:
+            df = self._sorted_view(user_id, date_from, date_to, action, geofence, sort_by, descending)
+        return df.iloc[offset:offset + limit] if limit else df.iloc[offset:]
+
+    def count_attendance(self, user_id=None, date_from=None, date_to=None, action=None,
+                         geofence=None):
+        # any cached sort of these filters has the same length as the plain view
+        base = _load(date_from, date_to, user_id)
+        filters = (user_id, date_from, date_to, action, geofence)
+        with self._views_lock:
+            for (f, _, _), (b, df) in reversed(list(self._views.items())):
+                if f == filters and b is base:
+                    return len(df)
+        return len(self._sorted_view(user_id, date_from, date_to, action, geofence))
+
+    def last_record_id(self):
+        with _cache_lock:
+            tail = _tail()
+            ids = [e["max_id"] for e in read_manifest()["shards"].values() if e["max_id"] is not None]
+        top = max(ids, default=0)
+        if tail is not None and tail["record_id"].notna().any():
+            top = max(top, int(tail["record_id"].max()))
+        return top
+
+    def compact(self):
+        compact_attendance()
@@ -0,0 +1,162 @@
+"""
+Streaming attendance export. Rows are fetched in record_id-ordered chunks
+(keyset paging on after_id) and written as they arrive, so memory stays flat
+whatever the row count: .xlsx through openpyxl's write-only mode, .csv via
+the csv module and .parquet via pyarrow (optional dependency).
+"""
+import os
+import csv
+import threading
+from app.utils.storage import ATTEND_COLS, get_backend
+
+CHUNK_ROWS = 5000
+EXPORT_FORMATS = (".xlsx", ".csv", ".parquet")
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def iter_attendance_chunks(filters=None, chunk_rows=CHUNK_ROWS, backend=None):
+    """
+    Lists of string rows (ATTEND_COLS order) matching `filters`, oldest
+    record first, from `backend` (default: the configured one).
+    """
+    filters = filters or {}
+    backend = backend or get_backend()
+    after = 0
+    while True:
+        df = backend.query_attendance(**filters, after_id=after, sort_by="record_id", limit=chunk_rows)
+        if df.empty:
+            return
+        after = int(df["record_id"].max())
+        # filtered on the typed frame, written from the stored text (full precision)
+        yield backend.attendance_text(df["record_id"])[ATTEND_COLS].values.tolist()
+        if len(df) < chunk_rows:
+            return
+
+
+class _XlsxWriter:
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet()
+        self.ws.append(ATTEND_COLS)
+
+    def write(self, rows):
+        for r in rows:
+            self.ws.append(r)
+
+    def close(self):
+        self.wb.save(self.path)
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        # utf-8-sig so Excel opens non-ASCII addresses correctly
+        self.f = open(path, "w", newline="", encoding="utf-8-sig")
+        self.w = csv.writer(self.f)
+        self.w.writerow(ATTEND_COLS)
+
+    def write(self, rows):
+        self.w.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).")
+        self.pa = pa
+        self.schema = pa.schema([(c, pa.string()) for c in ATTEND_COLS])
+        self.w = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        cols = list(zip(*rows)) if rows else [[] for _ in ATTEND_COLS]
+        self.w.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(list(c), self.pa.string()) for c in cols], schema=self.schema
+        ))
+
+    def close(self):
+        self.w.close()
+
+
+_WRITERS = {".xlsx": _XlsxWriter, ".csv": _CsvWriter, ".parquet": _ParquetWriter}
+
+
+def export_attendance_stream(path, filters=None, chunk_rows=CHUNK_ROWS, progress=None, cancel=None,
+                            backend=None):
+    """
+    Write matching attendance to `path` (format from its extension) and return
+    the row count. progress(done, total) is called per chunk; setting the
+    `cancel` Event stops the export and leaves no partial file behind.
+    Reads `backend`, or the one GUARD_STORAGE selects.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _WRITERS:
+        raise ValueError(f"Unsupported export format: {ext or path}")
+    backend = backend or get_backend()
+    total = backend.count_attendance(**(filters or {}))
+    tmp = path + ".part" + ext
+    writer = _WRITERS[ext](tmp)
+    done = 0
+    try:
+        for rows in iter_attendance_chunks(filters, chunk_rows, backend):
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled()
+            writer.write(rows)
+            done += len(rows)
+            if progress:
+                progress(done, total)
+        writer.close()
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            writer.close()
+        except Exception:
+            pass
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return done
+
+
+class ExportJob:
+    """An export running on a background thread; the UI polls its fields."""
+
+    def __init__(self, path, filters=None):
+        self.path = path
+        self.filters = filters
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self.cancelled = False
+        self.finished = False
+        self._cancel = threading.Event()
+
+    def _progress(self, done, total):
+        self.done, self.total = done, total
+
+    def _run(self):
+        try:
+            self.done = export_attendance_stream(
+                self.path, self.filters, progress=self._progress, cancel=self._cancel
+            )
+        except ExportCancelled:
+            self.cancelled = True
+        except Exception as e:
+            self.error = e
+        self.finished = True
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
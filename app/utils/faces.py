@@ -0,0 +1,338 @@
+"""
+Selfie-to-registration face check against buddy punching. Each punch photo
+gets a face_score: cosine similarity between the largest face in it and the
+face in the guard's registration photo, stored on the attendance row (empty
+when either photo has no detectable face). Scores below MATCH_THRESHOLD are
+worth a look.
+
+CPU only. Faces are found with OpenCV's bundled Haar cascade. Embeddings
+come from a small ONNX model through cv2.dnn when GUARD_FACE_MODEL points at
+one (e.g. SFace, face_recognition_sface_2021dec.onnx: 112x112 in, 128-d
+out); without one, a spatial LBP histogram is used, which needs no download
+but separates people less reliably.
+
+Registration embeddings are computed once and kept in data/faces/index.npz
+(one float32 row per user), keyed by the photo's path, mtime and size, so a
+new registration photo or a different model recomputes just that entry.
+Checking a punch is then one embedding plus a dot product. Past photos are
+checked in bulk on a process pool:
+
+    python -m app.utils.faces [--all] [--workers N]
+"""
+import os
+import sys
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from app.utils.storage import DATA_DIR, get_user
+from app.utils.filelock import FileLock, replace
+from app.utils.metrics import timed, note
+
+FACE_DIR = os.path.join(DATA_DIR, "faces")
+FACE_INDEX = os.path.join(FACE_DIR, "index.npz")
+FACE_MODEL = os.environ.get("GUARD_FACE_MODEL", "").strip()
+_cv2_data = getattr(cv2, "data", None)  # missing from some headless builds
+CASCADE = os.path.join(_cv2_data.haarcascades, "haarcascade_frontalface_default.xml") if _cv2_data else ""
+DETECT_SIDE = 640      # px; photos are downscaled to this before detection
+MIN_FACE = 48          # px at detection scale
+LBP_SIDE = 98          # face crop for LBP (96 px of codes = 6 x 16 px cells)
+LBP_GRID = 6
+MODEL_SIDE = 112
+THRESHOLDS = {"lbp": 0.80, "onnx": 0.363}  # SFace's published cosine threshold
+
+
+def _uniform_lbp_table():
+    # 58 uniform patterns (at most two 0/1 transitions around the circle) get
+    # their own bin; every other pattern shares bin 58
+    table = np.full(256, 58, dtype=np.uint8)
+    nxt = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        if sum(bits[i] != bits[(i + 1) % 8] for i in range(8)) <= 2:
+            table[code] = nxt
+            nxt += 1
+    return table
+
+_UNIFORM = _uniform_lbp_table()
+_NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+
+def lbp_embedding(gray):
+    """Hellinger-normalised uniform-LBP histograms over a LBP_GRID x LBP_GRID grid of a square crop."""
+    g = cv2.equalizeHist(cv2.resize(gray, (LBP_SIDE, LBP_SIDE), interpolation=cv2.INTER_AREA))
+    h, w = g.shape
+    center = g[1:-1, 1:-1]
+    code = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(_NEIGHBOURS):
+        code |= (g[1 + dy:h - 1 + dy, 1 + dx:w - 1 + dx] >= center).astype(np.uint8) << bit
+    cell = code.shape[0] // LBP_GRID
+    u = _UNIFORM[code].reshape(LBP_GRID, cell, LBP_GRID, cell).transpose(0, 2, 1, 3)
+    u = u.reshape(LBP_GRID * LBP_GRID, -1).astype(np.int64)
+    hist = np.bincount((u + 59 * np.arange(len(u))[:, None]).ravel(), minlength=59 * len(u))
+    v = np.sqrt(hist / float(cell * cell)).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+class FaceEmbedder:
+    """Detector + embedding model; OpenCV objects are kept per thread."""
+
+    def __init__(self, model=FACE_MODEL):
+        self.model = model
+        self.method = "onnx" if model else "lbp"
+        self.name = f"onnx:{os.path.basename(model)}" if model else "lbp"
+        self._local = threading.local()
+
+    def _detector(self):
+        det = getattr(self._local, "detector", None)
+        if det is None:
+            det = cv2.CascadeClassifier(CASCADE) if CASCADE else None
+            if det is None or det.empty():
+                raise RuntimeError("OpenCV face cascade not found (install opencv-python).")
+            self._local.detector = det
+        return det
+
+    def _net(self):
+        net = getattr(self._local, "net", None)
+        if net is None:
+            net = self._local.net = cv2.dnn.readNetFromONNX(self.model)
+        return net
+
+    def face(self, img):
+        """Square crop around the largest face in a BGR image, or None."""
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        scale = min(1.0, DETECT_SIDE / max(gray.shape))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+        found = self._detector().detectMultiScale(small, scaleFactor=1.1, minNeighbors=5,
+                                                  minSize=(MIN_FACE, MIN_FACE))
+        if len(found) == 0:
+            return None
+        x, y, w, h = (np.asarray(max(found, key=lambda r: r[2] * r[3])) / scale).astype(int)
+        side = int(max(w, h) * 1.1)
+        cx, cy = x + w // 2, y + h // 2
+        y0, x0 = max(cy - side // 2, 0), max(cx - side // 2, 0)
+        return img[y0:y0 + side, x0:x0 + side]
+
+    def embed_face(self, face):
+        """Unit-length embedding of a face crop (BGR)."""
+        if self.method == "onnx":
+            blob = cv2.dnn.blobFromImage(cv2.resize(face, (MODEL_SIDE, MODEL_SIDE)), 1.0,
+                                         (MODEL_SIDE, MODEL_SIDE), (0, 0, 0), swapRB=True)
+            net = self._net()
+            net.setInput(blob)
+            v = net.forward().ravel().astype(np.float32)
+            return v / np.linalg.norm(v)
+        return lbp_embedding(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY))
+
+    def embed(self, path):
+        """Embedding of the largest face in an image file, or None (unreadable / no face)."""
+        try:
+            # imdecode rather than imread: imread can't open non-ASCII paths on Windows
+            img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        except OSError:
+            return None
+        if img is None:
+            return None
+        face = self.face(img)
+        return None if face is None else self.embed_face(face)
+
+
+def photo_key(path):
+    """Changes whenever the photo at `path` does (None if it is missing)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}"
+
+
+class FaceIndex:
+    """
+    Registration embeddings in one .npz: user keys, photo keys, a has-face
+    flag and a float32 matrix with one row per user. Re-read when the file
+    changes; written under a file lock so kiosks sharing data/ can add to it.
+    """
+
+    def __init__(self, path, embedder):
+        self.path = path
+        self.embedder = embedder
+        self._stat = None
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock")
+        self._set({})
+
+    def _set(self, entries):
+        # entries: user key -> (photo key, vector or None)
+        self.entries = entries
+        self.rows = {u: i for i, u in enumerate(entries)}
+        dim = next((len(v) for _, v in entries.values() if v is not None), 0)
+        self.matrix = np.zeros((len(entries), dim), dtype=np.float32)
+        for u, (_, v) in entries.items():
+            if v is not None:
+                self.matrix[self.rows[u]] = v
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+            stat = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stat = None
+        note(cache=stat == self._stat)
+        if stat == self._stat:
+            return
+        entries = {}
+        if stat is not None:
+            with np.load(self.path, allow_pickle=False) as z:
+                if str(z["method"]) == self.embedder.name:
+                    for u, k, ok, v in zip(z["users"], z["photo_keys"], z["has_face"], z["vectors"]):
+                        entries[str(u)] = (str(k), v.copy() if ok else None)
+        self._set(entries)
+        self._stat = stat
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        users = list(self.entries)
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, method=np.array(self.embedder.name), users=np.array(users, dtype=str),
+                 photo_keys=np.array([self.entries[u][0] for u in users], dtype=str),
+                 has_face=np.array([self.entries[u][1] is not None for u in users], dtype=bool),
+                 vectors=self.matrix)
+        replace(tmp, self.path)
+        st = os.stat(self.path)
+        self._stat = (st.st_mtime_ns, st.st_size)
+
+    def stale(self, users):
+        """(user key, photo path) pairs whose cached embedding is missing or outdated."""
+        with self._lock:
+            self._refresh()
+            return [(u, p) for u, p in users
+                    if u not in self.entries or self.entries[u][0] != photo_key(p)]
+
+    def store(self, computed):
+        """Save {user key: (photo path, vector or None)}."""
+        if not computed:
+            return
+        with self._file_lock, self._lock:
+            self._refresh()  # another kiosk may have added users meanwhile
+            entries = dict(self.entries)
+            for u, (p, v) in computed.items():
+                entries[u] = (photo_key(p), v)
+            self._set(entries)
+            self._save()
+
+    def lookup(self, users):
+        """(matrix of registration vectors, has-face mask) for a list of user keys."""
+        with self._lock:
+            self._refresh()
+            idx = np.array([self.rows.get(u, -1) for u in users], dtype=np.int64)
+            ok = np.array([u in self.entries and self.entries[u][1] is not None for u in users], dtype=bool)
+            if not self.matrix.size:
+                return np.zeros((len(users), 0), dtype=np.float32), ok
+            return self.matrix[np.maximum(idx, 0)], ok
+
+    def vector(self, user_key, photo_path):
+        """Registration embedding for one user, computed and saved if needed (None: no face)."""
+        if self.stale([(user_key, photo_path)]):
+            self.store({user_key: (photo_path, self.embedder.embed(photo_path))})
+        m, ok = self.lookup([user_key])
+        return m[0] if ok[0] else None
+
+
+embedder = FaceEmbedder()
+face_index = FaceIndex(FACE_INDEX, embedder)
+MATCH_THRESHOLD = float(os.environ.get("GUARD_FACE_THRESHOLD") or THRESHOLDS[embedder.method])
+
+
+def _registration(user_id):
+    user = get_user(user_id)
+    path = (user or {}).get("photo_path")
+    if not path or not os.path.exists(path):
+        return None, None
+    return user["user_id"].casefold(), path
+
+@timed("face.verify")
+def face_score(user_id, photo_path):
+    """Similarity of the face in `photo_path` to the user's registration face, as text ("" if unknown)."""
+    try:
+        key, reg = _registration(user_id)
+        if key is None:
+            note(outcome="no registration photo")
+            return ""
+        ref = face_index.vector(key, reg)
+        selfie = embedder.embed(photo_path) if ref is not None else None
+        if selfie is None:
+            note(outcome="no face")
+            return ""
+        return f"{float(ref @ selfie):.3f}"
+    except Exception:
+        note(outcome="error")  # never hold up a punch over this
+        return ""
+
+
+def _embed_paths(model, paths):
+    # process pool worker: one embedder per process, OpenCV single-threaded
+    cv2.setNumThreads(1)
+    emb = FaceEmbedder(model)
+    return [emb.embed(p) for p in paths]
+
+def _embed_all(paths, pool, chunk):
+    jobs = [pool.submit(_embed_paths, embedder.model, paths[i:i + chunk]) for i in range(0, len(paths), chunk)]
+    return [v for j in jobs for v in j.result()]
+
+def verify_history(all_rows=False, workers=None, chunk=16, progress=None):
+    """
+    Score stored punch photos (only unscored ones unless `all_rows`) on a
+    process pool and write the scores back. Returns (photos, scored).
+    """
+    from app.utils.storage import load_attendance, update_attendance
+    df = load_attendance()
+    df = df[df["photo_path"].notna()]
+    if not all_rows:
+        df = df[df["face_score"].isna()]
+    if df.empty:
+        return 0, 0
+    regs = {u: _registration(u) for u in df["user_id"].astype(str).unique()}
+    df = df[df["user_id"].astype(str).map(lambda u: regs[u][0] is not None).to_numpy()]
+    photos = [p for p in df["photo_path"].astype(str).unique() if os.path.exists(p)]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        stale = face_index.stale(list({k: p for k, p in regs.values() if k}.items()))
+        if stale:
+            vecs = _embed_all([p for _, p in stale], pool, chunk)
+            face_index.store({u: (p, v) for (u, p), v in zip(stale, vecs)})
+        if progress:
+            progress(len(stale), len(photos))
+        vecs = _embed_all(photos, pool, chunk)
+
+    # one row-wise dot product over every (punch photo, registration) pair
+    found = {p: v for p, v in zip(photos, vecs) if v is not None}
+    df = df[df["photo_path"].astype(str).isin(found).to_numpy()]
+    if df.empty:
+        return len(photos), 0
+    dim = len(next(iter(found.values())))
+    paths = list(found)
+    selfies = np.stack([found[p] for p in paths])
+    pos = {p: i for i, p in enumerate(paths)}
+    s = selfies[df["photo_path"].astype(str).map(pos).to_numpy(dtype=np.int64)]
+    r, ok = face_index.lookup([regs[u][0] for u in df["user_id"].astype(str)])
+    ok &= r.shape[1] == dim
+    scores = np.einsum("ij,ij->i", s[ok], r[ok]) if ok.any() else np.zeros(0)
+    ids = df["record_id"].to_numpy()[ok]
+    update_attendance({int(i): {"face_score": f"{x:.3f}"} for i, x in zip(ids, scores)})
+    return len(photos), len(ids)
+
+
+def main(argv):
+    from app.utils.storage import init_storage
+    init_storage()
+    workers = int(argv[argv.index("--workers") + 1]) if "--workers" in argv else None
+    photos, scored = verify_history(
+        all_rows="--all" in argv, workers=workers,
+        progress=lambda regs, n: print(f"{regs} registration photo(s) indexed; scoring {n} photo(s)...", flush=True),
+    )
+    print(f"Scored {scored} punches from {photos} photos with {embedder.name} "
+          f"(match threshold {MATCH_THRESHOLD}).")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
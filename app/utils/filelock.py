@@ -0,0 +1,92 @@
+"""
+Exclusive locks shared by every process (and thread) using the same data
+directory, so several kiosks can write to one data/ folder. flock() on POSIX,
+msvcrt.locking() on Windows, each on a small ".lock" file next to the data
+it guards. The OS drops the lock if the holder dies.
+"""
+import os
+import time
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()  # OS locks don't serialise threads of one process everywhere
+        self._fd = None
+
+    def _open(self):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _try_os_lock(self, blocking):
+        fd = self._open()
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            delay = 0.001
+            # flock blocks in the kernel; msvcrt is polled with backoff
+            while not self._try_os_lock(blocking):
+                if not blocking:
+                    self._thread_lock.release()
+                    return False
+                time.sleep(delay)
+                delay = min(0.05, delay * 2)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return True
+
+    def release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            self._thread_lock.release()
+
+    def locked(self):
+        """Held by a thread of this process (other processes are not visible here)."""
+        return self._thread_lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def replace(src, dst, attempts=50):
+    """os.replace, retried while Windows reports the target open by a reader."""
+    for i in range(attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if os.name != "nt" or i == attempts - 1:
+                raise
+            time.sleep(0.02)
@@ -1,27 +1,147 @@
 import os
+import time
+import sqlite3
+import threading
 import requests
 import geocoder
 from openlocationcode import openlocationcode as olc
+from app.utils.storage import DATA_DIR
+from app.utils.metrics import timed, note
 
 USER_AGENT = "GuardMonitoringApp/1.0 (contact: example@example.com)"  # edit if you like
 
-def get_current_location():
-    """
-    Try IP-based geolocation. Returns (lat, lon, source).
-    If it fails, returns ("", "", "manual") so UI can ask the user.
-    """
+GEOCODE_CACHE_DB = os.path.join(DATA_DIR, "geocode_cache.db")
+GEOCODE_CACHE_CODE_LENGTH = 10      # plus-code cell of roughly 14 m x 14 m
+GEOCODE_CACHE_TTL = 30 * 24 * 3600  # seconds before an address is looked up again
+GEOCODE_CACHE_MAX = 5000            # entries kept; least recently used go first
+
+# Requests per second. Nominatim's usage policy allows at most 1 req/s.
+OSM_RATE = 1.0
+GOOGLE_RATE = float(os.environ.get("GOOGLE_GEOCODE_RPS", "10"))
+
+class TokenBucket:
+    """Blocking rate limiter: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+osm_limiter = TokenBucket(OSM_RATE)
+google_limiter = TokenBucket(GOOGLE_RATE, capacity=max(1, int(GOOGLE_RATE)))
+
+_http = threading.local()
+
+def http_session():
+    """Per-thread keep-alive session, so repeat lookups reuse the TLS connection."""
+    s = getattr(_http, "session", None)
+    if s is None:
+        s = requests.Session()
+        s.headers["User-Agent"] = USER_AGENT
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        s.mount("https://", adapter)
+        _http.session = s
+    return s
+
+# A kiosk's IP location doesn't move between punches; reuse it for this long
+LOCATION_TTL = float(os.environ.get("GUARD_LOCATION_TTL", "600"))
+FIRST_FIX_TIMEOUT = 15  # seconds to wait when there is no fix at all yet
+
+@timed("geo.ip_lookup")
+def _ip_location():
     try:
         g = geocoder.ip("me")
         if g and g.latlng:
-            return float(g.latlng[0]), float(g.latlng[1]), "ip"
+            return float(g.latlng[0]), float(g.latlng[1])
     except Exception:
         pass
-    return "", "", "manual"
+    note(outcome="no fix")
+    return None
+
+class CachedLocation:
+    """
+    Last IP fix, refreshed in the background every `ttl` seconds (and on
+    demand once it is older than that). Callers get the last known fix
+    immediately; only the very first lookup ever waits.
+    """
+
+    def __init__(self, ttl, lookup=_ip_location):
+        self.ttl = ttl
+        self._lookup = lookup
+        self._fix = None  # (lat, lon, monotonic time fetched)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        fix = self._lookup()
+        if fix:
+            self._fix = (fix[0], fix[1], time.monotonic())
+
+    def refresh_async(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._refresh, daemon=True)
+                self._thread.start()
+            return self._thread
+
+    def start(self):
+        """Keep the fix warm for as long as the app runs."""
+        def loop():
+            while True:
+                self._refresh()
+                time.sleep(self.ttl)
+        threading.Thread(target=loop, daemon=True).start()
+
+    def get(self):
+        fix = self._fix
+        if fix is None:
+            self.refresh_async().join(FIRST_FIX_TIMEOUT)
+            fix = self._fix
+            if fix is None:
+                return None
+        age = time.monotonic() - fix[2]
+        if age > self.ttl:
+            self.refresh_async()  # serve the stale fix meanwhile
+        return fix[0], fix[1], age
 
+current_location = CachedLocation(LOCATION_TTL)
+
+@timed("geo.current_location")
+def get_current_location():
+    """
+    Try IP-based geolocation. Returns (lat, lon, source).
+    The fix comes from the background-refreshed cache; source records its
+    age, e.g. "ip" when just fetched or "ip (cached 240s)".
+    If it fails, returns ("", "", "manual") so UI can ask the user.
+    """
+    fix = current_location.get()
+    if fix is None:
+        note(outcome="no fix")
+        return "", "", "manual"
+    lat, lon, age = fix
+    note(cache=age >= 1)
+    return lat, lon, "ip" if age < 1 else f"ip (cached {int(age)}s)"
+
+@timed("geo.google")
 def reverse_geocode_google(lat, lon, api_key):
     url = "https://maps.googleapis.com/maps/api/geocode/json"
     params = {"latlng": f"{lat},{lon}", "key": api_key}
-    r = requests.get(url, params=params, timeout=10)
+    google_limiter.acquire()
+    r = http_session().get(url, params=params, timeout=10)
     r.raise_for_status()
     js = r.json()
     if js.get("status") != "OK":
@@ -35,6 +155,7 @@ def reverse_geocode_google(lat, lon, api_key):
             break
     return addr, pincode
 
+@timed("geo.osm")
 def reverse_geocode_osm(lat, lon):
     url = "https://nominatim.openstreetmap.org/reverse"
     params = {
@@ -43,19 +164,117 @@ def reverse_geocode_osm(lat, lon):
         "format": "json",
         "addressdetails": 1
     }
-    r = requests.get(url, params=params, headers={"User-Agent": USER_AGENT}, timeout=10)
+    osm_limiter.acquire()
+    r = http_session().get(url, params=params, timeout=10)
     r.raise_for_status()
     js = r.json()
     addr = js.get("display_name", "")
     pincode = (js.get("address", {}) or {}).get("postcode")
     return addr, pincode
 
+class GeocodeCache:
+    """
+    Disk-backed reverse-geocode results keyed on a plus-code cell, with TTL
+    and LRU eviction. Guards punch from the same posts every day, so most
+    lookups should be answered here without a network call.
+    """
+
+    def __init__(self, path, code_length, ttl, max_entries):
+        self.path = path
+        self.code_length = code_length
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "cell TEXT PRIMARY KEY, address TEXT, pincode TEXT, "
+                "created REAL, last_used REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_geocode_used ON geocode (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def key(self, lat, lon):
+        return to_plus_code(lat, lon, code_length=self.code_length) or None
+
+    def get(self, lat, lon):
+        cell = self.key(lat, lon)
+        if cell is None:
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT address, pincode, created FROM geocode WHERE cell = ?", (cell,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl:
+                self.misses += 1
+                return None
+            db.execute("UPDATE geocode SET last_used = ? WHERE cell = ?", (now, cell))
+            db.commit()
+            self.hits += 1
+        return row[0], row[1]
+
+    def put(self, lat, lon, address, pincode):
+        cell = self.key(lat, lon)
+        if cell is None or not address:
+            return  # don't remember failures; the next punch retries
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)",
+                (cell, address, pincode or "", now, now),
+            )
+            db.execute(
+                "DELETE FROM geocode WHERE cell IN (SELECT cell FROM geocode "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
+            db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+geocode_cache = GeocodeCache(
+    GEOCODE_CACHE_DB, GEOCODE_CACHE_CODE_LENGTH, GEOCODE_CACHE_TTL, GEOCODE_CACHE_MAX
+)
+
+@timed("geo.reverse_geocode")
 def reverse_geocode(lat, lon):
     """
-    Returns (address, pincode). Tries Google first if key present, else OSM.
+    Returns (address, pincode). Served from the local cache when this spot was
+    resolved recently; otherwise tries Google first if key present, else OSM.
     """
     if lat == "" or lon == "" or lat is None or lon is None:
         return "", ""
+    try:
+        cached = geocode_cache.get(lat, lon)
+    except sqlite3.Error:
+        cached = None
+    note(cache=bool(cached))
+    if cached:
+        return cached
+    addr, pin = _reverse_geocode_live(lat, lon)
+    if not addr:
+        note(outcome="no address")
+    try:
+        geocode_cache.put(lat, lon, addr, pin)
+    except sqlite3.Error:
+        pass
+    return addr, pin
+
+def _reverse_geocode_live(lat, lon):
     key = os.environ.get("GOOGLE_MAPS_API_KEY")
     if key:
         try:
@@ -0,0 +1,313 @@
+"""
+Geofence check of punches against the post they belong to. data/sites.json
+(edited by hand, re-read when it changes) holds the posts and who or what
+belongs where:
+
+    {
+      "sites":  {"GATE-1": {"name": "Main gate", "lat": 12.9716, "lon": 77.5946, "radius_m": 75},
+                 "YARD":   {"polygon": [[12.970, 77.590], [12.972, 77.590], [12.972, 77.593]]}},
+      "guards": {"9800000000": ["GATE-1", "YARD"]},
+      "qr":     {"GATE-1 START": "GATE-1"}
+    }
+
+A punch's expected post is the one its QR payload maps to (or the payload
+itself when it is a post id), otherwise any post its guard is assigned to.
+The result is stored in the punch's `geofence` column:
+  inside      at an expected post
+  wrong_post  at some other registered post
+  outside     at no registered post
+  unassigned  no expected post for this payload/guard
+  no_fix      no usable coordinates
+and left empty while no sites are registered.
+
+A sites.json that can't be read or parsed is logged and the last good
+registry stays in use; a site entry without usable coordinates is logged
+and skipped. Neither ever fails the punch being saved.
+
+Sites are bucketed on a GRID_DEG grid by bounding box, so a check only
+tests the few sites sharing the punch's cell. Old punches (or all of them,
+after editing sites.json) are re-checked in bulk with vectorised haversine:
+
+    python -m app.utils.geofence [--all]
+"""
+import os
+import sys
+import json
+import math
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from app.utils.storage import DATA_DIR
+from app.utils.metrics import timed
+
+SITES_JSON = os.path.join(DATA_DIR, "sites.json")
+GRID_DEG = 0.01           # index cell, about 1.1 km north-south
+DEFAULT_RADIUS_M = 100    # for sites given as a bare center
+EARTH_RADIUS_M = 6371008.8
+M_PER_DEG = 111320.0
+
+INSIDE, WRONG_POST, OUTSIDE, UNASSIGNED, NO_FIX = "inside", "wrong_post", "outside", "unassigned", "no_fix"
+STATUSES = [INSIDE, WRONG_POST, OUTSIDE, UNASSIGNED, NO_FIX]
+
+log = logging.getLogger("guard.geofence")
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; works on scalars and NumPy arrays alike."""
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def in_polygon(lat, lon, poly):
+    """Even-odd ray cast of points (arrays) against a polygon given as an (n, 2) lat/lon array."""
+    lat = np.asarray(lat, dtype=float)[:, None]
+    lon = np.asarray(lon, dtype=float)[:, None]
+    y1, x1 = poly[:, 0], poly[:, 1]
+    y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+    crosses = (y1 > lat) != (y2 > lat)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+    return ((crosses & (lon < x_at)).sum(axis=1) % 2) == 1
+
+
+class SiteRegistry:
+    """sites.json in memory with a grid index over the sites, rebuilt when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._stat = None
+        self._lock = threading.Lock()
+        self._load({})
+
+    @staticmethod
+    def _site(s):
+        """(center lat, center lon, radius, polygon or None, bbox lo, bbox hi) of one sites entry."""
+        if s.get("polygon"):
+            poly = np.asarray(s["polygon"], dtype=float)
+            if poly.ndim != 2 or poly.shape[1] != 2 or len(poly) < 3 or not np.isfinite(poly).all():
+                raise ValueError("polygon needs at least three [lat, lon] points")
+            lo, hi = poly.min(axis=0), poly.max(axis=0)
+            return (lo[0] + hi[0]) / 2, (lo[1] + hi[1]) / 2, 0.0, poly, lo, hi
+        clat, clon = float(s["lat"]), float(s["lon"])
+        r = float(s.get("radius_m", DEFAULT_RADIUS_M))
+        if not (math.isfinite(clat) and math.isfinite(clon) and math.isfinite(r) and r >= 0):
+            raise ValueError("lat, lon and radius_m must be finite numbers")
+        dlat = r / M_PER_DEG
+        dlon = r / (M_PER_DEG * max(math.cos(math.radians(clat)), 1e-6))
+        return clat, clon, r, None, (clat - dlat, clon - dlon), (clat + dlat, clon + dlon)
+
+    def _load(self, data):
+        ids, lat, lon, radius, polys = [], [], [], [], {}
+        grid = {}
+        problems = []
+        for post, s in (data.get("sites") or {}).items():
+            try:
+                clat, clon, r, poly, lo, hi = self._site(s)
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                problems.append(f"site {post!r} skipped: {type(e).__name__}: {e}")
+                continue
+            i = len(ids)
+            ids.append(str(post))
+            if poly is not None:
+                polys[i] = poly
+            lat.append(clat)
+            lon.append(clon)
+            radius.append(r)
+            for gy in range(math.floor(lo[0] / GRID_DEG), math.floor(hi[0] / GRID_DEG) + 1):
+                for gx in range(math.floor(lo[1] / GRID_DEG), math.floor(hi[1] / GRID_DEG) + 1):
+                    grid.setdefault((gy, gx), []).append(i)
+        index = {post: i for i, post in enumerate(ids)}
+        guards = {}
+        for u, posts in (data.get("guards") or {}).items():
+            if isinstance(posts, str):
+                posts = [posts]
+            if not isinstance(posts, (list, tuple)):
+                problems.append(f"guard {u!r} skipped: posts must be a list")
+                continue
+            guards[str(u).strip().casefold()] = tuple(index[p] for p in posts if p in index)
+        qr = {str(k): index[v] for k, v in (data.get("qr") or {}).items() if isinstance(v, str) and v in index}
+        qr.update({post: i for post, i in index.items() if post not in qr})
+        for msg in problems:
+            log.warning("%s: %s", self.path, msg)
+        self.ids, self.index = ids, index
+        self.lat, self.lon, self.radius = np.array(lat), np.array(lon), np.array(radius)
+        self.polys = polys
+        self.grid = {cell: np.array(sites) for cell, sites in grid.items()}
+        self.guards, self.qr = guards, qr
+        self.problems = problems
+
+    def refresh(self):
+        """
+        Re-read sites.json if it changed. A file that can't be read or parsed
+        is logged once and the last good registry is kept.
+        """
+        try:
+            st = os.stat(self.path)
+            stat = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stat = None
+        with self._lock:
+            if stat == self._stat:
+                return
+            self._stat = stat  # a broken version is reported once, not on every punch
+            data = {}
+            try:
+                if stat is not None:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                if not isinstance(data, dict):
+                    raise ValueError("top level must be an object")
+                for key in ("sites", "guards", "qr"):
+                    if not isinstance(data.get(key) or {}, dict):
+                        raise ValueError(f"{key!r} must be an object")
+                self._load(data)
+            except (OSError, ValueError) as e:
+                # JSONDecodeError is a ValueError
+                self.problems = [f"not loaded, keeping the previous {len(self.ids)} site(s): {e}"]
+                log.error("%s not loaded, keeping the previous %d site(s): %s", self.path, len(self.ids), e)
+
+    def expected(self, user_id, qr_payload=""):
+        """Site indexes a punch by this guard with this payload should be at."""
+        post = self.qr.get(str(qr_payload or "").strip())
+        if post is not None:
+            return (post,)
+        return self.guards.get(str(user_id).strip().casefold(), ())
+
+    def _contains(self, rows, sites, lat, lon):
+        """Per (row, site) pair: is point `rows` inside site `sites`?"""
+        hit = haversine_m(lat[rows], lon[rows], self.lat[sites], self.lon[sites]) <= self.radius[sites]
+        for s in np.unique(sites):
+            if int(s) in self.polys:
+                m = sites == s
+                hit[m] = in_polygon(lat[rows[m]], lon[rows[m]], self.polys[int(s)])
+        return hit
+
+    def sites_at(self, lat, lon):
+        """Indexes of the sites containing one point."""
+        cands = self.grid.get((math.floor(lat / GRID_DEG), math.floor(lon / GRID_DEG)))
+        if cands is None:
+            return set()
+        hit = self._contains(np.zeros(len(cands), dtype=int), cands, np.array([lat]), np.array([lon]))
+        return set(cands[hit].tolist())
+
+    @timed("geofence.check")
+    def check(self, user_id, qr_payload, lat, lon):
+        """Geofence status of one punch (see the module docstring)."""
+        self.refresh()
+        if not self.ids:
+            return ""
+        posts = self.expected(user_id, qr_payload)
+        if not posts:
+            return UNASSIGNED
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return NO_FIX
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return NO_FIX
+        here = self.sites_at(lat, lon)
+        if here & set(posts):
+            return INSIDE
+        return WRONG_POST if here else OUTSIDE
+
+    def classify(self, df):
+        """
+        Status for every row of an attendance frame at once: grid lookups per
+        distinct cell, then one vectorised haversine over (punch, candidate site).
+        """
+        self.refresh()
+        n = len(df)
+        if not self.ids or n == 0:
+            return np.full(n, "", dtype=object)
+        lat = pd.to_numeric(df["latitude"], errors="coerce").to_numpy(dtype=float)
+        lon = pd.to_numeric(df["longitude"], errors="coerce").to_numpy(dtype=float)
+        fix = np.isfinite(lat) & np.isfinite(lon)
+
+        # expected (row, site) pairs: the payload's post, else the guard's posts
+        text = lambda col: df[col].astype(object).where(df[col].notna(), "").astype(str).str.strip() \
+            .reset_index(drop=True)
+        by_qr = text("qr_payload").map(self.qr).to_numpy(dtype=float)
+        has_qr = ~np.isnan(by_qr)
+        by_guard = text("user_id")[~has_qr].str.casefold().map(self.guards).dropna().explode().dropna()
+        exp_rows = np.concatenate([np.flatnonzero(has_qr), by_guard.index.to_numpy(dtype=np.int64)])
+        exp_sites = np.concatenate([by_qr[has_qr].astype(np.int64), by_guard.to_numpy(dtype=np.int64)])
+        expected_keys = exp_rows * len(self.ids) + exp_sites
+        assigned = np.zeros(n, dtype=bool)
+        assigned[exp_rows] = True
+
+        # candidate (row, site) pairs from the grid, per distinct cell
+        todo = np.flatnonzero(fix & assigned)
+        cells = pd.DataFrame({"gy": np.floor(lat[todo] / GRID_DEG).astype(np.int64),
+                              "gx": np.floor(lon[todo] / GRID_DEG).astype(np.int64), "row": todo})
+        rows, sites = [], []
+        for (gy, gx), grp in cells.groupby(["gy", "gx"], sort=False):
+            cands = self.grid.get((gy, gx))
+            if cands is not None:
+                r = grp["row"].to_numpy()
+                rows.append(np.repeat(r, len(cands)))
+                sites.append(np.tile(cands, len(r)))
+        inside = np.zeros(n, dtype=bool)
+        anywhere = np.zeros(n, dtype=bool)
+        if rows:
+            rows, sites = np.concatenate(rows), np.concatenate(sites)
+            hit = self._contains(rows, sites, lat, lon)
+            rows, sites = rows[hit], sites[hit]
+            anywhere[rows] = True
+            ok = np.isin(rows.astype(np.int64) * len(self.ids) + sites, expected_keys)
+            inside[rows[ok]] = True
+
+        return np.select(
+            [~assigned, ~fix, inside, anywhere],
+            [UNASSIGNED, NO_FIX, INSIDE, WRONG_POST],
+            default=OUTSIDE,
+        ).astype(object)
+
+
+sites = SiteRegistry(SITES_JSON)
+
+
+def validate_rows(rows):
+    """Fill `geofence` on attendance_row() dicts that don't have one yet (on insert)."""
+    for r in rows:
+        if not r.get("geofence"):
+            try:
+                r["geofence"] = sites.check(r["user_id"], r.get("qr_payload"), r.get("latitude"), r.get("longitude"))
+            except Exception:
+                # the punch is saved unchecked; `python -m app.utils.geofence` can fill it in later
+                log.exception("geofence check failed for %s", r.get("user_id"))
+    return rows
+
+
+def revalidate(all_rows=False):
+    """
+    Re-check stored punches (only those never checked, unless `all_rows`) and
+    write back the ones whose status changed. Returns (checked, updated).
+    """
+    from app.utils.storage import load_attendance, update_attendance
+    df = load_attendance()
+    if not all_rows:
+        df = df[df["geofence"].isna()]
+    status = sites.classify(df)
+    old = df["geofence"].astype(object).where(df["geofence"].notna(), "").to_numpy()
+    changed = np.flatnonzero(status != old)
+    ids = df["record_id"].to_numpy()[changed]
+    update_attendance({int(i): {"geofence": s} for i, s in zip(ids, status[changed])})
+    return len(df), len(changed)
+
+
+def main(argv):
+    from app.utils.storage import init_storage
+    init_storage()
+    sites.refresh()
+    for msg in sites.problems:
+        print(f"{SITES_JSON}: {msg}")
+    if not sites.ids:
+        print(f"No sites registered in {SITES_JSON}; nothing to check.")
+        return
+    checked, updated = revalidate(all_rows="--all" in argv)
+    print(f"Checked {checked} punches against {len(sites.ids)} sites, updated {updated}.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
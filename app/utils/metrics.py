@@ -0,0 +1,196 @@
+"""
+In-process timing of the hot paths (storage, geo, camera, photo ingest).
+
+Functions are wrapped with @timed("stage") or a block with span("stage").
+Each span records its duration, outcome ("ok", "error", or whatever the code
+passes to note(outcome=...)) and, where the code calls note(cache=...),
+whether it was served from a cache. The last SAMPLES spans per stage are
+kept for the admin timings panel. A summary is appended to a rotating log
+every DUMP_SECONDS and at exit, and spans slower than SLOW_MS are logged as
+they happen.
+
+GUARD_METRICS=0 turns it off: @timed then returns the function unchanged
+and span() is a shared no-op, so the disabled cost is one attribute lookup.
+"""
+import os
+import time
+import json
+import atexit
+import logging
+import threading
+from collections import deque
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+
+ENABLED = os.environ.get("GUARD_METRICS", "1").strip().lower() not in ("0", "false", "no", "off")
+METRICS_LOG = os.path.join("data", "metrics.log")  # storage.DATA_DIR; not imported, to stay free of pandas
+LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+SAMPLES = 1000        # spans kept per stage
+DUMP_SECONDS = 300
+SLOW_MS = 2000
+
+_stages = {}          # name -> Stage
+_lock = threading.Lock()
+_local = threading.local()
+_logger = None
+_log_lock = threading.Lock()
+_dumper_started = False
+
+
+class Stage:
+    def __init__(self):
+        self.durations = deque(maxlen=SAMPLES)
+        self.count = 0
+        self.errors = 0
+        self.hits = 0
+        self.lookups = 0
+        self.outcomes = {}
+
+
+class Span:
+    __slots__ = ("name", "t0", "outcome", "cache")
+
+    def __init__(self, name):
+        self.name = name
+        self.outcome = "ok"
+        self.cache = None
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dt = time.perf_counter() - self.t0
+        _local.stack.pop()
+        if exc_type is not None and self.outcome == "ok":
+            self.outcome = "error"
+        _record(self.name, dt, self.outcome, self.cache)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+    outcome = cache = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    return Span(name) if ENABLED else _NO_SPAN
+
+def timed(name):
+    """Decorator: run the function inside span(name)."""
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            with Span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def note(outcome=None, cache=None):
+    """Annotate the innermost span running on this thread (no-op outside one)."""
+    stack = getattr(_local, "stack", None)
+    if not stack:
+        return
+    s = stack[-1]
+    if outcome is not None:
+        s.outcome = outcome
+    if cache is not None:
+        s.cache = bool(cache)
+
+
+def _record(name, dt, outcome, cache):
+    with _lock:
+        st = _stages.get(name)
+        if st is None:
+            st = _stages[name] = Stage()
+            if not _dumper_started:
+                _start_dumper()
+        st.durations.append(dt)
+        st.count += 1
+        st.outcomes[outcome] = st.outcomes.get(outcome, 0) + 1
+        if outcome == "error":
+            st.errors += 1
+        if cache is not None:
+            st.lookups += 1
+            st.hits += cache
+    if dt * 1000 >= SLOW_MS:
+        _log({"slow": name, "ms": round(dt * 1000, 1), "outcome": outcome, "cache": cache})
+
+
+def _pct(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+def summary():
+    """{stage: {count, errors, p50_ms, p95_ms, max_ms, cache_hit_rate, outcomes}} over the kept spans."""
+    with _lock:
+        items = [(name, sorted(st.durations), st.count, st.errors, st.hits, st.lookups, dict(st.outcomes))
+                 for name, st in _stages.items()]
+    out = {}
+    for name, d, count, errors, hits, lookups, outcomes in sorted(items):
+        out[name] = {
+            "count": count,
+            "errors": errors,
+            "p50_ms": round(_pct(d, 0.50) * 1000, 2),
+            "p95_ms": round(_pct(d, 0.95) * 1000, 2),
+            "max_ms": round((d[-1] if d else 0.0) * 1000, 2),
+            "cache_hit_rate": round(hits / lookups, 3) if lookups else None,
+            "outcomes": outcomes,
+        }
+    return out
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+def _log(entry):
+    global _logger
+    try:
+        with _log_lock:
+            if _logger is None:
+                os.makedirs(os.path.dirname(METRICS_LOG), exist_ok=True)
+                handler = RotatingFileHandler(METRICS_LOG, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS,
+                                              encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                logger = logging.getLogger("guard.metrics")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                logger.addHandler(handler)
+                _logger = logger
+        _logger.info(json.dumps(entry, separators=(",", ":")))
+    except Exception:
+        pass  # metrics must never break a punch
+
+def dump():
+    """Append the current summary to the rotating metrics log."""
+    s = summary()
+    if s:
+        _log({"summary": s})
+
+def _start_dumper():
+    global _dumper_started
+    _dumper_started = True
+    def loop():
+        while True:
+            time.sleep(DUMP_SECONDS)
+            dump()
+    threading.Thread(target=loop, daemon=True, name="metrics").start()
+    atexit.register(dump)
@@ -0,0 +1,93 @@
+"""
+One-shot move of the Excel store (users.xlsx, the attendance shards and journal)
+into SQLite. Existing record_ids are kept, and re-running skips rows that are
+already there. If the database holds a *different* row under one of the
+record_ids, nothing is migrated unless --force is given, which keeps the
+database's row and reports the Excel one as skipped. Afterwards run the app
+with GUARD_STORAGE=sqlite; Excel is then only written on export.
+
+    python -m app.utils.migrate            # migrate into data/guard.db
+    python -m app.utils.migrate --force    # ... skipping record_ids taken by other rows
+    python -m app.utils.migrate --export   # rewrite attendance.xlsx from SQLite
+"""
+import sys
+from app.utils.storage import (
+    DATA_DIR, SQLITE_DB, ATTEND_XLSX, USER_COLS, ATTEND_COLS, init_storage, _clean
+)
+from app.utils.excel_store import ExcelBackend
+from app.utils.sqlite_store import SqliteBackend
+
+
+class MigrationConflict(ValueError):
+    """The target database uses some of the Excel record_ids for different rows."""
+
+    def __init__(self, record_ids):
+        self.record_ids = record_ids
+        super().__init__(f"{len(record_ids)} record_id(s) already hold different rows in the "
+                         f"database: {_id_list(record_ids)}")
+
+
+def _id_list(ids, shown=10):
+    return ", ".join(ids[:shown]) + (f" and {len(ids) - shown} more" if len(ids) > shown else "")
+
+
+def migrate_excel_to_sqlite(db_path=SQLITE_DB, force=False):
+    """
+    Returns (users added, users skipped, rows added, rows already there,
+    record_ids skipped because the database holds a different row there).
+    Raises MigrationConflict, before writing anything, if there are such
+    record_ids and not `force`.
+    """
+    excel = ExcelBackend()
+    excel.init()
+    db = SqliteBackend(db_path)
+    db.init()
+
+    # the stored text, not the typed frame: coordinates keep every digit
+    rows = [{c: _clean(v) for c, v in rec.items()} for rec in excel.attendance_text().to_dict("records")]
+    source = {r["record_id"]: tuple(r[c] for c in ATTEND_COLS) for r in rows if r["record_id"]}
+    stored = db.attendance_text(list(source))
+    same, conflicts = 0, []
+    for rec in stored.to_dict("records"):
+        if tuple(_clean(rec[c]) for c in ATTEND_COLS) == source[rec["record_id"]]:
+            same += 1
+        else:
+            conflicts.append(rec["record_id"])
+    if conflicts and not force:
+        raise MigrationConflict(conflicts)
+
+    n_users = skipped_users = 0
+    for row in excel.users.all():
+        if not row["user_id"]:
+            continue
+        try:
+            db.add_user({c: row[c] for c in USER_COLS})
+            n_users += 1
+        except ValueError:
+            skipped_users += 1  # already migrated (or a case-insensitive duplicate)
+
+    return n_users, skipped_users, db.insert_records(rows), same, conflicts
+
+
+def main(argv):
+    init_storage()
+    if "--export" in argv:
+        SqliteBackend(SQLITE_DB).export_attendance(ATTEND_XLSX)
+        print(f"Exported {SQLITE_DB} -> {ATTEND_XLSX}")
+        return
+    try:
+        n_users, skipped_users, n_rows, same, conflicts = migrate_excel_to_sqlite(force="--force" in argv)
+    except MigrationConflict as e:
+        print(f"Nothing migrated: {e}.\nRe-run with --force to migrate the rest and keep the "
+              f"database's rows for those record_ids.")
+        sys.exit(1)
+    print(f"Migrated {n_users} users and {n_rows} attendance rows from {DATA_DIR} into {SQLITE_DB}")
+    if skipped_users or same:
+        print(f"Skipped {skipped_users} users and {same} attendance rows already in the database")
+    if conflicts:
+        print(f"WARNING: skipped {len(conflicts)} attendance rows whose record_id holds a different "
+              f"row in the database: {_id_list(conflicts)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
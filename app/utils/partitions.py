@@ -0,0 +1,208 @@
+"""
+Attendance shards for the Excel backend: one workbook per period (month by
+default; GUARD_PARTITION=year|month|day) under data/attendance/, plus a
+manifest.json with each shard's row count, timestamp and record_id range and
+the user_ids in it. Queries open only the shards the manifest says can
+match, and compaction rewrites only the shards that received rows (normally
+just the current one). Rows whose timestamp doesn't parse go to "undated".
+
+Shards older than the newest few can be archived: rewritten as gzip'd CSV
+under data/attendance/archive/ (smaller, and faster to load than xlsx).
+Archived shards stay queryable; late punches still land in them.
+
+    python -m app.utils.partitions                  # list shards
+    python -m app.utils.partitions --archive [--keep 3]
+"""
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from app.utils.storage import ATTEND_DIR, ATTEND_MANIFEST, ATTEND_COLS, PARTITION_BY, TS_FORMAT
+from app.utils.filelock import replace
+
+PERIOD_FORMATS = {"year": "%Y", "month": "%Y-%m", "day": "%Y-%m-%d"}
+UNDATED = "undated"
+ARCHIVE_DIR = os.path.join(ATTEND_DIR, "archive")
+ARCHIVE_KEEP = 3  # newest periods left as workbooks when archiving
+
+
+def _period_format():
+    if PARTITION_BY not in PERIOD_FORMATS:
+        raise ValueError(f"Unknown GUARD_PARTITION: {PARTITION_BY}")
+    return PERIOD_FORMATS[PARTITION_BY]
+
+def _parse(values):
+    # same rules as typed_attendance: TS_FORMAT first, anything else as a fallback
+    col = pd.Series(values, dtype=object).reset_index(drop=True)
+    parsed = pd.to_datetime(col, format=TS_FORMAT, errors="coerce")
+    odd = parsed.isna() & col.notna()
+    if odd.any():
+        parsed[odd] = pd.to_datetime(col[odd], errors="coerce")
+    return parsed
+
+def shard_names(timestamps):
+    """Shard each timestamp string belongs to."""
+    return _parse(timestamps).dt.strftime(_period_format()).fillna(UNDATED).to_numpy()
+
+def current_shard():
+    return datetime.now().strftime(_period_format())
+
+
+def shard_path(entry):
+    return os.path.join(ATTEND_DIR, entry["file"])
+
+def read_shard(path):
+    """A shard as plain strings, missing cells as NaN (as read_excel gives them)."""
+    if path.endswith(".csv.gz"):
+        df = pd.read_csv(path, dtype=str, keep_default_na=False, compression="gzip")
+        return df.mask(df == "")
+    return pd.read_excel(path, dtype=str)
+
+def write_shard(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.endswith(".csv.gz"):
+        tmp = path + ".tmp.csv.gz"
+        df.to_csv(tmp, index=False, compression="gzip")
+    else:
+        tmp = path + ".tmp.xlsx"
+        df.to_excel(tmp, index=False)
+    replace(tmp, path)
+
+def describe(df, file):
+    """Manifest entry for the string frame `df` stored as `file` (relative to ATTEND_DIR)."""
+    ts = _parse(df["timestamp"]).dropna()
+    ids = pd.to_numeric(df["record_id"], errors="coerce").dropna()
+    users = df["user_id"].dropna().astype(str).str.strip()
+    return {
+        "file": file,
+        "rows": int(len(df)),
+        "min_ts": ts.min().strftime(TS_FORMAT) if len(ts) else None,
+        "max_ts": ts.max().strftime(TS_FORMAT) if len(ts) else None,
+        "min_id": int(ids.min()) if len(ids) else None,
+        "max_id": int(ids.max()) if len(ids) else None,
+        "users": sorted(set(users[users != ""])),
+    }
+
+
+_manifest_cache = {"key": None, "manifest": None}
+
+def _file_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def read_manifest():
+    """{"shards": {name: entry}}, re-read only when manifest.json changes. Treat as read-only."""
+    key = _file_key(ATTEND_MANIFEST)
+    if key is None:
+        return {"shards": {}}
+    if _manifest_cache["key"] != key:
+        with open(ATTEND_MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        for entry in manifest["shards"].values():
+            entry["_lo"] = pd.Timestamp(entry["min_ts"]) if entry["min_ts"] else None
+            entry["_hi"] = pd.Timestamp(entry["max_ts"]) if entry["max_ts"] else None
+            entry["_users"] = [u.casefold() for u in entry["users"]]
+        _manifest_cache["key"], _manifest_cache["manifest"] = key, manifest
+    return _manifest_cache["manifest"]
+
+def write_manifest(manifest):
+    os.makedirs(ATTEND_DIR, exist_ok=True)
+    shards = {name: {k: v for k, v in entry.items() if not k.startswith("_")}
+              for name, entry in sorted(manifest["shards"].items())}
+    tmp = ATTEND_MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"partition_by": PARTITION_BY, "shards": shards}, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    replace(tmp, ATTEND_MANIFEST)
+
+def shard_for_ids(manifest, ids):
+    """Names of shards whose record_id range covers any of `ids`."""
+    ids = np.asarray(sorted(int(i) for i in ids))
+    names = []
+    for name, e in manifest["shards"].items():
+        if e["min_id"] is None or not len(ids):
+            continue
+        i = np.searchsorted(ids, e["min_id"])
+        if i < len(ids) and ids[i] <= e["max_id"]:
+            names.append(name)
+    return names
+
+
+def prune(manifest, date_from=None, date_to=None, user_id=None, after_id=None):
+    """
+    Shards that may hold rows matching the query filters, oldest first
+    (undated last). Bounds are inclusive, as in filter_attendance.
+    """
+    lo = pd.to_datetime(date_from) if date_from else None
+    hi = pd.to_datetime(date_to) if date_to else None
+    needle = str(user_id).casefold() if user_id else None
+    names = []
+    for name, e in manifest["shards"].items():
+        if not e["rows"]:
+            continue
+        if (lo is not None or hi is not None) and e["_lo"] is None:
+            continue  # no parseable timestamps: never inside a date range
+        if lo is not None and e["_hi"] < lo:
+            continue
+        if hi is not None and e["_lo"] > hi:
+            continue
+        if after_id is not None and (e["max_id"] is None or e["max_id"] <= int(after_id)):
+            continue
+        if needle and not any(needle in u for u in e["_users"]):
+            continue
+        names.append(name)
+    return sorted(names, key=lambda n: (manifest["shards"][n]["_lo"] is None,
+                                        manifest["shards"][n]["_lo"] or pd.Timestamp.min, n))
+
+def disjoint(manifest, names):
+    """True if the shards, in this order, cover non-overlapping time ranges."""
+    prev = None
+    for n in names:
+        e = manifest["shards"][n]
+        if e["_lo"] is None:
+            continue
+        if prev is not None and e["_lo"] < prev:
+            return False
+        prev = e["_hi"]
+    return True
+
+
+def split(df):
+    """Group a string attendance frame into {shard name: rows}."""
+    if df.empty:
+        return {}
+    keys = shard_names(df["timestamp"])
+    return {name: df[keys == name].reset_index(drop=True) for name in pd.unique(keys)}
+
+def archive_candidates(manifest, keep=ARCHIVE_KEEP):
+    """Dated shards, other than the current and the `keep` newest, still stored as workbooks."""
+    dated = sorted(n for n in manifest["shards"] if n != UNDATED)
+    hot = set(dated[-keep:]) if keep > 0 else set()
+    hot.add(current_shard())
+    return [n for n in dated if n not in hot and not manifest["shards"][n]["file"].endswith(".csv.gz")]
+
+def archive_file(name):
+    return os.path.relpath(os.path.join(ARCHIVE_DIR, name + ".csv.gz"), ATTEND_DIR)
+
+
+def main(argv):
+    from app.utils.storage import init_storage
+    from app.utils.excel_store import archive_partitions
+    init_storage()
+    if "--archive" in argv:
+        keep = int(argv[argv.index("--keep") + 1]) if "--keep" in argv else ARCHIVE_KEEP
+        done = archive_partitions(keep)
+        print(f"Archived {len(done)} shard(s): {', '.join(done) or '-'}")
+    for name, e in sorted(read_manifest()["shards"].items()):
+        print(f"{name:>10}  {e['rows']:>8} rows  {e['min_ts'] or '-':>19} .. {e['max_ts'] or '-':<19}  "
+              f"{len(e['users']):>5} users  {e['file']}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,88 @@
+"""
+Photo ingest: every stored photo is re-encoded to a bounded JPEG, named by
+the hash of its source bytes (so re-uploading the same file stores nothing
+new) and gets a small thumbnail for previews. Webcam captures are staged in
+INCOMING_DIR and removed once ingested. Punches ingest on PHOTO_POOL while
+their location is being resolved.
+"""
+import os
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from app.utils.storage import PHOTO_DIR
+from app.utils.metrics import timed, note
+from app.utils.filelock import replace
+
+INCOMING_DIR = os.path.join(PHOTO_DIR, "incoming")
+THUMB_DIR = os.path.join(PHOTO_DIR, "thumbs")
+PHOTO_MAX_SIDE = 1280  # px
+PHOTO_QUALITY = 82
+THUMB_SIDE = 160       # px
+THUMB_QUALITY = 70
+
+PHOTO_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="photo")
+
+
+def content_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()[:32]
+
+def thumbnail_path(photo_path):
+    """Thumbnail of an ingested photo (None for photos stored before ingest existed)."""
+    if not photo_path:
+        return None
+    path = os.path.join(THUMB_DIR, os.path.basename(str(photo_path)))
+    return path if os.path.exists(path) else None
+
+def _save_jpeg(img, path, quality):
+    # unique temp name: two ingests of the same bytes write the same `path`
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, "JPEG", quality=quality, optimize=True)
+        replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _encode(src, dst, thumb):
+    try:
+        with Image.open(src) as img:
+            # let the JPEG decoder downscale while decoding; much cheaper on big photos
+            img.draft("RGB", (PHOTO_MAX_SIDE, PHOTO_MAX_SIDE))
+            img = ImageOps.exif_transpose(img).convert("RGB")
+    except Exception as e:
+        raise ValueError(f"Not a readable image: {os.path.basename(src)} ({e})")
+    img.thumbnail((PHOTO_MAX_SIDE, PHOTO_MAX_SIDE), Image.LANCZOS)
+    _save_jpeg(img, dst, PHOTO_QUALITY)
+    img.thumbnail((THUMB_SIDE, THUMB_SIDE), Image.LANCZOS)
+    _save_jpeg(img, thumb, THUMB_QUALITY)
+
+@timed("photo.ingest")
+def ingest_photo(src):
+    """
+    Store `src` as a bounded JPEG plus thumbnail and return the stored path.
+    Already-ingested content is not encoded again; staged captures are removed.
+    """
+    if os.path.dirname(os.path.abspath(src)) == os.path.abspath(PHOTO_DIR):
+        return src  # already an ingested artifact (e.g. a retried punch)
+    os.makedirs(THUMB_DIR, exist_ok=True)
+    name = content_hash(src) + ".jpg"
+    dst = os.path.join(PHOTO_DIR, name)
+    thumb = os.path.join(THUMB_DIR, name)
+    seen = os.path.exists(dst) and os.path.exists(thumb)
+    note(cache=seen)
+    if not seen:
+        _encode(src, dst, thumb)
+    if os.path.dirname(os.path.abspath(src)) == os.path.abspath(INCOMING_DIR):
+        os.remove(src)
+    return dst
+
+def ingest_async(src):
+    """Future resolving to ingest_photo(src)."""
+    return PHOTO_POOL.submit(ingest_photo, src)
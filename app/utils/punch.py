@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.storage import add_attendance, TS_FORMAT
+from app.utils.geo import get_current_location, reverse_geocode, to_plus_code
+from app.utils.photos import ingest_async
+from app.utils.faces import face_score
+from app.utils.metrics import timed
+
+log = logging.getLogger("guard.punch")
+
+
+def new_punch(user_id, action, photo_path="", qr_payload="", lat="", lon="", source=""):
+    """A punch as captured on the UI thread; the time is fixed here, not at commit."""
+    return {
+        "user_id": str(user_id),
+        "action": str(action),
+        "photo_path": str(photo_path or ""),
+        "qr_payload": str(qr_payload or ""),
+        "captured_at": datetime.now().strftime(TS_FORMAT),
+        "latitude": lat,
+        "longitude": lon,
+        "location_source": source,
+    }
+
+
+class PunchPipeline:
+    """
+    Runs the slow half of a punch (IP location, reverse geocoding, storage
+    write) on worker threads. Results come back through a queue that the Tk
+    side drains with `after`, so callbacks always run on the UI thread.
+
+    Callbacks:
+      on_done(punch, record_id)     punch committed
+      on_error(punch, exc)          punch could not be committed
+      ask_location(punch)           no location fix; return (lat, lon) or None
+    """
+
+    def __init__(self, workers=2, poll_ms=100):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="punch")
+        self._events = queue.Queue()
+        self._poll_ms = poll_ms
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.on_done = None
+        self.on_error = None
+        self.on_change = None
+        self.ask_location = None
+
+    def attach(self, root):
+        """Start draining events on the Tk loop of `root`."""
+        def drain():
+            try:
+                while True:
+                    try:
+                        fn, args = self._events.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        fn(*args)
+                    except Exception:
+                        # a broken callback must not stop delivery for the session
+                        log.exception("punch callback %s failed", getattr(fn, "__name__", fn))
+            finally:
+                root.after(self._poll_ms, drain)
+        root.after(self._poll_ms, drain)
+
+    def _post(self, fn, *args):
+        if fn is not None:
+            self._events.put((fn, args))
+
+    def _count(self, delta):
+        with self._lock:
+            self.pending += delta
+            n = self.pending
+        self._post(self.on_change, n)
+
+    def submit(self, punch):
+        self._count(+1)
+        if punch["photo_path"]:
+            # re-encode the photo while the location is being resolved
+            punch["photo_job"] = ingest_async(punch["photo_path"])
+        self._pool.submit(self._run, punch)
+
+    def _run(self, punch):
+        try:
+            if punch["latitude"] in ("", None) or punch["longitude"] in ("", None):
+                lat, lon, source = get_current_location()
+                if source == "manual":
+                    # Ask on the UI thread, then continue in a worker
+                    self._post(self._ask_location, punch)
+                    return
+                punch.update(latitude=lat, longitude=lon, location_source=source)
+            self._commit(punch)
+        except Exception as e:
+            self._post(self.on_error, punch, e)
+        self._count(-1)
+
+    def _ask_location(self, punch):
+        answer = self.ask_location(punch) if self.ask_location else None
+        lat, lon = answer if answer else ("", "")
+        punch.update(latitude=lat, longitude=lon, location_source="manual")
+        try:
+            self._pool.submit(self._resume, punch)
+        except RuntimeError:  # pool already shut down
+            self._resume(punch)
+
+    def _resume(self, punch):
+        try:
+            self._commit(punch)
+        except Exception as e:
+            self._post(self.on_error, punch, e)
+        self._count(-1)
+
+    @timed("punch.commit")
+    def _commit(self, punch):
+        if punch.get("photo_job") is not None:
+            punch["photo_path"] = punch.pop("photo_job").result()
+        if punch["photo_path"] and not punch.get("face_score"):
+            punch["face_score"] = face_score(punch["user_id"], punch["photo_path"])
+        lat, lon = punch["latitude"], punch["longitude"]
+        address, pincode = reverse_geocode(lat, lon)
+        punch.update(address=address, pincode=pincode, plus_code=to_plus_code(lat, lon))
+        record_id = add_attendance(
+            user_id=punch["user_id"],
+            latitude=str(lat), longitude=str(lon),
+            address=str(address), pincode=str(pincode), plus_code=str(punch["plus_code"]),
+            photo_path=punch["photo_path"],
+            action=punch["action"],
+            location_source=str(punch["location_source"]),
+            qr_payload=punch["qr_payload"],
+            timestamp=punch["captured_at"],
+            face_score=punch.get("face_score", ""),
+        )
+        self._post(self.on_done, punch, record_id)
+
+    def shutdown(self):
+        """
+        Wait for queued punches to be written (used on app exit). Punches
+        still waiting for a manual location are committed without one, as
+        when the prompt is cancelled, rather than lost with the UI queue.
+        """
+        self._pool.shutdown(wait=True)
+        while True:
+            try:
+                fn, args = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if fn == self._ask_location:
+                punch = args[0]
+                punch.update(latitude="", longitude="", location_source="manual")
+                self._resume(punch)
@@ -0,0 +1,142 @@
+"""
+QR scanning engine for low-end kiosk CPUs.
+
+Frames come from the shared camera service (app.utils.camera_service);
+detection runs on a downscaled
+grayscale copy (trying the region of the last hit first), and the full
+resolution image is only touched to decode the candidate region. A worker
+thread does the scanning so the preview loop never waits on it, and the
+scan stride adapts to how long detection takes.
+"""
+import time
+import threading
+import cv2
+import numpy as np
+
+DETECT_WIDTH = 480   # px; detection runs on frames no wider than this...
+FAR_DETECT_WIDTH = 800  # ...except every other miss, to catch codes held far away
+ROI_MARGIN = 0.35    # grow candidate boxes by this fraction on each side
+SCAN_BUDGET = 0.040  # s; slower scans make the worker skip more frames
+MAX_STRIDE = 4
+MIN_SIDE_RATIO = 0.6  # shortest/longest side of a plausible (even tilted) QR quad
+
+
+def _gray(frame):
+    return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+def _box(points, margin, shape):
+    """Bounding box of `points` grown by `margin`, clipped to an image of `shape`."""
+    pts = points.reshape(-1, 2)
+    x0, y0 = pts.min(axis=0)
+    x1, y1 = pts.max(axis=0)
+    mx, my = (x1 - x0) * margin, (y1 - y0) * margin
+    h, w = shape[:2]
+    return (int(max(0, x0 - mx)), int(max(0, y0 - my)),
+            int(min(w, x1 + mx + 1)), int(min(h, y1 + my + 1)))
+
+def _plausible(points):
+    """Reject detector false positives on background texture: a QR is a near-square quad."""
+    pts = points.reshape(-1, 2)
+    if len(pts) != 4:
+        return False
+    sides = np.linalg.norm(pts - np.roll(pts, 1, axis=0), axis=1)
+    return sides.min() > 8 and sides.min() / sides.max() >= MIN_SIDE_RATIO
+
+
+class QrScanner:
+    """Stateful single-frame scanner; remembers where the last code was."""
+
+    def __init__(self, detect_width=DETECT_WIDTH, far_detect_width=FAR_DETECT_WIDTH,
+                 roi_margin=ROI_MARGIN):
+        self.detector = cv2.QRCodeDetector()
+        self.widths = (detect_width, far_detect_width)
+        self.roi_margin = roi_margin
+        self.roi = None  # (x0, y0, x1, y1) in full-res pixels
+        self.misses = 0
+
+    def _detect_in(self, gray, x0=0, y0=0, width=DETECT_WIDTH):
+        h, w = gray.shape[:2]
+        scale = min(1.0, width / float(w))
+        small = gray if scale == 1.0 else cv2.resize(
+            gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        ok, pts = self.detector.detect(small)
+        if not ok or pts is None or not _plausible(pts):
+            return None
+        return pts.reshape(-1, 2) / scale + (x0, y0)
+
+    def detect(self, gray):
+        """Corner points of a QR candidate in full-res coordinates, or None."""
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            pts = self._detect_in(gray[y0:y1, x0:x1], x0, y0, self.widths[0])
+            if pts is not None:
+                return pts
+            self.roi = None
+        pts = self._detect_in(gray, width=self.widths[self.misses % len(self.widths)])
+        self.misses = 0 if pts is not None else self.misses + 1
+        return pts
+
+    def decode(self, gray, pts):
+        """Decode the candidate at `pts` from a full-res crop around it."""
+        x0, y0, x1, y1 = _box(pts, self.roi_margin, gray.shape)
+        crop = np.ascontiguousarray(gray[y0:y1, x0:x1])
+        local = (pts - (x0, y0)).astype(np.float32).reshape(1, -1, 2)
+        data, _ = self.detector.decode(crop, local)
+        if not data:
+            # corners from the small frame can be a little off; let OpenCV re-fit them
+            data, _, _ = self.detector.detectAndDecode(crop)
+        return data or None
+
+    def scan(self, frame):
+        """Returns (payload or None, corner points or None) for one frame."""
+        gray = _gray(frame)
+        pts = self.detect(gray)
+        if pts is None:
+            return None, None
+        data = self.decode(gray, pts)
+        # keep tracking the candidate even before it decodes (e.g. still blurry)
+        self.roi = _box(pts, self.roi_margin, gray.shape)
+        return data, pts
+
+
+class ScanWorker:
+    """
+    Scans the newest frames of `grabber` (anything with wait(after_seq, timeout),
+    e.g. the camera service) on a background thread until a code decodes.
+    """
+
+    def __init__(self, grabber, scanner=None, budget=SCAN_BUDGET):
+        self.grabber = grabber
+        self.scanner = scanner or QrScanner()
+        self.budget = budget
+        self.stride = 1
+        self.payload = None
+        self.points = None
+        self._running = False
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        seq = 0
+        while self._running and self.payload is None:
+            # skip `stride - 1` frames past the last one scanned
+            seq, frame = self.grabber.wait(seq + self.stride - 1)
+            if frame is None:
+                continue
+            t0 = time.perf_counter()
+            data, pts = self.scanner.scan(frame)
+            dt = time.perf_counter() - t0
+            self.points = pts
+            if data:
+                self.payload = data
+                break
+            if dt > self.budget:
+                self.stride = min(MAX_STRIDE, self.stride + 1)
+            elif self.stride > 1:
+                self.stride -= 1
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,244 @@
+"""
+Shift summary: QR_START/QR_END punches paired into shifts per guard, and a
+per-guard, per-day hours table, both kept up to date incrementally.
+
+Pairing is vectorised over events sorted by (user_id, timestamp, record_id):
+a START immediately followed by an END of the same guard is a closed shift.
+Everything else is flagged rather than guessed at:
+  open       START with nothing after it yet (on shift, or forgot to end)
+  overlap    START followed by another START (a second shift began while open)
+  no_start   END not preceded by a START
+  too_long   closed, but longer than MAX_SHIFT_HOURS (probably a missed punch)
+
+Shifts that run past midnight have their hours split across the days.
+update() only reads punches newer than the last record_id it has seen; the
+only state carried between updates is each guard's trailing open START.
+Daily totals are additive, so they are adjusted by the shifts that changed.
+A guard whose new punches are older than what was already processed
+(e.g. an offline kiosk syncing late) has just their own shifts rebuilt.
+"""
+import threading
+import numpy as np
+import pandas as pd
+from app.utils.storage import load_attendance, query_attendance
+
+START, END = "QR_START", "QR_END"
+MAX_SHIFT_HOURS = 16
+PAID = ("closed",)  # statuses whose hours count; the rest are flagged instead
+SHIFT_COLS = ["user_id", "start_id", "end_id", "start", "end", "hours", "status"]
+DAILY_COLS = ["hours", "shifts", "flags"]
+
+
+def _events(df):
+    """START/END punches of a typed attendance frame as (record_id, user_id, timestamp, is_start)."""
+    df = df[df["action"].isin([START, END]) & df["timestamp"].notna()]
+    return pd.DataFrame({
+        "record_id": df["record_id"].to_numpy(dtype="int64"),
+        "user_id": df["user_id"].astype(str).to_numpy(),
+        "timestamp": df["timestamp"].to_numpy(dtype="datetime64[ns]"),
+        "is_start": (df["action"] == START).to_numpy(dtype=bool),
+    })
+
+def _empty_shifts():
+    return pd.DataFrame({
+        "user_id": pd.Series(dtype=object), "start_id": pd.Series(dtype="Int64"),
+        "end_id": pd.Series(dtype="Int64"), "start": pd.Series(dtype="datetime64[ns]"),
+        "end": pd.Series(dtype="datetime64[ns]"), "hours": pd.Series(dtype=float),
+        "status": pd.Series(dtype=object),
+    })
+
+def _empty_daily():
+    idx = pd.MultiIndex.from_arrays([pd.Series(dtype=object), pd.Series(dtype="datetime64[ns]")],
+                                    names=["user_id", "date"])
+    return pd.DataFrame({"hours": pd.Series(dtype=float), "shifts": pd.Series(dtype="int64"),
+                         "flags": pd.Series(dtype="int64")}, index=idx)
+
+
+def pair_shifts(ev):
+    """Shifts (SHIFT_COLS) from an _events() frame, without loops over rows."""
+    if ev.empty:
+        return _empty_shifts()
+    ev = ev.sort_values(["user_id", "timestamp", "record_id"], kind="mergesort")
+    user = ev["user_id"].to_numpy()
+    ts = ev["timestamp"].to_numpy()
+    rid = ev["record_id"].to_numpy()
+    is_start = ev["is_start"].to_numpy()
+    n = len(ev)
+
+    same_next = np.zeros(n, dtype=bool)
+    same_next[:-1] = user[1:] == user[:-1]
+    next_is_end = np.zeros(n, dtype=bool)
+    next_is_end[:-1] = ~is_start[1:]
+    prev_is_start = np.zeros(n, dtype=bool)
+    prev_is_start[1:] = is_start[:-1] & (user[1:] == user[:-1])
+
+    s = np.flatnonzero(is_start)
+    closed = same_next[s] & next_is_end[s]
+    nxt = np.minimum(s + 1, n - 1)
+    starts = pd.DataFrame({
+        "user_id": user[s],
+        "start_id": rid[s],
+        "end_id": np.where(closed, rid[nxt], -1),
+        "start": ts[s],
+        "end": np.where(closed, ts[nxt], np.datetime64("NaT")),
+        "status": np.where(closed, "closed", np.where(same_next[s], "overlap", "open")),
+    })
+    e = np.flatnonzero(~is_start & ~prev_is_start)
+    orphans = pd.DataFrame({
+        "user_id": user[e], "start_id": -1, "end_id": rid[e],
+        "start": np.datetime64("NaT"), "end": ts[e], "status": "no_start",
+    })
+    out = pd.concat([starts, orphans], ignore_index=True)
+    out["start"] = out["start"].astype("datetime64[ns]")
+    out["end"] = out["end"].astype("datetime64[ns]")
+    out["hours"] = (out["end"] - out["start"]) / pd.Timedelta(hours=1)
+    out.loc[(out["status"] == "closed") & (out["hours"] > MAX_SHIFT_HOURS), "status"] = "too_long"
+    for c in ("start_id", "end_id"):
+        out[c] = out[c].astype("Int64").mask(out[c] < 0)
+    return out[SHIFT_COLS]
+
+
+def daily_parts(shifts):
+    """Additive per-(user_id, date) contributions of `shifts`: hours, shifts started, flags."""
+    if shifts.empty:
+        return _empty_daily()
+    paid = shifts[shifts["status"].isin(PAID)]
+    start = paid["start"].to_numpy(dtype="datetime64[ns]")
+    end = paid["end"].to_numpy(dtype="datetime64[ns]")
+    d0 = start.astype("datetime64[D]")
+    # a shift ending exactly at midnight does not touch the next day
+    d1 = np.maximum(d0, (end - np.timedelta64(1, "ns")).astype("datetime64[D]"))
+    ndays = (d1 - d0).astype("int64") + 1
+    rep = np.repeat(np.arange(len(paid)), ndays)
+    k = np.arange(len(rep)) - np.repeat(np.cumsum(ndays) - ndays, ndays)
+    day = d0[rep] + k.astype("timedelta64[D]")
+    lo = np.maximum(start[rep], day.astype("datetime64[ns]"))
+    hi = np.minimum(end[rep], (day + np.timedelta64(1, "D")).astype("datetime64[ns]"))
+    segments = pd.DataFrame({
+        "user_id": paid["user_id"].to_numpy()[rep],
+        "date": day.astype("datetime64[ns]"),
+        "hours": (hi - lo) / np.timedelta64(1, "h"),
+        "shifts": (k == 0).astype("int64"),
+        "flags": 0,
+    })
+    flagged = shifts[shifts["status"] != "closed"]
+    anchor = flagged["start"].fillna(flagged["end"])
+    flags = pd.DataFrame({
+        "user_id": flagged["user_id"].to_numpy(),
+        "date": anchor.dt.normalize().to_numpy(dtype="datetime64[ns]"),
+        "hours": 0.0, "shifts": 0, "flags": 1,
+    })
+    parts = pd.concat([segments, flags], ignore_index=True)
+    return parts.groupby(["user_id", "date"], sort=False)[DAILY_COLS].sum()
+
+
+def _contains(values, needle):
+    return values.astype(str).str.contains(str(needle), case=False, regex=False)
+
+def _until(value):
+    """Exclusive upper bound; a bare date means the whole of that day."""
+    ts = pd.to_datetime(value)
+    return ts + pd.Timedelta(days=1) if len(str(value).strip()) <= 10 else ts + pd.Timedelta(seconds=1)
+
+
+class ShiftSummary:
+    """Materialised shifts + daily hours, brought up to date by update()."""
+
+    def __init__(self):
+        self.shifts = _empty_shifts()
+        self.daily = _empty_daily()
+        self.last_id = 0
+        self.last_ts = pd.Series(dtype="datetime64[ns]")  # latest START/END seen per guard
+        self.built = False
+        self._lock = threading.Lock()
+
+    def _replace(self, drop_mask, events):
+        """Swap the shifts selected by `drop_mask` for those paired from `events`."""
+        dropped = self.shifts[drop_mask]
+        fresh = pair_shifts(events)
+        daily = self.daily.sub(daily_parts(dropped), fill_value=0).add(daily_parts(fresh), fill_value=0)
+        keep = (daily["shifts"] != 0) | (daily["flags"] != 0) | (daily["hours"].abs() > 1e-9)
+        self.daily = daily[keep].astype({"shifts": "int64", "flags": "int64"})
+        self.shifts = pd.concat([self.shifts[~drop_mask], fresh], ignore_index=True) \
+            if len(self.shifts) else fresh
+        if not events.empty:
+            seen = events.groupby("user_id")["timestamp"].max()
+            self.last_ts = pd.concat([self.last_ts, seen]).groupby(level=0).max()
+
+    def rebuild(self):
+        with self._lock:
+            df = load_attendance()
+            self.shifts, self.daily = _empty_shifts(), _empty_daily()
+            self.last_ts = pd.Series(dtype="datetime64[ns]")
+            top = df["record_id"].max()
+            self.last_id = 0 if pd.isna(top) else int(top)
+            self._replace(np.zeros(0, dtype=bool), _events(df))
+            self.built = True
+
+    def update(self):
+        """Fold in punches newer than the last one seen; returns how many were read."""
+        if not self.built:
+            self.rebuild()
+            return len(self.shifts)
+        with self._lock:
+            new = query_attendance(after_id=self.last_id, sort_by="record_id")
+            if new.empty:
+                return 0
+            self.last_id = max(self.last_id, int(new["record_id"].max()))
+            ev = _events(new)
+            if ev.empty:
+                return len(new)
+
+            first = ev.groupby("user_id")["timestamp"].min()
+            known = self.last_ts.reindex(first.index)
+            late = first.index[(first < known).to_numpy()]
+            if len(late):
+                # punches arrived out of order for these guards: redo just them
+                full = _events(load_attendance())
+                self._replace(self.shifts["user_id"].isin(late).to_numpy(),
+                              full[full["user_id"].isin(late)])
+                ev = ev[~ev["user_id"].isin(late)]
+
+            users = ev["user_id"].unique()
+            carry = (self.shifts["status"] == "open") & self.shifts["user_id"].isin(users)
+            carried = self.shifts[carry]
+            carry_ev = pd.DataFrame({
+                "record_id": carried["start_id"].to_numpy(dtype="int64"),
+                "user_id": carried["user_id"].to_numpy(),
+                "timestamp": carried["start"].to_numpy(dtype="datetime64[ns]"),
+                "is_start": True,
+            })
+            self._replace(carry.to_numpy(), pd.concat([carry_ev, ev], ignore_index=True))
+            return len(new)
+
+    # ---- views ----
+    def daily_hours(self, user_id=None, date_from=None, date_to=None):
+        """Per-guard, per-day rows: user_id, date, hours, shifts, flags."""
+        df = self.daily.reset_index()
+        if user_id:
+            df = df[_contains(df["user_id"], user_id)]
+        if date_from:
+            df = df[df["date"] >= pd.to_datetime(date_from).normalize()]
+        if date_to:
+            df = df[df["date"] < _until(date_to)]
+        return df.sort_values(["date", "user_id"], ascending=[False, True], kind="mergesort")
+
+    def shift_rows(self, user_id=None, date_from=None, date_to=None, flagged_only=False):
+        """Shifts touching the date range, newest first."""
+        df = self.shifts
+        if user_id:
+            df = df[_contains(df["user_id"], user_id)]
+        if flagged_only:
+            df = df[df["status"] != "closed"]
+        first = df["start"].fillna(df["end"])
+        last = df["end"].fillna(df["start"])
+        if date_from:
+            df = df[last >= pd.to_datetime(date_from)]
+            first = first[df.index]
+        if date_to:
+            df = df[first < _until(date_to)]
+        order = df["start"].fillna(df["end"])
+        return df.iloc[np.argsort(-order.to_numpy(dtype="datetime64[ns]").astype("int64"), kind="stable")]
+
+
+shift_summary = ShiftSummary()
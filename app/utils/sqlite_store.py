@@ -0,0 +1,203 @@
+import sqlite3
+import threading
+import pandas as pd
+from app.utils.storage import (
+    StorageBackend, USER_COLS, ATTEND_COLS, NUMERIC_COLS, TS_FORMAT, _as_str, typed_attendance,
+    text_attendance
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_key TEXT PRIMARY KEY,          -- casefolded user_id
+    user_id TEXT NOT NULL,
+    name TEXT, phone TEXT, email TEXT, password_hash TEXT, photo_path TEXT
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    record_id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,            -- TS_FORMAT, sorts lexicographically
+    latitude TEXT, longitude TEXT, address TEXT, pincode TEXT, plus_code TEXT,
+    photo_path TEXT, action TEXT, location_source TEXT, qr_payload TEXT, geofence TEXT,
+    face_score TEXT
+);
+"""
+# Columns added after the first release, for databases created before them
+ADDED_COLUMNS = {"geofence": "TEXT", "face_score": "TEXT"}
+INDEXES = """
+CREATE INDEX IF NOT EXISTS ix_attendance_user ON attendance (user_id);
+CREATE INDEX IF NOT EXISTS ix_attendance_ts ON attendance (timestamp);
+CREATE INDEX IF NOT EXISTS ix_attendance_action_ts ON attendance (action, timestamp);
+CREATE INDEX IF NOT EXISTS ix_attendance_geofence_ts ON attendance (geofence, timestamp);
+"""
+
+_ATTEND_SELECT = "SELECT " + ", ".join(ATTEND_COLS) + " FROM attendance"
+
+
+def _null(x):
+    x = _as_str(x)
+    return x if x != "" else None
+
+def _escape_like(s):
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _ts(value):
+    return pd.to_datetime(value).strftime(TS_FORMAT)
+
+
+class SqliteBackend(StorageBackend):
+    """
+    Users and attendance in one SQLite file. Attendance filters run as
+    indexed range queries; Excel is only produced on export.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def init(self):
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        have = {row[1] for row in conn.execute("PRAGMA table_info(attendance)")}
+        for col, decl in ADDED_COLUMNS.items():
+            if col not in have:
+                conn.execute(f"ALTER TABLE attendance ADD COLUMN {col} {decl}")
+        conn.executescript(INDEXES)
+        conn.commit()
+
+    def add_user(self, row):
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO users (user_key, " + ", ".join(USER_COLS) + ") "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [row["user_id"].casefold()] + [row[c] for c in USER_COLS],
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError("User already exists.")
+
+    def get_user(self, user_id):
+        key = _as_str(user_id).strip().casefold()
+        cur = self._conn().execute(
+            "SELECT " + ", ".join(USER_COLS) + " FROM users WHERE user_key = ?", (key,)
+        )
+        found = cur.fetchone()
+        if found is None:
+            return None
+        return {c: _as_str(v) for c, v in zip(USER_COLS, found)}
+
+    def insert_attendance(self, rows):
+        cols = [c for c in ATTEND_COLS if c != "record_id"]
+        sql = ("INSERT INTO attendance (" + ", ".join(cols) + ") VALUES ("
+               + ", ".join("?" for _ in cols) + ")")
+        conn = self._conn()
+        ids = []
+        with conn:
+            for r in rows:
+                cur = conn.execute(sql, [_null(r.get(c)) for c in cols])
+                ids.append(cur.lastrowid)
+        return ids
+
+    def update_attendance(self, updates):
+        conn = self._conn()
+        with conn:
+            for record_id, fields in updates.items():
+                cols = [c for c in fields if c in ATTEND_COLS and c != "record_id"]
+                if not cols:
+                    continue
+                conn.execute(
+                    "UPDATE attendance SET " + ", ".join(f"{c} = ?" for c in cols)
+                    + " WHERE record_id = ?",
+                    [_null(fields[c]) for c in cols] + [int(record_id)],
+                )
+
+    def insert_records(self, rows):
+        """Insert rows that already carry a record_id (used by the migrator); returns rows added."""
+        sql = ("INSERT OR IGNORE INTO attendance (" + ", ".join(ATTEND_COLS) + ") VALUES ("
+               + ", ".join("?" for _ in ATTEND_COLS) + ")")
+        conn = self._conn()
+        with conn:
+            cur = conn.executemany(sql, [[_null(r.get(c)) for c in ATTEND_COLS] for r in rows])
+        return cur.rowcount
+
+    def _frame(self, sql, params=()):
+        # rows arrive in the ORDER BY of the query; keep it
+        return typed_attendance(pd.read_sql_query(sql, self._conn(), params=params), sort=False)
+
+    def load_attendance(self):
+        return self._frame(_ATTEND_SELECT + " ORDER BY timestamp, record_id")
+
+    @staticmethod
+    def _where(user_id=None, date_from=None, date_to=None, action=None, after_id=None, geofence=None):
+        where, params = [], []
+        if after_id is not None:
+            where.append("record_id > ?")
+            params.append(int(after_id))
+        if user_id:
+            where.append("user_id LIKE ? ESCAPE '\\'")
+            params.append("%" + _escape_like(str(user_id)) + "%")
+        if date_from:
+            where.append("timestamp >= ?")
+            params.append(_ts(date_from))
+        if date_to:
+            where.append("timestamp <= ?")
+            params.append(_ts(date_to))
+        if action:
+            where.append("action = ?")
+            params.append(action)
+        if geofence:
+            where.append("geofence = ?")
+            params.append(geofence)
+        return (" WHERE " + " AND ".join(where) if where else ""), params
+
+    def query_attendance(self, user_id=None, date_from=None, date_to=None, action=None,
+                         offset=0, limit=None, sort_by=None, descending=False, after_id=None,
+                         geofence=None):
+        where, params = self._where(user_id, date_from, date_to, action, after_id, geofence)
+        sort_by = sort_by or "timestamp"
+        if sort_by not in ATTEND_COLS:
+            raise ValueError(f"Unknown sort column: {sort_by}")
+        order = "DESC" if descending else "ASC"
+        keys = ["timestamp", "record_id"]
+        if sort_by in NUMERIC_COLS:
+            keys.insert(0, f"CAST({sort_by} AS REAL)")  # stored as text
+        elif sort_by != "timestamp":
+            keys.insert(0, sort_by)
+        sql = f"{_ATTEND_SELECT}{where} ORDER BY " + ", ".join(f"{k} {order}" for k in keys)
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset)]
+        elif offset:
+            sql += " LIMIT -1 OFFSET ?"
+            params.append(int(offset))
+        return self._frame(sql, params)
+
+    def attendance_text(self, record_ids=None):
+        conn = self._conn()
+        if record_ids is None:
+            return text_attendance(pd.read_sql_query(_ATTEND_SELECT + " ORDER BY record_id", conn))
+        ids = [int(i) for i in record_ids]
+        parts = [pd.read_sql_query(f"{_ATTEND_SELECT} WHERE record_id IN ({', '.join('?' * len(chunk))})",
+                                   conn, params=chunk)
+                 for chunk in (ids[i:i + 500] for i in range(0, len(ids), 500))]
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=ATTEND_COLS)
+        return text_attendance(df, ids)
+
+    def count_attendance(self, user_id=None, date_from=None, date_to=None, action=None,
+                         geofence=None):
+        where, params = self._where(user_id, date_from, date_to, action, geofence=geofence)
+        return self._conn().execute("SELECT COUNT(*) FROM attendance" + where, params).fetchone()[0]
+
+    def last_record_id(self):
+        top = self._conn().execute("SELECT MAX(record_id) FROM attendance").fetchone()[0]
+        return top or 0
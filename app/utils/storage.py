@@ -1,85 +1,152 @@
 import os
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from app.utils.metrics import timed
 
 DATA_DIR = "data"
 PHOTO_DIR = os.path.join(DATA_DIR, "photos")
 QR_DIR = os.path.join(DATA_DIR, "qrcodes")
 USERS_XLSX = os.path.join(DATA_DIR, "users.xlsx")
-ATTEND_XLSX = os.path.join(DATA_DIR, "attendance.xlsx")
+ATTEND_XLSX = os.path.join(DATA_DIR, "attendance.xlsx")  # default export; pre-shard snapshot
+# Punches are appended here (one JSON object per line) and periodically
+# compacted into per-period workbooks under ATTEND_DIR (see partitions.py).
+ATTEND_JOURNAL = os.path.join(DATA_DIR, "attendance.jsonl")
+ATTEND_DIR = os.path.join(DATA_DIR, "attendance")
+ATTEND_MANIFEST = os.path.join(ATTEND_DIR, "manifest.json")
+PARTITION_BY = os.environ.get("GUARD_PARTITION", "month").strip().lower()  # year, month or day
+ATTEND_COMPACTING = ATTEND_JOURNAL + ".compacting"
+COMPACT_JOURNAL_BYTES = 256 * 1024  # journal size that triggers a background compaction
+RECORD_SEQ = os.path.join(DATA_DIR, "record_id.seq")  # last issued record_id
+SQLITE_DB = os.path.join(DATA_DIR, "guard.db")
+
+# "excel" (default) or "sqlite"; see app/utils/migrate.py to move existing data
+STORAGE_BACKEND = os.environ.get("GUARD_STORAGE", "excel").strip().lower()
 
 USER_COLS = ["user_id", "name", "phone", "email", "password_hash", "photo_path"]
 ATTEND_COLS = [
     "record_id","user_id","timestamp",
     "latitude","longitude","address","pincode","plus_code",
-    "photo_path","action","location_source","qr_payload"
+    "photo_path","action","location_source","qr_payload","geofence","face_score"
 ]
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+CATEGORY_COLS = ["user_id", "action", "location_source", "geofence"]
+NUMERIC_COLS = ["latitude", "longitude", "face_score"]  # stored as text, typed as float32
+
+
+class StorageBackend:
+    """
+    What the app needs from a store. Attendance comes back as the typed frame
+    built by typed_attendance(), whatever the backend; treat it as read-only,
+    since backends may hand out a cached frame.
+    """
+
+    def init(self):
+        pass
+
+    def add_user(self, row):
+        raise NotImplementedError
+
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    def insert_attendance(self, rows):
+        """Persist rows (dicts without record_id) in one write; return their new record_ids."""
+        raise NotImplementedError
+
+    def update_attendance(self, updates):
+        """Apply {record_id: {column: value}} to existing rows in one write."""
+        raise NotImplementedError
+
+    def load_attendance(self):
+        raise NotImplementedError
+
+    def query_attendance(self, user_id=None, date_from=None, date_to=None, action=None,
+                         offset=0, limit=None, sort_by=None, descending=False, after_id=None,
+                         geofence=None):
+        """
+        Filtered rows sorted by `sort_by` (default timestamp), sliced to
+        [offset, offset+limit). `after_id` keeps only record_id > after_id.
+        """
+        raise NotImplementedError
+
+    def count_attendance(self, user_id=None, date_from=None, date_to=None, action=None,
+                         geofence=None):
+        raise NotImplementedError
+
+    def last_record_id(self):
+        """Highest record_id stored so far (0 when empty)."""
+        raise NotImplementedError
 
+    def attendance_text(self, record_ids=None):
+        """
+        Rows exactly as stored (text_attendance() frame): those with
+        `record_ids`, in that order, or all of them by record_id. Exports and
+        migration read these, never the float32 typed frame.
+        """
+        raise NotImplementedError
+
+    def compact(self):
+        pass
+
+    def export_attendance(self, path):
+        from app.utils.export import export_attendance_stream
+        export_attendance_stream(path, backend=self)
+
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if STORAGE_BACKEND == "sqlite":
+            from app.utils.sqlite_store import SqliteBackend
+            _backend = SqliteBackend(SQLITE_DB)
+        elif STORAGE_BACKEND == "excel":
+            from app.utils.excel_store import ExcelBackend
+            _backend = ExcelBackend()
+        else:
+            raise ValueError(f"Unknown GUARD_STORAGE backend: {STORAGE_BACKEND}")
+    return _backend
+
+@timed("storage.init_storage")
 def init_storage():
     os.makedirs(DATA_DIR, exist_ok=True)
     os.makedirs(PHOTO_DIR, exist_ok=True)
     os.makedirs(QR_DIR, exist_ok=True)
-    if not os.path.exists(USERS_XLSX):
-        pd.DataFrame(columns=USER_COLS).to_excel(USERS_XLSX, index=False)
-    if not os.path.exists(ATTEND_XLSX):
-        pd.DataFrame(columns=ATTEND_COLS).to_excel(ATTEND_XLSX, index=False)
+    get_backend().init()
 
 def _as_str(x):
     return "" if x is None else str(x)
 
+def _clean(x):
+    return "" if pd.isna(x) else str(x).strip()
+
+@timed("storage.add_user")
 def add_user(user_id, name, phone, email, password_hash, photo_path):
     # Ensure strings to avoid Excel numeric coercion issues
-    user_id = _as_str(user_id).strip()
-    name = _as_str(name).strip()
-    phone = _as_str(phone).strip()
-    email = _as_str(email).strip()
-    password_hash = _as_str(password_hash).strip()
-    photo_path = _as_str(photo_path).strip()
-
-    df = pd.read_excel(USERS_XLSX, dtype=str)
-    if not df.empty:
-        df["user_id"] = df["user_id"].astype(str).str.strip()
-        # Case-insensitive match to avoid duplicates like "USER" vs "user"
-        if (df["user_id"].str.casefold() == user_id.casefold()).any():
-            raise ValueError("User already exists.")
-
     new_row = {
-        "user_id": user_id, "name": name, "phone": phone, "email": email,
-        "password_hash": password_hash, "photo_path": photo_path
+        "user_id": _as_str(user_id).strip(),
+        "name": _as_str(name).strip(),
+        "phone": _as_str(phone).strip(),
+        "email": _as_str(email).strip(),
+        "password_hash": _as_str(password_hash).strip(),
+        "photo_path": _as_str(photo_path).strip(),
     }
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_excel(USERS_XLSX, index=False)
+    get_backend().add_user(new_row)
 
+@timed("storage.get_user")
 def get_user(user_id):
     """Robust lookup: force both Excel and input to strings, trim, and casefold."""
-    key = _as_str(user_id).strip().casefold()
-    df = pd.read_excel(USERS_XLSX, dtype=str)
-    if df.empty:
-        return None
-    df["user_id"] = df["user_id"].astype(str).str.strip()
-    row = df[df["user_id"].str.casefold() == key]
-    return None if row.empty else row.iloc[0].to_dict()
+    return get_backend().get_user(user_id)
 
-def add_attendance(user_id, latitude, longitude, address, pincode, plus_code,
-                   photo_path, action, location_source, qr_payload=""):
-    df = pd.read_excel(ATTEND_XLSX, dtype=str)
-
-    # Generate record id (numeric increasing, but store as str for safety)
-    try:
-        if df.empty:
-            next_id = 1
-        else:
-            # previous values may be strings; coerce safely
-            nums = pd.to_numeric(df["record_id"], errors="coerce")
-            next_id = (nums.max() or 0) + 1
-    except Exception:
-        next_id = 1
-
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    new_row = {
-        "record_id": str(int(next_id)),
+def attendance_row(user_id, latitude="", longitude="", address="", pincode="", plus_code="",
+                   photo_path="", action="", location_source="", qr_payload="", timestamp=None,
+                   geofence="", face_score=""):
+    """A punch as stored (every field a string, no record_id yet)."""
+    return {
         "user_id": _as_str(user_id).strip(),
-        "timestamp": now,
+        "timestamp": timestamp or datetime.now().strftime(TS_FORMAT),
         "latitude": _as_str(latitude),
         "longitude": _as_str(longitude),
         "address": _as_str(address),
@@ -89,26 +156,173 @@ def add_attendance(user_id, latitude, longitude, address, pincode, plus_code,
         "action": _as_str(action),
         "location_source": _as_str(location_source),
         "qr_payload": _as_str(qr_payload),
+        "geofence": _as_str(geofence),
+        "face_score": _as_str(face_score),
     }
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_excel(ATTEND_XLSX, index=False)
 
+def _geofenced(rows):
+    # every punch is checked against its post on the way in (see geofence.py)
+    from app.utils.geofence import validate_rows
+    return validate_rows(rows)
+
+@timed("storage.add_attendance")
+def add_attendance(user_id, latitude, longitude, address, pincode, plus_code,
+                   photo_path, action, location_source, qr_payload="", timestamp=None, face_score=""):
+    new_row = attendance_row(user_id, latitude, longitude, address, pincode, plus_code,
+                             photo_path, action, location_source, qr_payload, timestamp,
+                             face_score=face_score)
+    return get_backend().insert_attendance(_geofenced([new_row]))[0]
+
+@timed("storage.insert_attendance")
+def insert_attendance(rows):
+    """Commit many attendance_row() dicts in one write; returns their record_ids in order."""
+    return get_backend().insert_attendance(_geofenced(rows))
+
+@timed("storage.update_attendance")
+def update_attendance(updates):
+    get_backend().update_attendance(updates)
+
+@timed("storage.load_attendance")
 def load_attendance():
-    return pd.read_excel(ATTEND_XLSX, dtype=str)
+    return get_backend().load_attendance()
 
-def query_attendance(user_id=None, date_from=None, date_to=None, action=None):
-    df = load_attendance()
+def typed_attendance(df, sort=True):
+    """
+    Compact, typed copy of a string attendance frame: Int64 record_id,
+    datetime64 timestamp, float32 lat/lon and categoricals for the low
+    cardinality columns. Rows are sorted by time and indexed by a
+    DatetimeIndex so date ranges are binary-searched (unparseable timestamps
+    sort last as NaT). float32 keeps ~7 significant digits, i.e. about a metre.
+    Pass sort=False to keep the incoming row order (e.g. an SQL ORDER BY).
+    """
+    out = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    for c in ATTEND_COLS:
+        col = df[c].reset_index(drop=True) if c in df else pd.Series(np.nan, index=out.index, dtype=object)
+        if c == "record_id":
+            col = pd.to_numeric(col, errors="coerce").astype("Int64")
+        elif c == "timestamp":
+            parsed = pd.to_datetime(col, format=TS_FORMAT, errors="coerce")
+            odd = parsed.isna() & col.notna()
+            if odd.any():
+                parsed[odd] = pd.to_datetime(col[odd], errors="coerce")
+            col = parsed
+        elif c in NUMERIC_COLS:
+            col = pd.to_numeric(col, errors="coerce").astype("float32")
+        elif c in CATEGORY_COLS:
+            col = col.astype(object).where(col.notna() & (col != "")).astype("category")
+        else:
+            col = col.astype(object).where(col.notna() & (col != ""))
+        out[c] = col
+    if sort:
+        out = out.sort_values(["timestamp", "record_id"], kind="mergesort", na_position="last")
+    out.index = pd.DatetimeIndex(out["timestamp"].values)
+    return out
 
-    if user_id:
-        df["user_id"] = df["user_id"].astype(str)
-        df = df[df["user_id"].str.contains(str(user_id), na=False, case=False)]
+def format_attendance(df):
+    """
+    Typed attendance frame back to plain strings ("" for missing) for display.
+    Coordinates come back at float32 precision; anything written to disk
+    uses attendance_text() instead.
+    """
+    out = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    for c in ATTEND_COLS:
+        col = df[c].reset_index(drop=True)
+        if c == "timestamp":
+            col = col.dt.strftime(TS_FORMAT)
+        elif c in NUMERIC_COLS:
+            # float32 -> shortest text that round-trips ("12.9", not 12.8999996...)
+            col = col.astype(str).where(col.notna())
+        col = col.astype(object).where(col.notna(), "")
+        out[c] = col.astype(str)
+    return out
 
-    if date_from:
-        df = df[pd.to_datetime(df["timestamp"]) >= pd.to_datetime(date_from)]
-    if date_to:
-        df = df[pd.to_datetime(df["timestamp"]) <= pd.to_datetime(date_to)]
+def text_attendance(df, record_ids=None):
+    """
+    Stored rows (strings or NaN/None) as ATTEND_COLS strings, "" for missing:
+    reordered to `record_ids` when given (unknown ids dropped), else by record_id.
+    """
+    df = df.reindex(columns=ATTEND_COLS)
+    key = pd.to_numeric(df["record_id"], errors="coerce")
+    df = df[~key.duplicated(keep="last") | key.isna()]
+    key = key[df.index]
+    if record_ids is None:
+        df = df.iloc[np.argsort(key.fillna(np.inf).to_numpy(), kind="stable")]
+    else:
+        df = df[key.notna()].set_index(key[key.notna()].astype("int64").to_numpy())
+        df = df.reindex([int(i) for i in record_ids]).dropna(subset=["record_id"])
+    out = df.astype(object).where(df.notna(), "").astype(str).reset_index(drop=True)
+    ids = pd.to_numeric(out["record_id"], errors="coerce")
+    out["record_id"] = ids.astype("Int64").astype(str).where(ids.notna(), out["record_id"])
+    return out
+
+def _time_slice(df, date_from, date_to):
+    n = int(df["timestamp"].notna().sum())  # NaT rows sit at the end
+    idx = df.index[:n]
+    lo = idx.searchsorted(pd.to_datetime(date_from), side="left") if date_from else 0
+    hi = idx.searchsorted(pd.to_datetime(date_to), side="right") if date_to else n
+    return df.iloc[lo:max(lo, hi)]
+
+def filter_attendance(df, user_id=None, date_from=None, date_to=None, action=None, geofence=None):
+    """In-memory version of the query_attendance filters over a typed_attendance() frame."""
+    if date_from or date_to:
+        df = _time_slice(df, date_from, date_to)
+
+    if user_id:
+        # match against the distinct ids, not every row
+        cats = df["user_id"].cat.categories
+        hits = cats[cats.astype(str).str.contains(str(user_id), case=False, regex=False)]
+        df = df[df["user_id"].isin(hits)]
 
     if action:
         df = df[df["action"] == action]
 
+    if geofence:
+        df = df[df["geofence"] == geofence]
+
     return df
+
+def sort_attendance(df, sort_by=None, descending=False):
+    """Order a typed frame by one column, ties broken by time; frames are already time-sorted."""
+    if sort_by in (None, "timestamp"):
+        return df.iloc[::-1] if descending else df
+    if sort_by not in ATTEND_COLS:
+        raise ValueError(f"Unknown sort column: {sort_by}")
+    if descending:
+        # reverse first so the stable sort keeps newest-first among ties
+        df = df.iloc[::-1]
+    return df.sort_values(sort_by, ascending=not descending, kind="mergesort", na_position="last")
+
+@timed("storage.query_attendance")
+def query_attendance(user_id=None, date_from=None, date_to=None, action=None,
+                     offset=0, limit=None, sort_by=None, descending=False, after_id=None,
+                     geofence=None):
+    """
+    Attendance matching the filters. With `limit`, only that window of the
+    sorted result is returned, so callers can page through large histories.
+    With `after_id`, only rows newer than that record_id (for live tailing).
+    """
+    return get_backend().query_attendance(
+        user_id=user_id, date_from=date_from, date_to=date_to, action=action,
+        offset=offset, limit=limit, sort_by=sort_by, descending=descending,
+        after_id=after_id, geofence=geofence
+    )
+
+@timed("storage.count_attendance")
+def count_attendance(user_id=None, date_from=None, date_to=None, action=None, geofence=None):
+    return get_backend().count_attendance(
+        user_id=user_id, date_from=date_from, date_to=date_to, action=action, geofence=geofence
+    )
+
+@timed("storage.last_record_id")
+def last_record_id():
+    return get_backend().last_record_id()
+
+@timed("storage.compact_attendance")
+def compact_attendance():
+    """Fold the punch journal into the attendance shards where Excel is the store (no-op for SQLite)."""
+    get_backend().compact()
+
+@timed("storage.export_attendance")
+def export_attendance(path=ATTEND_XLSX):
+    """Write the full attendance history to an Excel file."""
+    get_backend().export_attendance(path)
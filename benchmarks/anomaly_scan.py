@@ -0,0 +1,41 @@
+"""
+Time of a full anomaly scan (app/utils/anomalies.py) over synthetic
+histories, and of folding in one more day of punches incrementally.
+
+    python -m benchmarks.anomaly_scan [rows ...]
+"""
+import sys
+import time
+import numpy as np
+from app.utils.storage import typed_attendance
+from app.utils.anomalies import detect, _scan_frame
+from benchmarks.synthetic import make_attendance
+
+
+def run(n):
+    typed = typed_attendance(make_attendance(n))
+    t0 = time.perf_counter()
+    scan = _scan_frame(typed)
+    t1 = time.perf_counter()
+    flags, tail = detect(scan)
+    t2 = time.perf_counter()
+
+    # the newest day as an update, carrying each guard's tail from the rest
+    cut = scan["timestamp"].max() - np.timedelta64(1, "D")
+    old, new = scan[scan["timestamp"] <= cut], scan[scan["timestamp"] > cut]
+    _, carried = detect(old)
+    t3 = time.perf_counter()
+    inc, _ = detect(new.reset_index(drop=True), carried)
+    t4 = time.perf_counter()
+    expected = flags[flags["timestamp"] > cut]
+    assert len(inc) == len(expected), (len(inc), len(expected))
+
+    counts = ", ".join(f"{k}={v}" for k, v in flags["kind"].value_counts().items())
+    print(f"rows={n:>9,}  arrays={(t1 - t0) * 1000:7.0f} ms  scan={(t2 - t1) * 1000:7.0f} ms  "
+          f"update of {len(new):,} rows={(t4 - t3) * 1000:6.1f} ms  ({counts})")
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for n in sizes:
+        run(n)
@@ -0,0 +1,60 @@
+"""
+Memory and query latency of the typed attendance frame against the old
+all-string frame (load_attendance with dtype=str + pd.to_datetime per query).
+
+    python -m benchmarks.attendance_frame [rows ...]
+"""
+import sys
+import time
+import pandas as pd
+from app.utils.storage import typed_attendance, filter_attendance
+from benchmarks.synthetic import make_attendance
+
+
+def old_query(df, user_id=None, date_from=None, date_to=None, action=None):
+    # query_attendance as it was before the typed frame
+    if user_id:
+        df = df[df["user_id"].astype(str).str.contains(str(user_id), na=False, case=False)]
+    if date_from:
+        df = df[pd.to_datetime(df["timestamp"]) >= pd.to_datetime(date_from)]
+    if date_to:
+        df = df[pd.to_datetime(df["timestamp"]) <= pd.to_datetime(date_to)]
+    if action:
+        df = df[df["action"] == action]
+    return df
+
+
+def _best(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def run(n):
+    raw = make_attendance(n)
+    t0 = time.perf_counter()
+    typed = typed_attendance(raw)
+    build = time.perf_counter() - t0
+
+    day = pd.Timestamp.now().normalize() - pd.Timedelta(days=1)
+    q = dict(user_id="9800000", date_from=str(day), date_to=str(day + pd.Timedelta(hours=23, minutes=59)),
+             action="QR_START")
+    old_t, old_rows = _best(lambda: old_query(raw, **q))
+    new_t, new_rows = _best(lambda: filter_attendance(typed, **q))
+    assert len(old_rows) == len(new_rows), (len(old_rows), len(new_rows))
+
+    mb = 1024 * 1024
+    print(f"rows={n:>9,}  "
+          f"memory str={raw.memory_usage(deep=True).sum() / mb:8.1f} MB  typed={typed.memory_usage(deep=True).sum() / mb:8.1f} MB  "
+          f"query str={old_t * 1000:8.1f} ms  typed={new_t * 1000:7.2f} ms  "
+          f"(typing once: {build * 1000:.0f} ms, {len(new_rows)} hits)")
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for n in sizes:
+        run(n)
@@ -0,0 +1,98 @@
+"""
+Stress test for several kiosks writing to one data directory: spawns writer
+processes that punch (and register users) concurrently against a throwaway
+data/ folder, with a small journal threshold so compactions overlap the
+writes. Afterwards checks that every punch and user is stored exactly once
+with unique record_ids, and reports throughput.
+
+    python -m benchmarks.concurrent_writers [--backend excel|sqlite]
+        [--procs N] [--punches N] [--compact-bytes N]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing as mp
+
+
+def _writer(work, backend, proc, punches, compact_bytes, start):
+    os.chdir(work)
+    os.environ["GUARD_STORAGE"] = backend
+    from app.utils import storage
+    if backend == "excel":
+        from app.utils import excel_store
+        excel_store.COMPACT_JOURNAL_BYTES = compact_bytes
+    storage.init_storage()
+    start.wait()
+    t0 = time.time()
+    for i in range(punches):
+        storage.add_attendance(f"w{proc}", "12.971599", "77.594566", "", "", "", "",
+                               "QR_START", "ip", qr_payload=f"w{proc}-{i}")
+        if i % 50 == 0:
+            storage.add_user(f"w{proc}-u{i}", "", "", "", "", "")
+    return t0, time.time()
+
+
+def run(backend="excel", procs=8, punches=300, compact_bytes=16 * 1024):
+    work = tempfile.mkdtemp(prefix="guard-writers-")
+    ctx = mp.get_context("spawn")
+    try:
+        os.chdir(work)
+        os.environ["GUARD_STORAGE"] = backend
+        from app.utils import storage
+        storage.init_storage()
+
+        with ctx.Manager() as manager:
+            start = manager.Event()
+            with ctx.Pool(procs) as pool:
+                jobs = [pool.apply_async(_writer, (work, backend, p, punches, compact_bytes, start))
+                        for p in range(procs)]
+                time.sleep(1.0)  # let every writer import and init
+                start.set()
+                spans = [j.get() for j in jobs]
+        wall = max(e for _, e in spans) - min(s for s, _ in spans)
+
+        storage.compact_attendance()
+        df = storage.format_attendance(storage.load_attendance())
+        expected = {f"w{p}-{i}" for p in range(procs) for i in range(punches)}
+        payloads = df["qr_payload"].tolist()
+        users = [f"w{p}-u{i}" for p in range(procs) for i in range(0, punches, 50)]
+        missing_users = [u for u in users if storage.get_user(u) is None]
+
+        total = procs * punches
+        result = {
+            "backend": backend, "procs": procs, "punches": total,
+            "stored": len(df),
+            "lost": len(expected - set(payloads)),
+            "duplicated": len(payloads) - len(set(payloads)),
+            "duplicate_ids": int(df["record_id"].duplicated().sum()),
+            "users_lost": len(missing_users),
+            "wall_s": round(wall, 3),
+            "punches_per_s": round(total / wall, 1),
+            "slowest_writer_s": round(max(e - s for s, e in spans), 3),
+        }
+        result["ok"] = (result["lost"] == 0 and result["duplicated"] == 0
+                        and result["duplicate_ids"] == 0 and result["users_lost"] == 0
+                        and result["stored"] == total)
+        return result
+    finally:
+        os.chdir(os.path.dirname(work))
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def _arg(argv, name, default):
+    return argv[argv.index(name) + 1] if name in argv else default
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    res = run(
+        backend=_arg(argv, "--backend", "excel"),
+        procs=int(_arg(argv, "--procs", 8)),
+        punches=int(_arg(argv, "--punches", 300)),
+        compact_bytes=int(_arg(argv, "--compact-bytes", 16 * 1024)),
+    )
+    for k, v in res.items():
+        print(f"{k:>18}: {v}")
+    sys.exit(0 if res["ok"] else 1)
@@ -0,0 +1,108 @@
+"""
+Offline benchmark for the QR scanning engine (app/utils/qrscan.py) against the
+old per-frame cv2.QRCodeDetector.detectAndDecode on the full frame.
+
+Replays recorded frames from a directory (any .png/.jpg, sorted by name) or,
+by default, synthesises 1280x720 camera-like sequences from the PNGs in
+data/qrcodes: the code drifts into view, scaled and slightly blurred, over a
+noisy background. Reports frames/sec and time-to-decode per sequence.
+
+    python -m benchmarks.qr_scan [--frames DIR] [--seqs N] [--len N]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import cv2
+import numpy as np
+from app.utils.storage import QR_DIR
+from app.utils.qrscan import QrScanner
+
+W, H = 1280, 720
+
+
+def synthetic_sequences(n_seqs=6, seq_len=30, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = sorted(glob.glob(os.path.join(QR_DIR, "*.png")))
+    if not codes:
+        raise SystemExit(f"No QR PNGs in {QR_DIR}; run the app once or pass --frames")
+    seqs = []
+    for s in range(n_seqs):
+        code = cv2.imread(codes[s % len(codes)], cv2.IMREAD_GRAYSCALE)
+        size = int(rng.integers(160, 320))
+        code = cv2.resize(code, (size, size), interpolation=cv2.INTER_NEAREST)
+        bg = rng.integers(60, 200, size=(H, W), dtype=np.uint8)
+        bg = cv2.GaussianBlur(bg, (0, 0), 3)
+        x_end, y = int(rng.integers(100, W - size - 100)), int(rng.integers(50, H - size - 50))
+        frames = []
+        for i in range(seq_len):
+            # first third: code not in view yet; then it slides in and settles
+            f = bg.copy()
+            if i >= seq_len // 3:
+                x = max(0, x_end - max(0, seq_len // 2 - i) * 40)
+                f[y:y + size, x:x + size] = code
+            f = cv2.GaussianBlur(f, (3, 3), 0.8)
+            frames.append(cv2.cvtColor(f, cv2.COLOR_GRAY2BGR))
+        seqs.append(frames)
+    return seqs
+
+
+def recorded_sequence(path):
+    files = sorted(glob.glob(os.path.join(path, "*.png")) + glob.glob(os.path.join(path, "*.jpg")))
+    return [[cv2.imread(f) for f in files]]
+
+
+class Baseline:
+    """What camera.scan_qr_with_webcam used to do for every frame."""
+
+    def __init__(self):
+        self.detector = cv2.QRCodeDetector()
+
+    def scan(self, frame):
+        data, points, _ = self.detector.detectAndDecode(frame)
+        return (data or None), points
+
+
+def run(name, make_scanner, seqs):
+    frames = 0
+    busy = 0.0
+    ttd = []
+    for seq in seqs:
+        scanner = make_scanner()
+        elapsed = 0.0
+        decoded = None
+        for frame in seq:
+            t0 = time.perf_counter()
+            data, _ = scanner.scan(frame)
+            dt = time.perf_counter() - t0
+            frames += 1
+            busy += dt
+            elapsed += dt
+            if data:
+                decoded = elapsed
+                break
+        ttd.append(decoded)
+    ok = [t for t in ttd if t is not None]
+    return {
+        "scanner": name,
+        "frames": frames,
+        "fps": round(frames / busy, 1) if busy else None,
+        "decoded": f"{len(ok)}/{len(seqs)}",
+        "time_to_decode_ms_median": round(1000 * float(np.median(ok)), 1) if ok else None,
+        "time_to_decode_ms_max": round(1000 * max(ok), 1) if ok else None,
+    }
+
+
+def main(argv):
+    opts = dict(zip(argv[::2], argv[1::2]))
+    if "--frames" in opts:
+        seqs = recorded_sequence(opts["--frames"])
+    else:
+        seqs = synthetic_sequences(int(opts.get("--seqs", 6)), int(opts.get("--len", 30)))
+    results = [run("baseline_detectAndDecode", Baseline, seqs), run("qrscan_engine", QrScanner, seqs)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
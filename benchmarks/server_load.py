@@ -0,0 +1,131 @@
+"""
+Load test for the punch service (python -m app.server). Starts a private
+instance on a throwaway data directory (or targets --url), then has N client
+threads post punches over keep-alive connections for a fixed time, either
+one per request (POST /punch, group-committed server side) or --batch K per
+request (POST /punches). Reports punches/sec and request latency.
+
+    python -m benchmarks.server_load [--backend excel|sqlite] [--clients N]
+        [--seconds S] [--batch K] [--url http://host:port]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER = "9800000000"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(backend):
+    """A private server on a fresh data dir with one registered user; returns (proc, url, workdir)."""
+    work = tempfile.mkdtemp(prefix="guard-server-")
+    env = dict(os.environ, GUARD_STORAGE=backend,
+               PYTHONPATH=REPO + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    subprocess.run(
+        [sys.executable, "-c",
+         "from app.utils.storage import init_storage, add_user\n"
+         f"init_storage(); add_user('{USER}', 'Load Test', '', '', '', '')"],
+        cwd=work, env=env, check=True,
+    )
+    port = _free_port()
+    proc = subprocess.Popen([sys.executable, "-m", "app.server", "--port", str(port)],
+                            cwd=work, env=env, stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()  # "Guard punch service on ..."
+    return proc, f"http://127.0.0.1:{port}", work
+
+
+def _punch(i):
+    return {"user_id": USER, "action": "QR_START", "qr_payload": "QR_START",
+            "latitude": 12.9716 + (i % 100) * 1e-4, "longitude": 77.5946, "location_source": "load"}
+
+
+def client(url, seconds, batch, out):
+    u = urlsplit(url)
+    conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+    path = "/punch" if batch == 1 else "/punches"
+    n, lat, errors = 0, [], 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        body = _punch(n) if batch == 1 else {"punches": [_punch(n + k) for k in range(batch)]}
+        t0 = time.perf_counter()
+        try:
+            # bytes, so http.client sends headers and body in one segment
+            conn.request("POST", path, json.dumps(body).encode("utf-8"), {"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            ok = resp.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+        lat.append(time.perf_counter() - t0)
+        if ok:
+            n += batch
+        else:
+            errors += 1
+    conn.close()
+    out.append((n, lat, errors))
+
+
+def run(url, clients=8, seconds=10, batch=1):
+    out = []
+    threads = [threading.Thread(target=client, args=(url, seconds, batch, out)) for _ in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    punches = sum(n for n, _, _ in out)
+    lat = sorted(x for _, l, _ in out for x in l)
+    pct = lambda q: round(lat[min(len(lat) - 1, int(q * (len(lat) - 1)))] * 1000, 2) if lat else None
+    u = urlsplit(url)
+    conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+    conn.request("GET", "/health")
+    health = json.loads(conn.getresponse().read())
+    conn.close()
+    return {
+        "clients": clients, "batch": batch, "seconds": round(wall, 2),
+        "punches": punches, "punches_per_s": round(punches / wall, 1),
+        "requests": len(lat), "errors": sum(e for _, _, e in out),
+        "latency_p50_ms": pct(0.50), "latency_p95_ms": pct(0.95), "latency_max_ms": pct(1.0),
+        # server lifetime totals: single punches per group commit
+        "group_commits": health.get("batches"),
+        "punches_per_commit": round(health["punches"] / health["batches"], 1) if health.get("batches") else None,
+    }
+
+
+def _arg(argv, name, default):
+    return argv[argv.index(name) + 1] if name in argv else default
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    url = _arg(argv, "--url", None)
+    proc = work = None
+    if url is None:
+        proc, url, work = start_server(_arg(argv, "--backend", "excel"))
+    try:
+        res = run(url, int(_arg(argv, "--clients", 8)), float(_arg(argv, "--seconds", 10)),
+                  int(_arg(argv, "--batch", 1)))
+        for k, v in res.items():
+            print(f"{k:>16}: {v}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(work, ignore_errors=True)
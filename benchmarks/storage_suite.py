@@ -0,0 +1,240 @@
+"""
+Timed storage scenarios over synthetic data, per backend and data size:
+cold start, login (get_user), registration (add_user, new ids and
+duplicates), admin refresh_table (count + first page), filtered queries,
+streaming export, single punches (add_attendance) and a batched insert. Each (backend, size) case is seeded and then timed in two
+fresh interpreters inside a throwaway data directory, so the timed run
+starts cold and nothing leaks in from earlier cases. Results are JSON, to
+diff between releases.
+
+    python -m benchmarks.storage_suite [--backend excel|sqlite|both]
+        [--sizes 1000 10000 100000 1000000] [--repeat N] [--punches N] [--out FILE]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+PAGE_SIZE = 200  # as in app.main
+
+
+def _ms(samples):
+    a = np.asarray(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(a, 50)), 3),
+            "p95_ms": round(float(np.percentile(a, 95)), 3),
+            "max_ms": round(float(a.max()), 3)}
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def seed(rows, n_users):
+    """Write synthetic users and attendance straight into the selected backend's files."""
+    from app.utils.storage import STORAGE_BACKEND, USERS_XLSX, ATTEND_XLSX, get_backend, init_storage
+    from benchmarks.synthetic import make_users, make_attendance
+    users = make_users(n_users)
+    attendance = make_attendance(rows, n_users=n_users)
+    if STORAGE_BACKEND == "sqlite":
+        init_storage()
+        backend = get_backend()
+        for row in users.to_dict("records"):
+            backend.add_user(row)
+        backend.insert_records(attendance.to_dict("records"))
+    else:
+        os.makedirs(os.path.dirname(USERS_XLSX), exist_ok=True)
+        users.to_excel(USERS_XLSX, index=False)
+        attendance.to_excel(ATTEND_XLSX, index=False)
+        init_storage()
+
+
+def n_users_for(rows):
+    return max(100, rows // 100)
+
+
+def run_case(rows, repeat=5, punches=200):
+    """All scenarios for the backend in GUARD_STORAGE, on data seeded in the current directory."""
+    from app.utils.storage import (
+        STORAGE_BACKEND, init_storage, get_backend, get_user, add_user, add_attendance,
+        query_attendance, count_attendance, last_record_id,
+    )
+    from app.utils.export import export_attendance_stream
+    from benchmarks.synthetic import make_attendance
+
+    n_users = n_users_for(rows)
+    out = {"backend": STORAGE_BACKEND, "rows": rows, "users": n_users}
+    rng = np.random.default_rng(1)
+    ids = [f"98{i:08d}" for i in rng.integers(0, n_users, size=max(repeat, 50))]
+
+    # App startup, then the first login and first query pay for reading the store
+    t0 = time.perf_counter()
+    init_storage()
+    out["init_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    t0 = time.perf_counter()
+    get_user(ids[0])
+    out["first_login_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    t0 = time.perf_counter()
+    count_attendance()
+    out["first_query_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+
+    it = iter(ids)
+    out["login"] = _ms(_timed(lambda: get_user(next(it)), len(ids)))
+
+    # Registration: new ids are checked against the whole directory, then
+    # written; an existing id is rejected by the same check
+    new_ids = iter(f"97{i:08d}" for i in range(repeat))
+    def register(user_id):
+        add_user(user_id, "New guard", user_id, f"{user_id}@example.com", "0" * 64, "")
+    def register_duplicate(user_id):
+        try:
+            register(user_id)
+        except ValueError:
+            return
+        raise RuntimeError(f"duplicate user {user_id} was accepted")
+    dup = iter(ids)
+    out["register"] = {
+        "new": _ms(_timed(lambda: register(next(new_ids)), repeat)),
+        "duplicate": _ms(_timed(lambda: register_duplicate(next(dup)), repeat)),
+    }
+
+    def refresh_table(filters):
+        last_record_id()
+        count_attendance(**filters)
+        query_attendance(**filters, offset=0, limit=PAGE_SIZE, sort_by="timestamp", descending=True)
+
+    end = pd.Timestamp.now().normalize()
+    day = dict(date_from=str(end - pd.Timedelta(days=1)), date_to=str(end))
+    scenarios = {
+        "all": {},
+        "user": {"user_id": "9800000"},
+        "last_day": day,
+        "action": {"action": "QR_START"},
+        "user_last_day_action": dict(day, user_id="9800000", action="QR_START"),
+    }
+    out["refresh_table"] = {k: _ms(_timed(lambda f=f: refresh_table(f), repeat)) for k, f in scenarios.items()}
+    out["query"] = {k: _ms(_timed(lambda f=f: query_attendance(**f), repeat)) for k, f in scenarios.items()}
+    out["query"]["deep_page"] = _ms(_timed(
+        lambda: query_attendance(offset=max(0, rows - PAGE_SIZE), limit=PAGE_SIZE, sort_by="user_id"), repeat))
+
+    out["export"] = {}
+    for ext in (".csv", ".xlsx"):
+        path = "export" + ext
+        t0 = time.perf_counter()
+        n = export_attendance_stream(path)
+        dt = time.perf_counter() - t0
+        out["export"][ext] = {"seconds": round(dt, 3), "rows_per_s": round(n / dt, 1),
+                              "bytes": os.path.getsize(path)}
+        os.remove(path)
+
+    # Single punches, each committed on its own like the kiosk does
+    samples = []
+    for i in range(punches):
+        t0 = time.perf_counter()
+        add_attendance(ids[i % len(ids)], "12.971599", "77.594566", "Post 1, Bengaluru", "560001",
+                       "7J4VWHXX+XX", "", "QR_START", "ip", "QR_START")
+        samples.append(time.perf_counter() - t0)
+    out["punch"] = dict(_ms(samples), punches_per_s=round(punches / sum(samples), 1))
+
+    batch = make_attendance(1000, n_users=n_users, seed=2).drop(columns=["record_id"]).to_dict("records")
+    t0 = time.perf_counter()
+    get_backend().insert_attendance(batch)
+    dt = time.perf_counter() - t0
+    out["batch_insert"] = {"rows": len(batch), "seconds": round(dt, 3), "rows_per_s": round(len(batch) / dt, 1)}
+
+    # The admin view right after new punches landed
+    out["refresh_after_punches"] = _ms(_timed(lambda: refresh_table({}), repeat))
+    return out
+
+
+def _run_isolated(backend, rows, repeat, punches):
+    work = tempfile.mkdtemp(prefix=f"guard-bench-{backend}-")
+    env = dict(os.environ, GUARD_STORAGE=backend,
+               PYTHONPATH=REPO + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    def child(*args):
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.storage_suite", *args],
+            cwd=work, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError((proc.stderr.strip().splitlines() or ["failed"])[-1])
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    try:
+        seeded = child("--seed", str(rows))
+        result = child("--case", str(rows), "--repeat", str(repeat), "--punches", str(punches))
+        result["seed_s"] = seeded["seed_s"]
+        return result
+    except RuntimeError as e:
+        return {"backend": backend, "rows": rows, "error": str(e)}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def _arg(argv, name, default):
+    if name not in argv:
+        return default
+    i = argv.index(name) + 1
+    values = []
+    while i < len(argv) and not argv[i].startswith("--"):
+        values.append(argv[i])
+        i += 1
+    return values
+
+
+def main(argv):
+    repeat = int(_arg(argv, "--repeat", ["5"])[0])
+    punches = int(_arg(argv, "--punches", ["200"])[0])
+    if "--seed" in argv:
+        rows = int(_arg(argv, "--seed", [])[0])
+        t0 = time.perf_counter()
+        seed(rows, n_users_for(rows))
+        print(json.dumps({"seed_s": round(time.perf_counter() - t0, 3)}))
+        return
+    if "--case" in argv:
+        print(json.dumps(run_case(int(_arg(argv, "--case", [])[0]), repeat, punches)))
+        return
+
+    backend = _arg(argv, "--backend", ["both"])[0]
+    backends = ["excel", "sqlite"] if backend == "both" else [backend]
+    sizes = [int(s) for s in _arg(argv, "--sizes", DEFAULT_SIZES)]
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "pandas": pd.__version__,
+            "repeat": repeat,
+            "punches": punches,
+        },
+        "results": [],
+    }
+    for b in backends:
+        for n in sizes:
+            print(f"{b:>6} {n:>9,} rows ...", file=sys.stderr, flush=True)
+            report["results"].append(_run_isolated(b, n, repeat, punches))
+
+    text = json.dumps(report, indent=2)
+    out = _arg(argv, "--out", None)
+    if out:
+        with open(out[0], "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Wrote {out[0]}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
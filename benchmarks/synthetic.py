@@ -0,0 +1,58 @@
+"""
+Synthetic guard data in the storage schema (USER_COLS / ATTEND_COLS), with
+every cell a string exactly as the app writes it.
+"""
+import hashlib
+import numpy as np
+import pandas as pd
+from app.utils.storage import USER_COLS, ATTEND_COLS, TS_FORMAT
+
+ACTIONS = np.array(["LOGIN_PHOTO", "QR_START", "QR_END"])
+SOURCES = np.array(["ip", "manual"])
+
+
+def user_ids(n_users):
+    return np.array([f"98{i:08d}" for i in range(n_users)])
+
+
+def make_users(n_users, seed=0):
+    """Registered guards whose ids match make_attendance; user i's password is f"pass{i}"."""
+    rng = np.random.default_rng(seed)
+    ids = user_ids(n_users)
+    return pd.DataFrame({
+        "user_id": ids,
+        "name": ["Guard " + str(i) for i in range(n_users)],
+        "phone": ids,
+        "email": [f"guard{i}@example.com" for i in range(n_users)],
+        "password_hash": [hashlib.sha256(f"pass{i}".encode("utf-8")).hexdigest() for i in range(n_users)],
+        "photo_path": np.where(rng.random(n_users) < 0.5, "", "data/photos/registered.jpg"),
+    })[USER_COLS]
+
+
+def make_attendance(n, n_users=500, days=365, seed=0):
+    """n punches spread over `days` days ending now, ordered by time."""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp.now().floor("s")
+    offsets = np.sort(rng.integers(0, days * 86400, size=n))[::-1]
+    ts = (end - pd.to_timedelta(offsets, unit="s")).strftime(TS_FORMAT)
+    users = user_ids(n_users)
+    lat = 12.9 + rng.random(n) * 0.2
+    lon = 77.5 + rng.random(n) * 0.2
+    action = ACTIONS[rng.integers(0, len(ACTIONS), size=n)]
+    df = pd.DataFrame({
+        "record_id": np.arange(1, n + 1).astype(str),
+        "user_id": users[rng.integers(0, n_users, size=n)],
+        "timestamp": np.asarray(ts),
+        "latitude": np.char.mod("%.6f", lat),
+        "longitude": np.char.mod("%.6f", lon),
+        "address": "Post " + pd.Series(rng.integers(0, 300, size=n)).astype(str) + ", Bengaluru",
+        "pincode": "5600" + pd.Series(rng.integers(10, 99, size=n)).astype(str),
+        "plus_code": "7J4VWHXX+XX",
+        "photo_path": "",
+        "action": action,
+        "location_source": SOURCES[rng.integers(0, len(SOURCES), size=n)],
+        "qr_payload": np.where(action == "LOGIN_PHOTO", "", action),
+        "geofence": "",
+        "face_score": "",
+    })
+    return df[ATTEND_COLS]